@@ -0,0 +1,66 @@
+"""Time downloads of a published record from the mock Zenodo server used by the tests, with a
+single request per file and with parallel range requests.
+
+Run from the root of the repository with ``python -m benchmarks.download``. The mock server
+runs on the loopback interface, so this measures the overhead of splitting files into parts,
+writing them into preallocated files and verifying checksums. It does not show the gain from
+parallel connections over a link with high latency or per-connection rate limits.
+"""
+
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+
+from datalight import download
+from datalight.retry import RetryPolicy
+from datalight.zenodo import ZenodoClient
+from tests.mock_zenodo import MockZenodo
+
+
+def time_download(server: MockZenodo, record_id: int, workers: int, part_size: int,
+                  total_size: int, label: str):
+    with tempfile.TemporaryDirectory() as output_directory, \
+            ZenodoClient(None, pool_size=max(workers, 1), requests_per_minute=10 ** 9,
+                         retry_policy=RetryPolicy(max_retries=0)) as client:
+        start = time.perf_counter()
+        status = download.download_record(record_id, pathlib.Path(output_directory),
+                                          server.records_url, client, workers, part_size)
+        elapsed = time.perf_counter() - start
+    if status.code != 200:
+        raise RuntimeError(f"Download failed: {status.message}")
+    print(f"{label:<32} {elapsed:6.2f} s, {total_size / elapsed / 2 ** 20:7.1f} MiB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=int, default=256,
+                        help="The size of the large file in the record in MiB.")
+    parser.add_argument("--small-files", type=int, default=100,
+                        help="The number of 10 kB files in the record.")
+    parser.add_argument("--part-size-mb", type=int,
+                        default=download.DEFAULT_PART_SIZE // 2 ** 20,
+                        help="The size of the parts of the large file in MiB.")
+    args = parser.parse_args()
+
+    files = {"large.bin": os.urandom(args.size_mb * 2 ** 20)}
+    files.update((f"small{index}.bin", os.urandom(10000)) for index in range(args.small_files))
+    total_size = sum(len(data) for data in files.values())
+    part_size = args.part_size_mb * 2 ** 20
+
+    server = MockZenodo()
+    try:
+        record = server.add_deposition(files, state="done")
+        server.support_ranges = False
+        time_download(server, record.id, 1, part_size, total_size, "One request per file")
+        server.support_ranges = True
+        for workers in (1, 4, 8):
+            time_download(server, record.id, workers, part_size, total_size,
+                          f"Range requests, {workers} worker{'s' if workers > 1 else ''}")
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure the time from launching a Python process to the first Datalight window being shown.
+
+Run from the root of the repository with ``python -m benchmarks.gui_startup``. Each launch is
+timed with an empty datalight cache directory, when the UI descriptions have to be parsed, and
+with the cache filled by an earlier launch. Without a display the Qt offscreen platform is used.
+"""
+
+import argparse
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+
+def show_window(root_path: str):
+    """Open the GUI as :func:`datalight.main.open_gui` does, print the time once the window
+    has been shown and the event loop is running, then quit."""
+    from PyQt5 import QtCore, QtWidgets
+
+    from datalight.ui.main_form import DatalightUIWindow, connect_button_methods
+
+    app = QtWidgets.QApplication(sys.argv)
+    datalight_ui = DatalightUIWindow(root_path)
+    datalight_ui.ui_setup()
+    datalight_ui.main_window.show()
+    datalight_ui.set_window_position()
+    connect_button_methods(datalight_ui)
+
+    def report_shown():
+        print(time.time(), flush=True)
+        app.quit()
+
+    QtCore.QTimer.singleShot(0, report_shown)
+    app.exec_()
+
+
+def time_launch(root_path: pathlib.Path, cache_home: pathlib.Path) -> float:
+    """Launch the GUI in a new process and return the seconds until its window was shown."""
+    environment = dict(os.environ, XDG_CACHE_HOME=str(cache_home))
+    if not environment.get("DISPLAY") and not environment.get("WAYLAND_DISPLAY"):
+        environment.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.time()
+    result = subprocess.run([sys.executable, "-m", "benchmarks.gui_startup", "--show",
+                             str(root_path)], check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True, env=environment)
+    return float(result.stdout.split()[-1]) - start
+
+
+def report(label: str, times: List[float]):
+    print(f"{label:<14} median {statistics.median(times) * 1000:7.1f} ms, "
+          f"min {min(times) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="The number of launches to time with each cache state.")
+    parser.add_argument("--show", metavar="ROOT_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.show:
+        return show_window(args.show)
+
+    package_path = pathlib.Path(__file__).resolve().parents[1] / "datalight"
+    with tempfile.TemporaryDirectory() as temp_directory:
+        temp_directory = pathlib.Path(temp_directory)
+        # The GUI writes a config file to its root path, so use a copy of the root.
+        root_path = temp_directory / "root"
+        root_path.mkdir()
+        (root_path / "datalight").symlink_to(package_path, target_is_directory=True)
+
+        cold_times = []
+        warm_times = []
+        for index in range(args.repeat):
+            cache_home = temp_directory / f"cache{index}"
+            cold_times.append(time_launch(root_path, cache_home))
+            warm_times.append(time_launch(root_path, cache_home))
+        report("Empty cache", cold_times)
+        report("Filled cache", warm_times)
+
+
+if __name__ == "__main__":
+    main()
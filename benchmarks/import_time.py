@@ -0,0 +1,58 @@
+"""Measure the time taken to import datalight modules in a new Python process, using
+``python -X importtime``.
+
+Run from the root of the repository with ``python -m benchmarks.import_time``. With
+``--max-ms`` the script exits with an error if importing :mod:`datalight.api` takes longer than
+the given time, so it can be used as a regression check.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import List
+
+DEFAULT_MODULES = ["datalight.api", "datalight.zenodo", "datalight.main"]
+
+
+def get_import_time(module: str) -> float:
+    """Return the cumulative import time of `module` in milliseconds, measured in a new
+    process."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            check=True, stderr=subprocess.PIPE, universal_newlines=True)
+    # Each line is "import time: self [us] | cumulative | imported package".
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise ValueError(f"No import time reported for {module}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES,
+                        help="The modules to import.")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="The number of times to import each module.")
+    parser.add_argument("--max-ms", type=float,
+                        help="Fail if the median import time of datalight.api is longer.")
+    args = parser.parse_args()
+
+    medians = {}
+    for module in args.modules:
+        times: List[float] = [get_import_time(module) for _ in range(args.repeat)]
+        medians[module] = statistics.median(times)
+        print(f"{module:<20} median {medians[module]:7.1f} ms, min {min(times):7.1f} ms")
+
+    if args.max_ms is not None:
+        api_time = medians.get("datalight.api")
+        if api_time is None:
+            api_time = statistics.median(get_import_time("datalight.api")
+                                         for _ in range(args.repeat))
+        if api_time > args.max_ms:
+            sys.exit(f"Importing datalight.api took {api_time:.1f} ms, more than the limit of "
+                     f"{args.max_ms} ms.")
+
+
+if __name__ == "__main__":
+    main()
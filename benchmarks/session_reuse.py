@@ -0,0 +1,85 @@
+"""Compare the latency of Zenodo API requests sent over new connections with requests sent
+through the pooled session of :class:`datalight.zenodo.ZenodoClient`, against the mock Zenodo
+server used by the tests.
+
+Run from the root of the repository with ``python -m benchmarks.session_reuse``. The mock server
+uses plain HTTP on the loopback interface so the saving measured here is only the TCP set up.
+Against Zenodo each new connection also needs a TLS handshake over the internet, so the saving
+is much larger.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+import requests
+
+from datalight import zenodo
+from datalight.retry import RetryPolicy
+from tests.mock_zenodo import MockZenodo
+
+METADATA = {"title": "Benchmark record", "upload_type": "dataset",
+            "description": "A benchmark record",
+            "creators": [{"name": "Doe, Jane", "affiliation": "Somewhere"}],
+            "access_right": "open", "license": "CC-BY-4.0", "publication_date": "2020-01-01"}
+
+
+def time_requests(send, count: int) -> List[float]:
+    """Return the time in seconds taken by each of `count` calls to `send`."""
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = send()
+        response.raise_for_status()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(label: str, times: List[float]):
+    print(f"{label:<28} median {statistics.median(times) * 1000:7.3f} ms, "
+          f"mean {statistics.mean(times) * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500,
+                        help="The number of requests to time for each method.")
+    parser.add_argument("--files", type=int, default=200,
+                        help="The number of small files in the timed deposit.")
+    args = parser.parse_args()
+
+    server = MockZenodo()
+    url = server.deposition_url
+    try:
+        # Before: each request opens a new connection, as a bare requests.get does.
+        report("New connection per request",
+               time_requests(lambda: requests.get(url, params={"access_token": "token"}),
+                             args.requests))
+        # After: requests reuse the kept-alive connections of the client's session.
+        with zenodo.ZenodoClient("token", requests_per_minute=10 ** 9) as client:
+            report("Pooled session", time_requests(lambda: client.request("GET", url),
+                                                   args.requests))
+
+        with tempfile.TemporaryDirectory() as folder:
+            paths = []
+            for index in range(args.files):
+                paths.append(os.path.join(folder, f"file{index}.bin"))
+                with open(paths[-1], "wb") as output_file:
+                    output_file.write(os.urandom(1000))
+            server.requests.clear()
+            with zenodo.ZenodoClient("token", requests_per_minute=10 ** 9,
+                                     retry_policy=RetryPolicy(max_retries=0)) as client:
+                start = time.perf_counter()
+                status = zenodo.deposit_record(paths, METADATA, url, client, True, None, 4)
+                elapsed = time.perf_counter() - start
+            print(f"Deposit of {args.files} files with the pooled session: {elapsed:.2f} s, "
+                  f"{len(server.requests)} requests, status {status.code}")
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
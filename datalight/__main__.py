@@ -0,0 +1,6 @@
+"""Allow the datalight command line interface to be run with ``python -m datalight``."""
+import sys
+
+from datalight.cli import main
+
+sys.exit(main())
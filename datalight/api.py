@@ -0,0 +1,128 @@
+"""The headless API for datalight. This module can be used in scripts and pipelines to upload
+and download records without importing the GUI or PyQt5."""
+import pathlib
+import threading
+from typing import List, Union
+
+from datalight import download, zenodo, common
+from datalight.common import UploadStatus
+from datalight.progress import ProgressCallback
+from datalight.upload_source import PackingPolicy
+
+
+def upload_record(file_paths: List[str], repository_metadata: Union[dict, str],
+                  config_path: Union[pathlib.Path, str],
+                  experimental_metadata: Union[dict, None] = None, publish: bool = False,
+                  sandbox: bool = True, repository: str = "Zenodo", 
+                  deposition_ID: int = None, upload_workers: int = 1,
+                  resumable: bool = False, archive_compression: str = None,
+                  packing_policy: PackingPolicy = None,
+                  max_bytes_per_second: float = None,
+                  progress_callback: ProgressCallback = None,
+                  cancel_event: threading.Event = None,
+                  use_upload_cache: bool = True) -> UploadStatus:
+    """Upload a new record to a data repository."""
+    if repository == "Zenodo":
+        return zenodo.upload_record(file_paths, repository_metadata, config_path,
+                                    experimental_metadata, publish, sandbox, deposition_ID,
+                                    upload_workers, resumable, archive_compression,
+                                    packing_policy, max_bytes_per_second, progress_callback,
+                                    cancel_event, use_upload_cache)
+    else:
+        raise TypeError(f"Unknown repository type: '{repository}'.")
+
+
+def upload_new_version(file_paths: List[str], record_ID: int,
+                       config_path: Union[pathlib.Path, str],
+                       repository_metadata: Union[dict, str, None] = None,
+                       experimental_metadata: Union[dict, None] = None, publish: bool = True,
+                       sandbox: bool = True, repository: str = "Zenodo",
+                       upload_workers: int = 1, resumable: bool = False,
+                       archive_compression: str = None,
+                       packing_policy: PackingPolicy = None,
+                       max_bytes_per_second: float = None,
+                       progress_callback: ProgressCallback = None,
+                       cancel_event: threading.Event = None,
+                       use_upload_cache: bool = True) -> UploadStatus:
+    """Publish a new version of an existing record. Only files which were added or changed
+    since the previous version are uploaded and files which are no longer in `file_paths` are
+    removed from the new version."""
+    if repository == "Zenodo":
+        return zenodo.upload_new_version(file_paths, record_ID, config_path, sandbox,
+                                         repository_metadata, experimental_metadata, publish,
+                                         upload_workers, resumable, archive_compression,
+                                         packing_policy, max_bytes_per_second,
+                                         progress_callback, cancel_event, use_upload_cache)
+    else:
+        raise TypeError(f"Unknown repository type: '{repository}'.")
+
+
+def download_record(record_id: int, output_directory: Union[pathlib.Path, str],
+                    config_path: Union[pathlib.Path, str, None] = None, sandbox: bool = True,
+                    repository: str = "Zenodo", download_workers: int = 4,
+                    max_bytes_per_second: float = None,
+                    progress_callback: ProgressCallback = None,
+                    cancel_event: threading.Event = None) -> UploadStatus:
+    """Download the files of a published record from a data repository into a directory.
+    Interrupted downloads are resumed by calling this function again with the same arguments.
+    :param record_id: The ID of the record to download.
+    :param output_directory: The directory to download the files into.
+    :param config_path: The path to the Datalight config file containing API keys. If this is
+      None, the record is downloaded without authentication, which works for public records.
+    :param sandbox: Whether to download from the Zenodo sandbox or the real Zenodo.
+    :param repository: The data repository to download from.
+    :param download_workers: The maximum number of parts of files to download at the same time.
+    :param max_bytes_per_second: If provided, the maximum total rate at which files are
+      downloaded.
+    :param progress_callback: If provided, a function which is passed an
+      :class:`datalight.progress.UploadProgress` as the files are downloaded.
+    :param cancel_event: If provided, setting this event from another thread stops the
+      download. Partial downloads are kept so they can be resumed.
+    """
+    if repository == "Zenodo":
+        token = None
+        if config_path is not None:
+            credentials_location = pathlib.Path(config_path).resolve()
+            token = common.get_authentication_token(credentials_location, sandbox)
+        records_url = download.get_records_url(sandbox)
+        with zenodo.ZenodoClient(token, pool_size=max(download_workers, zenodo.DEFAULT_POOL_SIZE),
+                                 max_bytes_per_second=max_bytes_per_second,
+                                 cancel_event=cancel_event) as client:
+            return download.download_record(record_id, output_directory, records_url, client,
+                                            download_workers,
+                                            progress_callback=progress_callback,
+                                            cancel_event=cancel_event)
+    else:
+        raise TypeError(f"Unknown repository type: '{repository}'.")
+
+
+def get_status(config_path: Union[pathlib.Path, str],
+               repository: str = "Zenodo", **kwargs) -> bool:
+    r"""Check whether the selected data repository is set up correctly to do an upload.
+    Return True if it is and False if not.
+    :param config_path: The path to the Datalight config file containing API keys.
+    :param repository: The data repository that will be used.
+    :param kwargs:
+        See below
+
+    :Keyword Arguments:
+        * *sandbox* (``bool``) --
+          If Zenodo is selected as the repository. Whether to use the Zenodo sandbox or live
+          Zenodo.
+    """
+    if repository == "Zenodo":
+        if "sandbox" in kwargs:
+            sandbox = kwargs["sandbox"]
+        else:
+            sandbox = True
+        credentials_location = pathlib.Path(config_path).resolve()
+        token = common.get_authentication_token(credentials_location, sandbox)
+        deposition_url = zenodo.get_deposition_url(sandbox)
+        with zenodo.ZenodoClient(token) as client:
+            status = zenodo.try_connection(deposition_url, client)
+        if status.code in zenodo.STATUS_SUCCESS:
+            return True
+        else:
+            return False
+    else:
+        raise TypeError(f"Unknown repository type: '{repository}'.")
@@ -0,0 +1,210 @@
+"""This module generates archives of many files on the fly so that they can be streamed straight
+into an upload without first being written to disk."""
+
+import abc
+import os
+import pathlib
+import tarfile
+import zlib
+from typing import Iterator, List, Union
+
+from datalight.common import DatalightException
+
+# The size of the chunks that files are read in.
+CHUNK_SIZE = 2 ** 20
+# Compression types that can be applied to archives, mapped to the archive file name suffix.
+COMPRESSION_SUFFIXES = {None: ".tar", "gzip": ".tar.gz", "zstd": ".tar.zst"}
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+# Files larger than this need an extended header to store their size.
+_MAX_USTAR_SIZE = 8 ** 11
+
+
+class ArchiveMember:
+    """A file to include in an archive.
+    :ivar path: The path of the file on disk.
+    :ivar arcname: The path of the file within the archive.
+    :ivar size: The size of the file in bytes.
+    :ivar mtime: The modification time of the file in whole seconds.
+    :ivar mode: The permission bits of the file.
+    """
+    def __init__(self, path: pathlib.Path, arcname: str, stat: os.stat_result):
+        self.path = path
+        self.arcname = arcname
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.mode = stat.st_mode & 0o777
+
+    def get_header(self) -> bytes:
+        """Return the tar header describing this file."""
+        tar_info = tarfile.TarInfo(self.arcname)
+        tar_info.size = self.size
+        tar_info.mtime = self.mtime
+        tar_info.mode = self.mode
+        return tar_info.tobuf(format=tarfile.PAX_FORMAT)
+
+    def get_header_size(self) -> int:
+        """Return the size in bytes of the header of this file. Headers of short ASCII names
+        fit in a single block so the header only needs generating for other names."""
+        name_bytes = self.arcname.encode("utf-8")
+        # The name is ASCII if encoding it did not add any bytes.
+        if (len(name_bytes) == len(self.arcname) and len(name_bytes) <= 100
+                and self.size < _MAX_USTAR_SIZE):
+            return BLOCK_SIZE
+        return len(self.get_header())
+
+    def get_archived_size(self) -> int:
+        """Return the number of bytes the file and its header take up in the archive."""
+        return self.get_header_size() + _padded_size(self.size)
+
+
+def _padded_size(size: int) -> int:
+    """Return `size` rounded up to a whole number of tar blocks."""
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def list_folder(folder_path: Union[pathlib.Path, str]) -> List[ArchiveMember]:
+    """Recursively list the files in a folder, in a stable order. The archive names of the files
+    start with the name of the folder."""
+    folder_path = pathlib.Path(folder_path)
+    members = []
+    for root, directories, file_names in os.walk(folder_path):
+        directories.sort()
+        for file_name in sorted(file_names):
+            path = pathlib.Path(root) / file_name
+            arcname = path.relative_to(folder_path.parent).as_posix()
+            members.append(ArchiveMember(path, arcname, path.stat()))
+    return members
+
+
+class _GeneratedReader(abc.ABC):
+    """A read-only file-like object whose contents are produced in chunks by the generator
+    returned by `_generate_chunks`. Seeking to the start restarts the generator."""
+    def __init__(self):
+        self._chunks = self._generate_chunks()
+        self._chunk = b""
+        self._offset = 0
+
+    @abc.abstractmethod
+    def _generate_chunks(self) -> Iterator[bytes]:
+        """Yield the contents of the stream in chunks."""
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to `size` bytes, or all remaining bytes if `size` is negative. Returns b""
+        at the end of the stream."""
+        parts = []
+        while size < 0 or size > 0:
+            if self._offset >= len(self._chunk):
+                # Generators may yield empty chunks, for example while a compressor is
+                # buffering, so only None marks the end of the stream.
+                self._chunk = next(self._chunks, None)
+                self._offset = 0
+                if self._chunk is None:
+                    self._chunk = b""
+                    break
+            end = len(self._chunk) if size < 0 else self._offset + size
+            part = self._chunk[self._offset:end]
+            self._offset += len(part)
+            if size > 0:
+                size -= len(part)
+            parts.append(part)
+        return b"".join(parts)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        """Return to the start of the stream. Only seeking to the start is supported."""
+        if offset != 0 or whence != 0:
+            raise ValueError(f"{type(self).__name__} can only seek to the start of the stream.")
+        self._chunks.close()
+        self._chunks = self._generate_chunks()
+        self._chunk = b""
+        self._offset = 0
+        return 0
+
+    def close(self):
+        self._chunks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TarStream(_GeneratedReader):
+    """A read-only file-like object which produces an uncompressed tar archive of a list of
+    files as it is read. Only one chunk of one file is held in memory at a time.
+
+    Because the size of every file is known in advance, the exact size of the archive is known
+    before it is generated, so it can be uploaded with a Content-Length.
+    """
+    def __init__(self, members: List[ArchiveMember]):
+        self.members = members
+        self.length = sum(member.get_archived_size() for member in members) + 2 * BLOCK_SIZE
+        super().__init__()
+
+    def _generate_chunks(self) -> Iterator[bytes]:
+        for member in self.members:
+            yield member.get_header()
+            remaining = member.size
+            with open(member.path, 'rb') as input_file:
+                while remaining:
+                    chunk = input_file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise DatalightException(f"File {member.path} changed size while it "
+                                                 f"was being archived.")
+                    remaining -= len(chunk)
+                    yield chunk
+            yield bytes(_padded_size(member.size) - member.size)
+        # The end of a tar archive is marked by two empty blocks.
+        yield bytes(2 * BLOCK_SIZE)
+
+    def get_member_offsets(self) -> List[int]:
+        """Return the offset in bytes of the data of each member from the start of the archive.
+        This allows members to be read from the archive without unpacking it."""
+        offsets = []
+        position = 0
+        for member in self.members:
+            position += member.get_header_size()
+            offsets.append(position)
+            position += _padded_size(member.size)
+        return offsets
+
+    def __len__(self) -> int:
+        return self.length
+
+
+class CompressedReader(_GeneratedReader):
+    """A read-only file-like object which compresses another stream as it is read. The size of
+    the compressed data is not known until it has all been read."""
+    def __init__(self, raw, compression: str):
+        """
+        :param raw: The stream to compress. It must support seeking to the start.
+        :param compression: The type of compression, "gzip" or "zstd". zstd requires the
+          zstandard package.
+        """
+        if compression not in COMPRESSION_SUFFIXES or compression is None:
+            raise DatalightException(f"Unknown compression type: '{compression}'.")
+        self._raw = raw
+        self.compression = compression
+        super().__init__()
+
+    def _new_compressor(self):
+        if self.compression == "gzip":
+            # wbits of 31 gives a gzip header and trailer.
+            return zlib.compressobj(wbits=31)
+        try:
+            import zstandard
+        except ImportError:
+            raise DatalightException("zstd compression requires the zstandard package.")
+        return zstandard.ZstdCompressor().compressobj()
+
+    def _generate_chunks(self) -> Iterator[bytes]:
+        compressor = self._new_compressor()
+        self._raw.seek(0)
+        for chunk in iter(lambda: self._raw.read(CHUNK_SIZE), b""):
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+    def close(self):
+        super().close()
+        self._raw.close()
@@ -0,0 +1,163 @@
+"""This module uploads many records at once from a manifest file."""
+
+import concurrent.futures
+import csv
+import glob
+import json
+import pathlib
+import time
+from typing import List, Union
+
+from datalight import common, zenodo
+from datalight.common import logger, UploadStatus, DatalightException
+from datalight.folder_scan import get_path_size
+from datalight.upload_source import PackingPolicy
+
+
+class BulkRecord:
+    """One record to upload, as described by a line of a manifest.
+    :ivar file_patterns: Glob patterns matching the files in the record.
+    :ivar metadata_path: The path of the YAML file containing the record metadata.
+    :ivar deposition_id: If given, an existing deposition to amend.
+    :ivar publish: Whether to publish the record after uploading it.
+    """
+    def __init__(self, file_patterns: List[str], metadata_path: str, deposition_id: int = None,
+                 publish: bool = False):
+        self.file_patterns = file_patterns
+        self.metadata_path = metadata_path
+        self.deposition_id = deposition_id
+        self.publish = publish
+
+    def get_files(self) -> List[str]:
+        """Return the paths of all the files matched by the record's glob patterns."""
+        files = []
+        for pattern in self.file_patterns:
+            files.extend(sorted(glob.glob(pattern, recursive=True)))
+        return files
+
+
+def read_manifest(manifest_path: Union[pathlib.Path, str]) -> List[BulkRecord]:
+    """Read a manifest describing records to upload. The manifest can be a CSV, YAML or JSON lines
+    file. Each record has the keys:
+
+    * ``files`` -- A glob pattern or list of glob patterns matching the files to upload. In a
+      CSV manifest, separate multiple patterns with ";".
+    * ``metadata`` -- The path of a YAML file with the Zenodo metadata of the record.
+    * ``deposition_id`` -- Optional. An existing deposition to amend.
+    * ``publish`` -- Optional. Whether to publish the record after upload.
+
+    Relative paths are relative to the directory containing the manifest.
+    """
+    manifest_path = pathlib.Path(manifest_path)
+    suffix = manifest_path.suffix.lower()
+    with open(manifest_path, encoding='utf8', newline='') as input_file:
+        if suffix == ".csv":
+            entries = list(csv.DictReader(input_file))
+        elif suffix in [".yaml", ".yml"]:
+            entries = common.read_yaml(manifest_path)
+        elif suffix in [".jsonl", ".ndjson"]:
+            entries = [json.loads(line) for line in input_file if line.strip()]
+        else:
+            raise DatalightException(f"Unknown manifest type: '{manifest_path.suffix}'. "
+                                     f"Manifest must be a CSV, YAML or JSON lines file.")
+
+    base_path = manifest_path.parent
+    records = []
+    for entry in entries:
+        file_patterns = entry["files"]
+        if isinstance(file_patterns, str):
+            file_patterns = [pattern.strip() for pattern in file_patterns.split(";")]
+        deposition_id = entry.get("deposition_id")
+        records.append(BulkRecord([str(base_path / pattern) for pattern in file_patterns],
+                                  str(base_path / entry["metadata"]),
+                                  int(deposition_id) if deposition_id else None,
+                                  _to_bool(entry.get("publish", False))))
+    return records
+
+
+def _to_bool(value: Union[str, bool]) -> bool:
+    """Manifest values read from CSV files are strings so convert them to bool."""
+    if isinstance(value, str):
+        return value.strip().lower() in ["true", "yes", "1"]
+    return bool(value)
+
+
+def upload_records(records: List[BulkRecord], config_path: Union[pathlib.Path, str],
+                   sandbox: bool = True, max_records: int = 4,
+                   upload_workers: int = 1,
+                   packing_policy: PackingPolicy = None,
+                   max_bytes_per_second: float = None) -> List[dict]:
+    """Upload many records to Zenodo at the same time. All uploads share one connection pool,
+    rate limiter and bandwidth limit.
+    :param records: The records to upload.
+    :param config_path: Path to the file containing zenodo API tokens.
+    :param sandbox: Whether to put the records on Zenodo sandbox or the real Zenodo.
+    :param max_records: The maximum number of records to upload at the same time.
+    :param upload_workers: The maximum number of files to upload at the same time within each
+      record.
+    :param packing_policy: If provided, small files in each record are packed into archives
+      according to this policy.
+    :param max_bytes_per_second: If provided, the maximum total rate at which files are
+      uploaded across all records.
+    :returns: A result for each record, in the same order as `records`.
+    """
+    credentials_location = pathlib.Path(config_path).resolve()
+    token = common.get_authentication_token(credentials_location, sandbox)
+    depositions_url = zenodo.get_deposition_url(sandbox)
+
+    pool_size = max(max_records * upload_workers, zenodo.DEFAULT_POOL_SIZE)
+    with zenodo.ZenodoClient(token, pool_size=pool_size,
+                             max_bytes_per_second=max_bytes_per_second) as client:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(max_records, 1)) as executor:
+            results = executor.map(lambda record: _upload_bulk_record(record, depositions_url,
+                                                                      client, upload_workers,
+                                                                      packing_policy),
+                                   records)
+            return list(results)
+
+
+def _upload_bulk_record(record: BulkRecord, depositions_url: str, client: zenodo.ZenodoClient,
+                        upload_workers: int, packing_policy: PackingPolicy = None) -> dict:
+    """Upload a single record and return a description of the result. Any exception is caught
+    and recorded so that one bad record does not stop the others."""
+    start_time = time.time()
+    files = []
+    try:
+        files = record.get_files()
+        if not files:
+            raise DatalightException(f"No files match {record.file_patterns}.")
+        metadata = zenodo.load_yaml(record.metadata_path)
+        status = zenodo.deposit_record(files, metadata, depositions_url, client, record.publish,
+                                       record.deposition_id, upload_workers,
+                                       packing_policy=packing_policy)
+    except Exception as e:
+        logger.error(f"Upload of record {record.metadata_path} failed: {e}")
+        status = UploadStatus(500, f"{type(e).__name__}: {e}")
+
+    return {"metadata": record.metadata_path,
+            "files": len(files),
+            "bytes": sum(get_path_size(path) for path in files),
+            "code": status.code,
+            "success": status.code in zenodo.STATUS_SUCCESS,
+            "message": status.message,
+            "error_field": status.error_field,
+            "error_message": status.error_message,
+            "deposition_id": status.deposition_id,
+            "seconds": round(time.time() - start_time, 3)}
+
+
+def write_report(results: List[dict], elapsed_seconds: float,
+                 report_path: Union[pathlib.Path, str]):
+    """Write the results of a bulk upload to a JSON file along with a summary of the upload
+    throughput."""
+    succeeded = sum(1 for result in results if result["success"])
+    summary = {"records": len(results),
+               "succeeded": succeeded,
+               "failed": len(results) - succeeded,
+               "elapsed_seconds": round(elapsed_seconds, 3),
+               "records_per_hour": round(len(results) / elapsed_seconds * 3600, 1)
+               if elapsed_seconds else None}
+    with open(report_path, 'w', encoding='utf8') as output_file:
+        json.dump({"summary": summary, "results": results}, output_file, indent=2)
+    logger.info(f"Bulk upload of {len(results)} records finished: {succeeded} succeeded. "
+                f"Report written to {report_path}")
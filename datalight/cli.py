@@ -0,0 +1,146 @@
+"""The command line interface for datalight. Run ``datalight --help`` for usage."""
+
+import argparse
+import sys
+import time
+from typing import List
+
+from datalight import api, bulk, zenodo
+from datalight.common import logger
+from datalight.upload_source import PackingPolicy
+
+
+def main(argv: List[str] = None) -> int:
+    """Parse the command line arguments and run the chosen command.
+    :returns: The exit code of the command.
+    """
+    parser = argparse.ArgumentParser(prog="datalight",
+                                     description="Upload research data to a data repository "
+                                                 "and download published records.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    bulk_parser = subparsers.add_parser("bulk", help="Upload many records from a manifest file.")
+    bulk_parser.add_argument("manifest", help="A CSV, YAML or JSON lines file listing the "
+                                              "files and metadata of each record.")
+    bulk_parser.add_argument("--config", default="datalight.ini",
+                             help="The datalight config file containing API tokens.")
+    bulk_parser.add_argument("--live", action="store_true",
+                             help="Upload to the real Zenodo rather than the Zenodo sandbox.")
+    bulk_parser.add_argument("--concurrency", type=int, default=4,
+                             help="The maximum number of records to upload at the same time.")
+    bulk_parser.add_argument("--upload-workers", type=int, default=1,
+                             help="The maximum number of files to upload at the same time in "
+                                  "each record.")
+    bulk_parser.add_argument("--pack-threshold", type=int, default=None, metavar="BYTES",
+                             help="Pack files smaller than this many bytes into tar archives "
+                                  "with an index rather than uploading them one by one.")
+    bulk_parser.add_argument("--max-bandwidth", type=float, default=None, metavar="MB_PER_SECOND",
+                             help="Limit the total upload rate to this many megabytes per "
+                                  "second.")
+    bulk_parser.add_argument("--report", default="datalight_report.json",
+                             help="The path to write the JSON results report to.")
+    bulk_parser.set_defaults(function=_run_bulk)
+
+    download_parser = subparsers.add_parser("download",
+                                            help="Download the files of a published record.")
+    download_parser.add_argument("record_id", type=int, help="The ID of the record to download.")
+    download_parser.add_argument("--output", default=".",
+                                 help="The directory to download the files into.")
+    download_parser.add_argument("--config", default=None,
+                                 help="The datalight config file containing API tokens. Only "
+                                      "needed for records which are not public.")
+    download_parser.add_argument("--live", action="store_true",
+                                 help="Download from the real Zenodo rather than the Zenodo "
+                                      "sandbox.")
+    download_parser.add_argument("--workers", type=int, default=4,
+                                 help="The maximum number of parts of files to download at the "
+                                      "same time.")
+    download_parser.add_argument("--max-bandwidth", type=float, default=None,
+                                 metavar="MB_PER_SECOND",
+                                 help="Limit the total download rate to this many megabytes per "
+                                      "second.")
+    download_parser.set_defaults(function=_run_download)
+
+    version_parser = subparsers.add_parser("new-version",
+                                           help="Publish a new version of a record, uploading "
+                                                "only the files which have changed.")
+    version_parser.add_argument("record_id", type=int,
+                                help="The ID of any published version of the record.")
+    version_parser.add_argument("files", nargs="+",
+                                help="The files and folders making up the new version.")
+    version_parser.add_argument("--metadata", default=None,
+                                help="A YAML file of metadata for the new version. If not given, "
+                                     "the metadata of the previous version is kept.")
+    version_parser.add_argument("--config", default="datalight.ini",
+                                help="The datalight config file containing API tokens.")
+    version_parser.add_argument("--live", action="store_true",
+                                help="Upload to the real Zenodo rather than the Zenodo sandbox.")
+    version_parser.add_argument("--draft", action="store_true",
+                                help="Leave the new version unpublished.")
+    version_parser.add_argument("--upload-workers", type=int, default=1,
+                                help="The maximum number of files to upload at the same time.")
+    version_parser.add_argument("--max-bandwidth", type=float, default=None,
+                                metavar="MB_PER_SECOND",
+                                help="Limit the total upload rate to this many megabytes per "
+                                     "second.")
+    version_parser.set_defaults(function=_run_new_version)
+
+    args = parser.parse_args(argv)
+    return args.function(args)
+
+
+def _run_bulk(args: argparse.Namespace) -> int:
+    records = bulk.read_manifest(args.manifest)
+    packing_policy = None
+    if args.pack_threshold:
+        packing_policy = PackingPolicy(args.pack_threshold)
+    max_bytes_per_second = None
+    if args.max_bandwidth:
+        max_bytes_per_second = args.max_bandwidth * 1e6
+    start_time = time.time()
+    results = bulk.upload_records(records, args.config, not args.live, args.concurrency,
+                                  args.upload_workers, packing_policy, max_bytes_per_second)
+    bulk.write_report(results, time.time() - start_time, args.report)
+    if all(result["success"] for result in results):
+        return 0
+    return 1
+
+
+def _run_download(args: argparse.Namespace) -> int:
+    max_bytes_per_second = None
+    if args.max_bandwidth:
+        max_bytes_per_second = args.max_bandwidth * 1e6
+    try:
+        status = api.download_record(args.record_id, args.output, args.config, not args.live,
+                                     download_workers=args.workers,
+                                     max_bytes_per_second=max_bytes_per_second)
+    except (zenodo.ZenodoException, OSError) as e:
+        # Connection errors from requests are OSErrors.
+        logger.error(f"Download of record {args.record_id} failed with "
+                     f"{type(e).__name__}: {e}")
+        return 1
+    if status.code in zenodo.STATUS_SUCCESS:
+        logger.info(status.message)
+        return 0
+    logger.error(status.message)
+    return 1
+
+
+def _run_new_version(args: argparse.Namespace) -> int:
+    max_bytes_per_second = None
+    if args.max_bandwidth:
+        max_bytes_per_second = args.max_bandwidth * 1e6
+    status = api.upload_new_version(args.files, args.record_id, args.config, args.metadata,
+                                    publish=not args.draft, sandbox=not args.live,
+                                    upload_workers=args.upload_workers,
+                                    max_bytes_per_second=max_bytes_per_second)
+    if status.code in zenodo.STATUS_SUCCESS:
+        logger.info(f"{status.message}, deposition ID: {status.deposition_id}")
+        return 0
+    logger.error(status.message)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
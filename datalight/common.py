@@ -1,13 +1,12 @@
 """This module is common core functions for datalight."""
 
 import sys
+import hashlib
 import logging
 import pathlib
 import configparser
 from typing import Union
-from os import getcwd
-
-import yaml
+from os import getcwd, environ
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger('datalight')
@@ -17,6 +16,10 @@ class DatalightException(Exception):
     """Class for exception"""
 
 
+class UploadCancelled(DatalightException):
+    """Raised when an upload is cancelled by the user while data is being sent."""
+
+
 def get_authentication_token(credentials_location: pathlib.Path, sandbox: bool) -> Union[str, None]:
     """A method to read the Zenodo authentication token from a local file. This file is not
     committed to git and so will not appear online.
@@ -41,16 +44,46 @@ def get_authentication_token(credentials_location: pathlib.Path, sandbox: bool)
         raise KeyError("Key not found in datalight.config.")
 
 
+def get_cache_dir() -> pathlib.Path:
+    """Return the directory datalight keeps cached data in. This follows the XDG base directory
+    convention, defaulting to ~/.cache/datalight."""
+    cache_home = environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")
+    return pathlib.Path(cache_home) / "datalight"
+
+
+def get_md5(file_path: Union[pathlib.Path, str], chunk_size: int = 2 ** 20) -> str:
+    """Return the MD5 checksum of a file as a hex string. The file is read in chunks of
+    `chunk_size` bytes so that large files do not have to fit in memory."""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def get_yaml_loader():
+    """Return the YAML loader to read files with. This is the loader implemented in C by LibYAML
+    if PyYAML was built with it, which is much faster than the pure Python loader."""
+    import yaml
+
+    return getattr(yaml, "CFullLoader", yaml.FullLoader)
+
+
 def read_yaml(file_path: Union[pathlib.Path, str]) -> dict:
     """Read a YAML file and return its contents."""
+    import yaml
+
     with open(file_path, encoding='utf8') as input_file:
-        return yaml.load(input_file, Loader=yaml.FullLoader)
+        return yaml.load(input_file, Loader=get_yaml_loader())
 
 
 class UploadStatus:
     """The status of the upload as it goes through the upload process."""
-    def __init__(self, code: int, message: str, error_field: str = None, error_message: str = None):
+    def __init__(self, code: int, message: str, error_field: str = None, error_message: str = None,
+                 deposition_id: int = None):
         self.code = code
         self.message = message
         self.error_field = error_field
-        self.error_message = error_message
\ No newline at end of file
+        self.error_message = error_message
+        # The repository ID of the deposition, once one has been created.
+        self.deposition_id = deposition_id
\ No newline at end of file
@@ -0,0 +1,455 @@
+"""This module downloads the files of published Zenodo records.
+
+Files are split into parts which are downloaded in parallel with HTTP range requests and
+written straight into place in a preallocated file. The parts which have been downloaded are
+recorded next to the partial file so that an interrupted download can be resumed. Each file is
+checked against the MD5 checksum listed by Zenodo before it is given its final name.
+"""
+
+import concurrent.futures
+import json
+import os
+import pathlib
+import threading
+from typing import BinaryIO, List, Tuple, Union
+
+from datalight import common, progress, zenodo
+from datalight.common import logger, UploadCancelled, UploadStatus
+from datalight.progress import ProgressCallback
+from datalight.zenodo import (STATUS_CANCELLED, STATUS_CHECKSUM_MISMATCH, STATUS_SUCCESS,
+                              ZenodoClient)
+
+# The size of the parts files are split into. Each part is fetched with one range request.
+DEFAULT_PART_SIZE = 16 * 2 ** 20
+# The size of the chunks the response to each request is read and written in.
+CHUNK_SIZE = 2 ** 20
+# Partial downloads are named after the file with this suffix added.
+PARTIAL_SUFFIX = ".part"
+# The parts of a partial download which are complete are recorded in a file with this suffix.
+STATE_SUFFIX = ".part.json"
+
+# Status code of a successful range request.
+STATUS_PARTIAL_CONTENT = 206
+
+
+class RemoteFile:
+    """A file in a published record.
+    :ivar name: The name of the file in the record.
+    :ivar url: The URL the contents of the file are downloaded from.
+    :ivar size: The size of the file in bytes.
+    :ivar checksum: The MD5 checksum of the file listed by Zenodo, or None if it is not listed.
+    """
+    def __init__(self, name: str, url: str, size: int, checksum: Union[str, None]):
+        self.name = name
+        self.url = url
+        self.size = size
+        self.checksum = checksum
+
+
+def get_records_url(sandbox: bool) -> str:
+    """Get the Zenodo API URL for reading published records."""
+    return zenodo.get_deposition_url(sandbox).replace("deposit/depositions", "records")
+
+
+def get_record_files(records_url: str, record_id: int,
+                     client: ZenodoClient) -> Tuple[UploadStatus, List[RemoteFile]]:
+    """Get the list of files in a published record."""
+    response = client.request("GET", f"{records_url}/{record_id}")
+    status = zenodo.check_request_response(response)
+    if status.code not in STATUS_SUCCESS:
+        return status, []
+
+    remote_files = []
+    for file_details in response.json().get("files", []):
+        # Zenodo has listed files with two sets of field names.
+        links = file_details.get("links", {})
+        checksum = file_details.get("checksum")
+        remote_files.append(RemoteFile(
+            file_details.get("key", file_details.get("filename")),
+            links.get("self", links.get("download")),
+            file_details.get("size", file_details.get("filesize")),
+            zenodo.strip_checksum_algorithm(checksum) if checksum else None))
+    return status, remote_files
+
+
+def download_record(record_id: int, output_directory: Union[pathlib.Path, str],
+                    records_url: str, client: ZenodoClient, download_workers: int = 4,
+                    part_size: int = DEFAULT_PART_SIZE,
+                    progress_callback: ProgressCallback = None,
+                    cancel_event: threading.Event = None) -> UploadStatus:
+    """Download all of the files in a published record into a directory.
+
+    Files which are already in the directory with the listed checksum are skipped. Partial
+    downloads left by an earlier call which failed or was cancelled are resumed.
+    :param record_id: The ID of the record to download.
+    :param output_directory: The directory to download the files into. It is created if it
+      does not exist.
+    :param records_url: The URL of the Zenodo records API.
+    :param client: The connection to Zenodo.
+    :param download_workers: The maximum number of parts to download at the same time.
+    :param part_size: The size in bytes of the parts files are split into.
+    :param progress_callback: If provided, a function which is passed an
+      :class:`datalight.progress.UploadProgress` as the files are downloaded.
+    :param cancel_event: If provided, setting this event from another thread stops the
+      download. Partial downloads are kept so they can be resumed.
+    :returns: An UploadStatus object indicating whether there was an error or if the download
+        was successful.
+    :raises ZenodoException: If the name of a file in the record would place it outside of
+      `output_directory`.
+    """
+    status, remote_files = get_record_files(records_url, record_id, client)
+    if status.code not in STATUS_SUCCESS:
+        return status
+
+    output_directory = pathlib.Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    downloads = []
+    for remote_file in remote_files:
+        download = _FileDownload(remote_file, output_directory, part_size)
+        if download.is_complete():
+            logger.info(f'Skipping file "{remote_file.name}", it has already been downloaded.')
+        else:
+            downloads.append(download)
+
+    status = _download_files(downloads, client, download_workers, progress_callback,
+                             cancel_event)
+    if status.code not in STATUS_SUCCESS:
+        return status
+    return UploadStatus(200, f"Downloaded record {record_id} to {output_directory}.")
+
+
+class _FileDownload:
+    """The download of one file, split into parts.
+
+    :ivar remote_file: The file being downloaded.
+    :ivar path: The final path of the file.
+    :ivar partial_path: The path the file is written to until it is complete.
+    :ivar parts: The (start, end) byte offsets of each part, with the end included.
+    :ivar done_parts: The indices of the parts which have been downloaded.
+    :ivar single_part: Whether the file is downloaded with a single request because the server
+      does not support range requests.
+    :ivar finished: Whether :meth:`finish` has been called. The partial file no longer exists
+      once it has.
+    """
+    def __init__(self, remote_file: RemoteFile, output_directory: pathlib.Path, part_size: int):
+        self.remote_file = remote_file
+        self.path = output_directory / remote_file.name
+        # File names come from the server so make sure they cannot write outside the directory.
+        if output_directory.resolve() not in self.path.resolve().parents:
+            raise zenodo.ZenodoException(f'Refusing to download file "{remote_file.name}" '
+                                         f'outside of {output_directory}.')
+        self.partial_path = self.path.with_name(self.path.name + PARTIAL_SUFFIX)
+        self.state_path = self.path.with_name(self.path.name + STATE_SUFFIX)
+        self.part_size = part_size
+        self.parts = [(start, min(start + part_size, remote_file.size) - 1)
+                      for start in range(0, remote_file.size, part_size)]
+        self.done_parts = set()
+        self.single_part = False
+        self.finished = False
+        # Guards done_parts and the number of parts being written to the partial file.
+        self._condition = threading.Condition()
+        self._writers = 0
+
+    def is_complete(self) -> bool:
+        """Return True if the file has already been downloaded and matches the listed checksum.
+        """
+        if not self.path.exists() or self.path.stat().st_size != self.remote_file.size:
+            return False
+        return (self.remote_file.checksum is None
+                or common.get_md5(self.path) == self.remote_file.checksum)
+
+    def prepare(self):
+        """Create the partial file, or load which parts are done if the download is being
+        resumed. A download which was being made with a single request carries on that way,
+        without asking the server about range requests again."""
+        state = self._read_state()
+        if (self.partial_path.exists() and state.get("size") == self.remote_file.size
+                and state.get("checksum") == self.remote_file.checksum
+                and state.get("part_size") == self.part_size):
+            if state.get("single_part"):
+                self.single_part = True
+                self.parts = [(0, self.remote_file.size - 1)]
+            self.done_parts = set(state["done_parts"])
+            logger.info(f'Resuming download of "{self.remote_file.name}", '
+                        f'{len(self.done_parts)} of {len(self.parts)} parts are done.')
+            return
+        with open(self.partial_path, "wb") as partial_file:
+            _preallocate(partial_file, self.remote_file.size)
+        self.done_parts = set()
+        self._write_state()
+
+    def use_single_part(self):
+        """Download the file with a single request, for servers which do not support range
+        requests. `part_size` is kept so that the saved state still matches when the download
+        is resumed. As the server cannot send part of the file, a resumed single request
+        download starts again from the beginning of the file."""
+        self.single_part = True
+        self.parts = [(0, self.remote_file.size - 1)]
+        self.done_parts = set()
+        self._write_state()
+
+    def remaining_parts(self) -> List[int]:
+        """Return the indices of the parts still to download."""
+        return [index for index in range(len(self.parts)) if index not in self.done_parts]
+
+    def parts_done(self, indices: List[int]) -> bool:
+        """Record that parts have been downloaded.
+        :returns: True if these were the last parts to be done, so the file is complete.
+        """
+        with self._condition:
+            was_complete = len(self.done_parts) == len(self.parts)
+            if was_complete:
+                # The whole file was received by another request.
+                return False
+            self.done_parts.update(indices)
+            self._write_state()
+            return len(self.done_parts) == len(self.parts)
+
+    def is_part_done(self, index: int) -> bool:
+        """Return True if the part has been downloaded, possibly as part of the whole file."""
+        with self._condition:
+            return index in self.done_parts
+
+    def open_partial(self) -> Union[BinaryIO, None]:
+        """Open the partial file to write a part into it. Returns None if every part has already
+        been downloaded. The file must be closed with :meth:`close_partial`."""
+        with self._condition:
+            if self.finished or len(self.done_parts) == len(self.parts):
+                return None
+            self._writers += 1
+        try:
+            return open(self.partial_path, "r+b")
+        except OSError:
+            self.close_partial(None)
+            raise
+
+    def close_partial(self, partial_file: Union[BinaryIO, None]):
+        """Close a file returned by :meth:`open_partial`."""
+        if partial_file is not None:
+            partial_file.close()
+        with self._condition:
+            self._writers -= 1
+            self._condition.notify_all()
+
+    def finish(self) -> UploadStatus:
+        """Check the checksum of the downloaded file and move it to its final path. If the
+        checksum does not match, the partial download is deleted so it is not resumed.
+        Waits for parts still being written, which can happen if the server sent the whole
+        file in response to a range request."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._writers == 0)
+            self.finished = True
+        if self.remote_file.checksum is not None:
+            local_checksum = common.get_md5(self.partial_path)
+            if local_checksum != self.remote_file.checksum:
+                message = f'Checksum mismatch for downloaded file "{self.remote_file.name}". ' \
+                          f'The listed MD5 is {self.remote_file.checksum} but the downloaded ' \
+                          f'data has MD5 {local_checksum}.'
+                logger.error(message)
+                self.partial_path.unlink()
+                self.state_path.unlink()
+                return UploadStatus(STATUS_CHECKSUM_MISMATCH, message, self.remote_file.name,
+                                    message)
+        os.replace(self.partial_path, self.path)
+        self.state_path.unlink()
+        logger.info(f'Downloaded file "{self.remote_file.name}" to {self.path}.')
+        return UploadStatus(200, f'Downloaded "{self.remote_file.name}".')
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self.state_path, encoding="utf8") as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self):
+        state = {"size": self.remote_file.size, "checksum": self.remote_file.checksum,
+                 "part_size": self.part_size, "single_part": self.single_part,
+                 "done_parts": sorted(self.done_parts)}
+        temp_path = self.state_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf8") as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self.state_path)
+
+
+def _preallocate(output_file, size: int):
+    """Reserve `size` bytes of disk space for a file so that the parts can be written into
+    place without the file being extended and fragmented as they arrive."""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(output_file.fileno(), 0, size)
+            return
+        except OSError:
+            # Some file systems do not support fallocate.
+            pass
+    output_file.truncate(size)
+
+
+def _download_files(downloads: List[_FileDownload], client: ZenodoClient,
+                    download_workers: int = 4, progress_callback: ProgressCallback = None,
+                    cancel_event: threading.Event = None) -> UploadStatus:
+    """Download the parts of files with up to `download_workers` parts being fetched at once.
+    The parts of the largest files are started first. If any part fails, the parts still to be
+    downloaded are cancelled and the status of the failed part is returned."""
+    # Parts stop when this is set, either by the caller or when another part fails.
+    stop_event = threading.Event()
+    if cancel_event is not None and cancel_event.is_set():
+        stop_event.set()
+    downloads = sorted(downloads, key=lambda download: download.remote_file.size, reverse=True)
+    tracker = progress.ProgressTracker([download.remote_file for download in downloads],
+                                       download_workers, client.max_bytes_per_second,
+                                       progress_callback)
+
+    for download in downloads:
+        download.prepare()
+        tracker.add_bytes(download.remote_file.name,
+                          sum(download.parts[index][1] - download.parts[index][0] + 1
+                              for index in download.done_parts))
+
+    # Files are only split into parts if the server supports range requests. A download which
+    # is being resumed was split before, so the server does not need to be asked again.
+    to_probe = [download for download in downloads
+                if len(download.parts) > 1 and not download.done_parts]
+    with concurrent.futures.ThreadPoolExecutor(max(download_workers, 1)) as executor:
+        for download, supported in zip(to_probe, executor.map(
+                lambda download: _supports_ranges(download.remote_file, client), to_probe)):
+            if not supported:
+                logger.info(f'The server does not support range requests for '
+                            f'"{download.remote_file.name}", it will be downloaded whole.')
+                download.use_single_part()
+
+    def download_part(download: _FileDownload, index: int) -> UploadStatus:
+        if cancel_event is not None and cancel_event.is_set():
+            stop_event.set()
+        if stop_event.is_set():
+            return UploadStatus(STATUS_CANCELLED, "The download was cancelled.")
+        name = download.remote_file.name
+        # The part may have been received with the whole file by another request.
+        if download.is_part_done(index):
+            return UploadStatus(200, f'Part {index} of "{name}" is already downloaded.')
+        tracker.set_state(name, progress.FILE_UPLOADING)
+        try:
+            status, indices = _download_part(download, index, client, tracker, stop_event)
+            if status.code in STATUS_SUCCESS and download.parts_done(indices):
+                status = download.finish()
+                tracker.set_state(name, progress.FILE_UPLOADED if status.code in STATUS_SUCCESS
+                                  else progress.FILE_FAILED)
+        except UploadCancelled:
+            tracker.set_state(name, progress.FILE_CANCELLED)
+            return UploadStatus(STATUS_CANCELLED, "The download was cancelled.")
+        except Exception as e:
+            # Errors such as a connection failing after every retry, or a partial file which
+            # cannot be written, fail the download so the other parts are stopped.
+            message = f'Download of "{name}" failed with {type(e).__name__}: {e}'
+            logger.error(message)
+            stop_event.set()
+            tracker.set_state(name, progress.FILE_FAILED)
+            return UploadStatus(500, message, name, str(e))
+        if status.code not in STATUS_SUCCESS:
+            stop_event.set()
+            tracker.set_state(name, progress.FILE_FAILED)
+        return status
+
+    # Zero length files have no parts to download.
+    statuses = [download.finish() for download in downloads if not download.parts]
+
+    tracker.start()
+    with concurrent.futures.ThreadPoolExecutor(max(download_workers, 1)) as executor:
+        futures = [executor.submit(download_part, download, index)
+                   for download in downloads for index in download.remaining_parts()]
+        # Watch for the caller cancelling the download while parts are in progress.
+        while cancel_event is not None and not all(future.done() for future in futures):
+            if cancel_event.wait(0.1):
+                stop_event.set()
+                break
+        statuses.extend(future.result() for future in futures)
+
+    for status in statuses:
+        if status.code not in STATUS_SUCCESS and status.code != STATUS_CANCELLED:
+            return status
+    if stop_event.is_set():
+        return UploadStatus(STATUS_CANCELLED, "The download was cancelled.")
+    return UploadStatus(200, "All files downloaded successfully.")
+
+
+def _supports_ranges(remote_file: RemoteFile, client: ZenodoClient) -> bool:
+    """Return True if the server answers a range request for `remote_file` with just the range.
+    If the request fails, True is returned and the failure is reported when the parts are
+    downloaded."""
+    import requests
+
+    try:
+        response = client.request("GET", remote_file.url, headers={"Range": "bytes=0-0"},
+                                  stream=True)
+    except requests.exceptions.RequestException:
+        return True
+    try:
+        return response.status_code != 200
+    finally:
+        response.close()
+
+
+def _download_part(download: _FileDownload, index: int, client: ZenodoClient,
+                   tracker: progress.ProgressTracker,
+                   stop_event: threading.Event) -> Tuple[UploadStatus, List[int]]:
+    """Download one part of a file and write it into place in the partial file. A part is
+    requested again if the connection fails while it is being received.
+    :returns: The status of the download and the indices of the parts received. This is every
+      part of the file if the server does not support range requests.
+    :raises UploadCancelled: If `stop_event` is set while the part is being received or while
+      waiting to request it again.
+    """
+    import requests
+
+    name = download.remote_file.name
+    start, end = download.parts[index]
+    headers = {"Range": f"bytes={start}-{end}"}
+    attempt = 0
+    while True:
+        response = client.request("GET", download.remote_file.url, headers=headers, stream=True)
+        received = 0
+        try:
+            if response.status_code == 200:
+                # The server ignored the range and is sending the whole file, which is written
+                # from the start of the file.
+                offset = 0
+            elif response.status_code == STATUS_PARTIAL_CONTENT:
+                offset = start
+            else:
+                message = f'Download of "{name}" failed with status {response.status_code}.'
+                logger.error(message)
+                return UploadStatus(response.status_code, message, name, response.text), []
+
+            partial_file = download.open_partial()
+            if partial_file is None:
+                # Another request has received the whole file.
+                return UploadStatus(200, f'Downloaded "{name}".'), []
+            try:
+                partial_file.seek(offset)
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if stop_event.is_set():
+                        raise UploadCancelled("The download was cancelled.")
+                    if client.bandwidth_limiter:
+                        client.bandwidth_limiter.acquire(len(chunk))
+                    partial_file.write(chunk)
+                    received += len(chunk)
+                    tracker.add_bytes(name, len(chunk))
+            finally:
+                download.close_partial(partial_file)
+            if response.status_code == 200:
+                return (UploadStatus(200, f'Downloaded "{name}".'),
+                        list(range(len(download.parts))))
+            return UploadStatus(200, f'Downloaded bytes {start}-{end} of "{name}".'), [index]
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError) as error:
+            tracker.add_bytes(name, -received)
+            if not client.retry_policy.should_retry(attempt, None):
+                raise
+            delay = client.retry_policy.get_delay(attempt)
+            logger.warning(f'Download of "{name}" failed with "{error}". '
+                           f'Retrying in {delay:.1f} seconds.')
+        finally:
+            response.close()
+        if stop_event.wait(delay):
+            raise UploadCancelled("The download was cancelled.")
+        attempt += 1
@@ -1,56 +1,14 @@
-"""Main module for datalight."""
-import pathlib
+"""Main module for datalight. This opens the GUI. Scripts which do not need the GUI should use
+:mod:`datalight.api` which does not import PyQt5."""
 import sys
-from typing import List, Union
+from functools import partial
 
 from PyQt5 import QtWidgets
 
+from datalight.ui import slot_methods
 from datalight.ui.main_form import DatalightUIWindow, connect_button_methods
-from datalight import zenodo, common
-
-
-def upload_record(file_paths: List[str], repository_metadata: Union[dict, str],
-                  config_path: Union[pathlib.Path, str],
-                  experimental_metadata: Union[dict, None] = None, publish: bool = False,
-                  sandbox: bool = True, repository: str = "Zenodo", 
-                  deposition_ID: int = None):
-    """Upload a new record to a data repository."""
-    if repository == "Zenodo":
-        zenodo.upload_record(file_paths, repository_metadata, config_path, experimental_metadata,
-                             publish, sandbox, deposition_ID)
-    else:
-        raise TypeError(f"Unknown repository type: '{repository}'.")
-
-
-def get_status(config_path: Union[pathlib.Path, str],
-               repository: str = "Zenodo", **kwargs) -> bool:
-    r"""Check whether the selected data repository is set up correctly to do an upload.
-    Return True if it is and False if not.
-    :param config_path: The path to the Datalight config file containing API keys.
-    :param repository: The data repository that will be used.
-    :param kwargs:
-        See below
-
-    :Keyword Arguments:
-        * *sandbox* (``bool``) --
-          If Zenodo is selected as the repository. Whether to use the Zenodo sandbox or live
-          Zenodo.
-    """
-    if repository == "Zenodo":
-        if "sandbox" in kwargs:
-            sandbox = kwargs["sandbox"]
-        else:
-            sandbox = True
-        credentials_location = pathlib.Path(config_path).resolve()
-        token = common.get_authentication_token(credentials_location, sandbox)
-        deposition_url = zenodo.get_deposition_url(sandbox)
-        status = zenodo.try_connection(deposition_url, token)
-        if status.code in zenodo.STATUS_SUCCESS:
-            return True
-        else:
-            return False
-    else:
-        raise TypeError(f"Unknown repository type: '{repository}'.")
+# Re-exported so that existing scripts which use the API from this module keep working.
+from datalight.api import upload_record, get_status
 
 
 def open_gui(root_path: str):
@@ -64,6 +22,7 @@ def open_gui(root_path: str):
     datalight_ui.main_window.show()
     datalight_ui.set_window_position()
     connect_button_methods(datalight_ui)
+    app.aboutToQuit.connect(partial(slot_methods.stop_uploads, datalight_ui))
     sys.exit(app.exec_())
 
 
@@ -0,0 +1,204 @@
+"""This module reports the progress of uploads to callers as they are made."""
+
+import copy
+import threading
+import time
+from typing import Callable, Dict, List, Union
+
+from datalight.common import logger
+from datalight.upload_source import UploadSource
+
+FILE_QUEUED = "queued"
+FILE_UPLOADING = "uploading"
+FILE_UPLOADED = "uploaded"
+FILE_FAILED = "failed"
+FILE_CANCELLED = "cancelled"
+
+# The default minimum number of seconds between progress reports.
+DEFAULT_REPORT_INTERVAL = 0.5
+
+
+class FileProgress:
+    """The progress of a single upload.
+    :ivar name: The name of the file in the bucket.
+    :ivar size: The number of bytes to upload. For compressed archives this is an upper
+      estimate until the upload finishes.
+    :ivar bytes_sent: The number of bytes sent so far.
+    :ivar state: One of "queued", "uploading", "uploaded", "failed" or "cancelled".
+    """
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.bytes_sent = 0
+        self.state = FILE_QUEUED
+
+
+class UploadProgress:
+    """A snapshot of the progress of all of the uploads in a deposition.
+    :ivar bytes_sent: The number of bytes sent so far.
+    :ivar total_bytes: The total number of bytes to upload.
+    :ivar rate: The average upload rate so far in bytes per second, or None if it is not known
+      yet.
+    :ivar eta_seconds: The estimated number of seconds until the upload finishes, or None if it
+      cannot be estimated yet.
+    :ivar elapsed_seconds: The number of seconds since the upload started.
+    :ivar files: The progress of each upload, in the order they are started.
+    """
+    def __init__(self, bytes_sent: int, total_bytes: int, rate: Union[float, None],
+                 eta_seconds: Union[float, None], elapsed_seconds: float,
+                 files: List[FileProgress]):
+        self.bytes_sent = bytes_sent
+        self.total_bytes = total_bytes
+        self.rate = rate
+        self.eta_seconds = eta_seconds
+        self.elapsed_seconds = elapsed_seconds
+        self.files = files
+
+    @property
+    def fraction_complete(self) -> float:
+        """The fraction of the total bytes which have been sent, between 0 and 1."""
+        if not self.total_bytes:
+            return 1.0 if all(file.state == FILE_UPLOADED for file in self.files) else 0.0
+        return min(self.bytes_sent / self.total_bytes, 1.0)
+
+
+ProgressCallback = Callable[[UploadProgress], None]
+
+
+class ProgressTracker:
+    """Counts the bytes sent by each upload in a deposition and reports the progress of the
+    whole deposition to a callback.
+
+    Bytes are counted by wrapping the upload bodies in a :class:`ProgressReader`. The callback
+    is called whenever the state of a file changes and otherwise at most once every
+    `report_interval` seconds, so that reporting costs almost nothing however fast the upload
+    is. The callback is called from the upload threads so it must be thread safe and return
+    quickly.
+    """
+    def __init__(self, sources: List[UploadSource], workers: int = 1,
+                 bytes_per_second: float = None, callback: ProgressCallback = None,
+                 report_interval: float = DEFAULT_REPORT_INTERVAL):
+        """
+        :param sources: The files and archives to upload, in the order they are started.
+        :param workers: The number of uploads made at the same time.
+        :param bytes_per_second: The total bandwidth limit of the upload, if there is one. It
+          is used as the upload rate until the rate has been measured.
+        :param callback: If provided, a function which is passed an UploadProgress snapshot
+          each time progress is reported.
+        :param report_interval: The minimum number of seconds between reports of bytes sent.
+        """
+        self.workers = max(workers, 1)
+        self.bytes_per_second = bytes_per_second
+        self.callback = callback
+        self.report_interval = report_interval
+        self.files: Dict[str, FileProgress] = {source.name: FileProgress(source.name, source.size)
+                                               for source in sources}
+        self._start_time = None
+        self._next_report = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Record that the upload has started."""
+        self._start_time = time.monotonic()
+        self._report(self.get_progress())
+
+    def add_bytes(self, name: str, byte_count: int):
+        """Record that `byte_count` more bytes of the upload `name` have been sent."""
+        with self._lock:
+            self.files[name].bytes_sent += byte_count
+            now = time.monotonic()
+            if self.callback is None or now < self._next_report:
+                return
+            self._next_report = now + self.report_interval
+            progress = self._get_progress()
+        self._report(progress)
+
+    def restart_file(self, name: str):
+        """Record that an upload is being sent again from the start, for example after a
+        failed request is retried."""
+        with self._lock:
+            self.files[name].bytes_sent = 0
+
+    def set_state(self, name: str, state: str):
+        """Record the state of an upload. A progress report is always made."""
+        with self._lock:
+            file_progress = self.files[name]
+            file_progress.state = state
+            if state == FILE_UPLOADED:
+                # Compressed archives are smaller than their estimated size so count an
+                # uploaded file as complete.
+                file_progress.size = file_progress.bytes_sent = max(file_progress.bytes_sent,
+                                                                    file_progress.size)
+            progress = self._get_progress()
+        self._report(progress)
+
+    def get_progress(self) -> UploadProgress:
+        """Return a snapshot of the progress of the upload."""
+        with self._lock:
+            return self._get_progress()
+
+    def _get_progress(self) -> UploadProgress:
+        bytes_sent = sum(file.bytes_sent for file in self.files.values())
+        total_bytes = sum(file.size for file in self.files.values())
+        elapsed = time.monotonic() - self._start_time if self._start_time is not None else 0.0
+
+        rate = bytes_sent / elapsed if bytes_sent and elapsed > 0 else None
+        if self.bytes_per_second:
+            rate = min(rate, self.bytes_per_second) if rate else self.bytes_per_second
+
+        # The bandwidth is assumed to be shared equally between the uploads in progress, so
+        # the upload takes at least as long as the remaining data takes at the total rate and
+        # as long as the largest remaining file takes at the rate of one worker.
+        remaining = [file.size - file.bytes_sent for file in self.files.values()
+                     if file.state in [FILE_QUEUED, FILE_UPLOADING]]
+        if not remaining:
+            eta = 0.0
+        elif rate:
+            active_workers = min(self.workers, len(remaining))
+            eta = max(sum(remaining) / rate, max(remaining) * active_workers / rate)
+        else:
+            eta = None
+        return UploadProgress(bytes_sent, total_bytes, rate, eta, elapsed,
+                              [copy.copy(file) for file in self.files.values()])
+
+    def _report(self, progress: UploadProgress):
+        if self.callback is None:
+            return
+        try:
+            self.callback(progress)
+        except Exception as e:
+            # A broken progress display should not stop the upload.
+            logger.warning(f"Progress callback failed: {e}")
+
+
+class ProgressReader:
+    """A read-only file-like object which counts the bytes read from a stream into a
+    ProgressTracker. Bytes are passed to the tracker in batches so the tracker's lock is rarely
+    taken."""
+    # The number of bytes to count before passing them to the tracker.
+    BATCH_SIZE = 2 ** 20
+
+    def __init__(self, raw, tracker: ProgressTracker, name: str):
+        """
+        :param raw: The binary stream to read from.
+        :param tracker: The tracker to count bytes in.
+        :param name: The name of the upload the bytes are counted against.
+        """
+        self._raw = raw
+        self._tracker = tracker
+        self._name = name
+        self._unreported = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self._unreported += len(data)
+        if self._unreported >= self.BATCH_SIZE or not data:
+            self._tracker.add_bytes(self._name, self._unreported)
+            self._unreported = 0
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        position = self._raw.seek(offset, whence)
+        self._unreported = 0
+        self._tracker.restart_file(self._name)
+        return position
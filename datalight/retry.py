@@ -0,0 +1,138 @@
+"""This module controls how requests to a data repository are retried and rate limited."""
+
+import random
+import threading
+import time
+from typing import Iterable, Mapping, Union
+
+# Status codes which indicate a temporary problem that may succeed if the request is retried.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """Decides whether and when a failed request should be retried.
+
+    Delays grow exponentially with each attempt and have full jitter applied so that parallel
+    workers do not retry in lockstep. If the server says when to retry with a Retry-After or
+    X-RateLimit-Reset header, that time is used instead.
+    """
+    def __init__(self, max_retries: int = 5, backoff_factor: float = 1.0,
+                 max_backoff: float = 120.0, retry_statuses: Iterable[int] = RETRY_STATUSES):
+        """
+        :param max_retries: The maximum number of times to retry a request.
+        :param backoff_factor: The base delay in seconds. The delay before retry n is chosen at
+          random between 0 and backoff_factor * 2 ** n seconds.
+        :param max_backoff: The maximum delay in seconds before any retry.
+        :param retry_statuses: HTTP status codes which should be retried.
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+
+    def should_retry(self, attempt: int, status_code: Union[int, None]) -> bool:
+        """Return True if a request should be retried.
+        :param attempt: The number of retries already made.
+        :param status_code: The status code of the response or None if no response was
+          received.
+        """
+        if attempt >= self.max_retries:
+            return False
+        return status_code is None or status_code in self.retry_statuses
+
+    def get_delay(self, attempt: int, headers: Mapping[str, str] = None) -> float:
+        """Return the number of seconds to wait before the next retry.
+        :param attempt: The number of retries already made.
+        :param headers: The headers of the failed response, if there was one.
+        """
+        server_delay = get_server_delay(headers or {})
+        if server_delay is not None:
+            return min(server_delay, self.max_backoff)
+        return random.uniform(0, min(self.backoff_factor * 2 ** attempt, self.max_backoff))
+
+
+def get_server_delay(headers: Mapping[str, str]) -> Union[float, None]:
+    """Get the number of seconds the server has asked the client to wait before sending
+    another request. Returns None if the server has not asked the client to wait, or if the
+    header giving the time cannot be read."""
+    retry_after = headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        import email.utils
+
+        try:
+            retry_date = email.utils.parsedate_to_datetime(retry_after)
+            return max(retry_date.timestamp() - time.time(), 0)
+        except (TypeError, ValueError, IndexError, OverflowError):
+            # A malformed header is ignored and the client falls back to its own backoff.
+            return None
+
+    if headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in headers:
+        try:
+            return max(float(headers["X-RateLimit-Reset"]) - time.time(), 0)
+        except ValueError:
+            return None
+    return None
+
+
+class RateLimiter:
+    """A token bucket which limits the rate requests are sent at. A single RateLimiter is
+    shared by all of the threads sending requests so that together they stay under the
+    repository's API quota.
+
+    A RateLimiter can also limit bandwidth by making each byte sent cost one token, see
+    :func:`get_bandwidth_limiter`."""
+    def __init__(self, requests_per_minute: float, burst: int = None):
+        """
+        :param requests_per_minute: The average number of requests allowed per minute.
+        :param burst: The maximum number of requests that can be sent at once after a period
+          of inactivity. Defaults to `requests_per_minute`.
+        """
+        self.rate = requests_per_minute / 60
+        self.capacity = burst if burst is not None else requests_per_minute
+        self._tokens = self.capacity
+        self._last_update = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """Block until a request may be sent.
+        :param tokens: The number of tokens the request costs.
+        """
+        wait = self.reserve(tokens)
+        while wait:
+            time.sleep(wait)
+            wait = self.reserve(tokens)
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Try to take permission to send a request without blocking.
+        :param tokens: The number of tokens the request costs. A request costing more than the
+          capacity of the bucket is allowed once the bucket is full, leaving it in debt.
+        :returns: 0 if a request may be sent now, else the number of seconds to wait before
+          trying again.
+        """
+        needed = min(tokens, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._last_update) * self.rate)
+            self._last_update = now
+            if now >= self._paused_until and self._tokens >= needed:
+                self._tokens -= tokens
+                return 0
+            return max(self._paused_until - now, (needed - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Stop all requests from being sent for `seconds`. Used when the server reports that
+        the quota has been used up."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def get_bandwidth_limiter(bytes_per_second: float) -> RateLimiter:
+    """Return a token bucket which limits the total rate data is sent at to `bytes_per_second`.
+    Up to one second of data may be sent at once after a pause."""
+    return RateLimiter(bytes_per_second * 60, burst=bytes_per_second)
@@ -0,0 +1,85 @@
+"""This module decides the order files are uploaded in and estimates when an upload will
+finish."""
+
+import time
+from typing import List, Union
+
+from datalight.common import logger
+from datalight.progress import (FILE_UPLOADED, FILE_UPLOADING, ProgressCallback,
+                                ProgressTracker, UploadProgress)
+from datalight.upload_source import UploadSource
+
+
+class UploadScheduler:
+    """Orders the uploads in a deposition so that parallel workers finish at about the same time
+    and tracks their progress to estimate when the upload will be complete.
+
+    Uploads are started largest first (longest processing time first scheduling). Each worker
+    takes the next largest upload when it becomes free, so small files fill in around the large
+    ones instead of a large file that is started last setting the total upload time.
+
+    :ivar sources: The uploads in the order they should be started.
+    :ivar progress: Tracks the progress of the uploads.
+    """
+    def __init__(self, sources: List[UploadSource], workers: int = 1,
+                 bytes_per_second: float = None, progress_callback: ProgressCallback = None):
+        """
+        :param sources: The files and archives to upload.
+        :param workers: The number of uploads made at the same time.
+        :param bytes_per_second: The total bandwidth limit of the upload, if there is one.
+        :param progress_callback: If provided, a function which is passed the progress of the
+          upload as it is made.
+        """
+        self.sources = sorted(sources, key=lambda source: source.size, reverse=True)
+        self.progress = ProgressTracker(self.sources, workers, bytes_per_second,
+                                        progress_callback)
+
+    def start(self):
+        """Record that the upload has started and log when it is expected to finish."""
+        self.progress.start()
+        progress = self.progress.get_progress()
+        logger.info(f"Uploading {len(self.sources)} files, "
+                    f"{format_size(progress.total_bytes)} in total."
+                    f"{_describe_completion(progress)}")
+
+    def file_started(self, source: UploadSource):
+        """Record that an upload has started."""
+        self.progress.set_state(source.name, FILE_UPLOADING)
+
+    def file_finished(self, source: UploadSource, state: str = FILE_UPLOADED):
+        """Record that an upload has finished and log the progress of the whole upload.
+        :param source: The upload which finished.
+        :param state: Whether the upload was "uploaded", "failed" or "cancelled".
+        """
+        self.progress.set_state(source.name, state)
+        if state != FILE_UPLOADED:
+            return
+        progress = self.progress.get_progress()
+        finished_files = sum(1 for file in progress.files if file.state == FILE_UPLOADED)
+        logger.info(f"Uploaded {finished_files} of {len(self.sources)} files, "
+                    f"{format_size(progress.bytes_sent)} of {format_size(progress.total_bytes)}."
+                    f"{_describe_completion(progress)}")
+
+    def expected_completion_time(self) -> Union[float, None]:
+        """Return the time since the epoch at which the upload is expected to finish, or None
+        if it cannot be estimated yet."""
+        eta_seconds = self.progress.get_progress().eta_seconds
+        if eta_seconds is None:
+            return None
+        return time.time() + eta_seconds
+
+
+def _describe_completion(progress: UploadProgress) -> str:
+    if not progress.eta_seconds:
+        return ""
+    completion_time = time.localtime(time.time() + progress.eta_seconds)
+    return f" Expected to finish at {time.strftime('%Y-%m-%d %H:%M:%S', completion_time)}."
+
+
+def format_size(size: float) -> str:
+    """Return a human readable description of a number of bytes."""
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if size < 1000 or unit == "TB":
+            break
+        size /= 1000
+    return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
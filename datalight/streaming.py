@@ -0,0 +1,113 @@
+"""This module contains wrappers for the file-like objects streamed as request bodies during
+an upload."""
+
+import hashlib
+import threading
+from typing import BinaryIO, Iterable, Iterator, Union
+
+from datalight.common import UploadCancelled
+from datalight.retry import RateLimiter
+
+# The size of the chunks read from bodies which are sent with chunked transfer encoding.
+CHUNK_SIZE = 2 ** 16
+
+
+class HashingReader:
+    """A read-only file-like object which calculates checksums of a stream as it is read.
+
+    Passing a HashingReader as the body of a request means the checksum of the uploaded data
+    is calculated as the data is sent, so the data only needs to be read from disk once.
+
+    :ivar length: The number of bytes in the stream, or None if it is not known in advance.
+    """
+    def __init__(self, raw: BinaryIO, length: Union[int, None],
+                 algorithms: Iterable[str] = ("md5",)):
+        """
+        :param raw: The binary stream to read from.
+        :param length: The number of bytes that will be read from `raw`. If this is None the
+          reader must be wrapped in a :class:`ChunkedBody` before being used as a request body.
+        :param algorithms: The names of the hashlib algorithms to calculate.
+        """
+        self._raw = raw
+        self.length = length
+        self._algorithms = tuple(algorithms)
+        self._hashes = {}
+        self._reset_hashes()
+
+    def _reset_hashes(self):
+        self._hashes = {algorithm: hashlib.new(algorithm) for algorithm in self._algorithms}
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to `size` bytes from the stream, updating the checksums with them."""
+        data = self._raw.read(size)
+        for hash_object in self._hashes.values():
+            hash_object.update(data)
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        """Return to the start of the stream so it can be sent again. The checksums are reset.
+        Only seeking to the start of the stream is supported."""
+        if offset != 0 or whence != 0:
+            raise ValueError("HashingReader can only seek to the start of the stream.")
+        self._reset_hashes()
+        return self._raw.seek(0)
+
+    def hexdigest(self, algorithm: str = "md5") -> str:
+        """Return the checksum of the data read so far."""
+        return self._hashes[algorithm].hexdigest()
+
+    def __len__(self) -> int:
+        return self.length
+
+
+class ChunkedBody:
+    """An iterable request body for a stream whose length is not known in advance, such as a
+    compressed archive. Requests sends iterable bodies with chunked transfer encoding."""
+    def __init__(self, reader: HashingReader, chunk_size: int = CHUNK_SIZE):
+        self._reader = reader
+        self._chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(lambda: self._reader.read(self._chunk_size), b"")
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        """Return to the start of the stream so it can be sent again."""
+        return self._reader.seek(offset, whence)
+
+
+class ThrottledReader:
+    """A read-only file-like object which limits the rate a stream is read at. Reads block until
+    the shared bandwidth limiter allows the data read to be sent, so the total rate of all
+    uploads reading through the same limiter stays under its limit."""
+    def __init__(self, raw: BinaryIO, limiter: RateLimiter):
+        """
+        :param raw: The binary stream to read from.
+        :param limiter: A bandwidth limiter from :func:`datalight.retry.get_bandwidth_limiter`.
+        """
+        self._raw = raw
+        self._limiter = limiter
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        if data:
+            self._limiter.acquire(len(data))
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._raw.seek(offset, whence)
+
+
+class CancellableReader:
+    """A read-only file-like object which stops an upload part way through when an event is
+    set. Reading raises UploadCancelled, which aborts the request sending the stream."""
+    def __init__(self, raw: BinaryIO, cancel_event: threading.Event):
+        self._raw = raw
+        self._cancel_event = cancel_event
+
+    def read(self, size: int = -1) -> bytes:
+        if self._cancel_event.is_set():
+            raise UploadCancelled("The upload was cancelled.")
+        return self._raw.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._raw.seek(offset, whence)
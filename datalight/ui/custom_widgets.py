@@ -3,11 +3,22 @@
 
 import datetime
 import sys
-from typing import List, Tuple, Union, TypeVar
+import threading
+from functools import partial
+from typing import Dict, List, Tuple, Union, TypeVar, TYPE_CHECKING
 
 import PyQt5.QtWidgets as QtWidgets
 from PyQt5 import QtGui, QtCore
 
+from datalight.folder_scan import get_path_size
+from datalight.scheduler import format_size
+from datalight.ui.folder_scanner import FolderScanWorker
+from datalight.ui.upload_worker import start_worker
+
+if TYPE_CHECKING:
+    from datalight.progress import UploadProgress
+    from datalight.ui.upload_worker import UploadJob
+
 Widget = TypeVar('Widget', bound=QtWidgets.QWidget)
 
 
@@ -43,6 +54,11 @@ def get_new_widget(parent: Widget, widget_description: dict) -> Tuple[
     # Make sure widget is killed when closed to stop memory leak.
     new_widget.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
 
+    # Add the widget to the name index of the form it is part of.
+    widget_index = getattr(parent, "widget_index", None)
+    if widget_index is not None:
+        widget_index.setdefault(new_widget.objectName(), new_widget)
+
     return new_widget, label, grid_layout
 
 
@@ -91,12 +107,20 @@ class WidgetMixin:
         # If the subclass does not implement this method, raise an AttributeError
         raise AttributeError
 
+    def reset_value(self):
+        """Reset the user input value of a widget to its default so that the form can be used
+        for another record."""
+        # If the subclass does not implement this method, raise an AttributeError
+        raise AttributeError
+
 
 class Splitter(QtWidgets.QSplitter, WidgetMixin):
     def __init__(self, parent_widget, widget_description: dict):
         super().__init__(parent_widget)
         super().set_common_properties(widget_description)
         self.setOrientation(QtCore.Qt.Horizontal)
+        # Share the widget index of the parent so that children are indexed with the form.
+        self.widget_index = getattr(parent_widget, "widget_index", None)
         self._add_children(widget_description)
 
     def _add_children(self, widget_description: dict):
@@ -112,8 +136,8 @@ class CheckBox(QtWidgets.QCheckBox, WidgetMixin):
         super().__init__(parent_widget)
         super().set_common_properties(widget_description)
 
-        if widget_description["default"] is True:
-            self.setChecked(True)
+        self.default = widget_description["default"] is True
+        self.setChecked(self.default)
 
     def get_value(self) -> bool:
         if self.isChecked():
@@ -121,6 +145,9 @@ class CheckBox(QtWidgets.QCheckBox, WidgetMixin):
         else:
             return False
 
+    def reset_value(self):
+        self.setChecked(self.default)
+
 
 class HelpWidget(QtWidgets.QWidget, WidgetMixin):
     """Combination of another widget and a HelpButton."""
@@ -193,24 +220,39 @@ class ComboBox(QtWidgets.QComboBox, WidgetMixin):
             self.activates_when = widget_description["activates_when"]
         else:
             self.activates_when = None
-
-    def paintEvent(self, event: QtGui.QPaintEvent):
+        # The widgets named in activates_when, set by resolve_dependencies once the form exists.
+        self.dependent_widgets: List[Tuple[str, Widget]] = []
+        self.currentIndexChanged.connect(self.update_dependent_widgets)
+
+    def resolve_dependencies(self, widget_index: Dict[str, Widget]):
+        """Look up the widgets named in activates_when so that they can be enabled and disabled
+        without searching the form.
+        :param widget_index: Maps the names of the widgets on the form to the widgets.
         """
-        Overloads the method of the QComboBox superclass to do something every time the
-        box is repainted. This seems to be the easiest way to make the value of one widget
-        dependent on another.
-        """
-        super().paintEvent(event)
-
-        # Process widget dependencies
-        if self.activates_when:
-            for value, dependent_widget_name in self.activates_when.items():
-                dependent_widget = self.parent_widget.findChild(QtWidgets.QWidget,
-                                                                dependent_widget_name)
-                if self.get_value() == value:
-                    dependent_widget.setEnabled(True)
-                else:
-                    dependent_widget.setEnabled(False)
+        self.dependent_widgets = []
+        for value, dependent_widget_name in self.activates_when.items():
+            if dependent_widget_name not in widget_index:
+                raise KeyError(f"ComboBox '{self.objectName()}' activates unknown widget "
+                               f"'{dependent_widget_name}'.")
+            self.dependent_widgets.append((value, widget_index[dependent_widget_name]))
+
+    def update_dependent_widgets(self, _=None):
+        """Enable the widgets activated by the current value of this box and disable the others.
+        A dependent widget which is itself a ComboBox updates its own dependents in turn, so a
+        chain of dependencies is switched off when any box earlier in the chain is disabled."""
+        self._update_dependent_widgets(set())
+
+    def _update_dependent_widgets(self, updated: set):
+        # `updated` stops a loop of dependencies from recursing forever.
+        if id(self) in updated:
+            return
+        updated.add(id(self))
+        current_value = self.currentText() if self.isEditable() else self.currentData()
+        for value, dependent_widget in self.dependent_widgets:
+            dependent_widget.setEnabled(self.isEnabled() and current_value == value)
+            dependent_combo_box = _get_input_widget(dependent_widget)
+            if isinstance(dependent_combo_box, ComboBox):
+                dependent_combo_box._update_dependent_widgets(updated)
 
     def get_value(self) -> str:
         if not self.isEnabled():
@@ -228,6 +270,9 @@ class ComboBox(QtWidgets.QComboBox, WidgetMixin):
             return False
         return True
 
+    def reset_value(self):
+        self.setCurrentIndex(0)
+
 
 class PlainTextEdit(QtWidgets.QPlainTextEdit, WidgetMixin):
     """A larger box to add free-form text."""
@@ -238,14 +283,19 @@ class PlainTextEdit(QtWidgets.QPlainTextEdit, WidgetMixin):
         if "minimum_length" in widget_description:
             self.minimum_length = widget_description["minimum_length"]
 
+        self.default = ""
         if "default" in widget_description:
-            self.setPlainText(str(widget_description["default"]))
+            self.default = str(widget_description["default"])
+        self.setPlainText(self.default)
 
         self.setTabChangesFocus(True)
 
     def get_value(self) -> str:
         return self.toPlainText()
 
+    def reset_value(self):
+        self.setPlainText(self.default)
+
     def validate_input(self) -> bool:
         if not self.optional and self.get_value() == "":
             return False
@@ -270,6 +320,9 @@ class DateEdit(QtWidgets.QDateEdit, WidgetMixin):
     def get_value(self) -> str:
         return self.date().toString(QtCore.Qt.ISODate)
 
+    def reset_value(self):
+        self.setDate(datetime.date.today())
+
 
 class PushButton(QtWidgets.QPushButton, WidgetMixin):
     """A push button. In order to make the  """
@@ -282,6 +335,38 @@ class PushButton(QtWidgets.QPushButton, WidgetMixin):
         self.setText(widget_description["button_text"])
 
 
+class ProgressBar(QtWidgets.QProgressBar, WidgetMixin):
+    """Shows the progress of an upload."""
+    # The number of steps in the bar. More steps than percent gives smoother movement.
+    STEPS = 1000
+
+    def __init__(self, parent_widget: Widget, widget_description: dict):
+        super().__init__(parent_widget)
+        super().set_common_properties(widget_description)
+
+        self.setRange(0, self.STEPS)
+        self.reset_progress()
+
+    def set_progress(self, progress: "UploadProgress"):
+        """Show the progress of an upload."""
+        self.setValue(int(progress.fraction_complete * self.STEPS))
+        text = f"{progress.fraction_complete:.0%}"
+        if progress.rate:
+            text += f" - {format_size(progress.rate)}/s"
+        if progress.eta_seconds:
+            text += f" - {datetime.timedelta(seconds=int(progress.eta_seconds))} remaining"
+        self.setFormat(text)
+
+    def set_message(self, message: str):
+        """Show a message in the bar."""
+        self.setFormat(message)
+
+    def reset_progress(self):
+        """Show that no upload is in progress."""
+        self.setValue(0)
+        self.setFormat("No upload in progress")
+
+
 class ListWidget(QtWidgets.QListWidget, WidgetMixin):
     """Allows display and selection of items from a scrolling list."""
     def __init__(self, parent_widget: Widget, widget_description: dict):
@@ -299,6 +384,267 @@ class ListWidget(QtWidgets.QListWidget, WidgetMixin):
             return False
         return True
 
+    def reset_value(self):
+        self.clear()
+
+
+class FileListModel(QtCore.QAbstractListModel):
+    """A list of paths to upload which stays fast with hundreds of thousands of entries.
+
+    The paths are also kept in a set so checking for duplicates does not scan the list, and each
+    call to :meth:`add_paths` inserts all of its new paths in one batch. The sizes of the files
+    are found in a background thread and shown once they are known.
+
+    :ivar total_size: The total size in bytes of the entries whose size is known.
+    """
+    # Emitted when the number of entries, the total size or the number of sizes still to be
+    # found changes.
+    totals_changed = QtCore.pyqtSignal()
+    # Emitted from the size thread with a generation number and a dictionary of path sizes.
+    _sizes_found = QtCore.pyqtSignal(int, object)
+
+    # The number of sizes the size thread finds before sending them to the model.
+    SIZE_BATCH = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._paths: List[str] = []
+        self._path_set = set()
+        self._sizes: Dict[str, int] = {}
+        self.total_size = 0
+        # Incremented when the list is cleared so that sizes found for old entries are ignored.
+        self._generation = 0
+        self._sizes_found.connect(self._add_sizes, QtCore.Qt.QueuedConnection)
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._paths)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self._paths[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            if path in self._sizes:
+                return f"{path}  ({format_size(self._sizes[path])})"
+            return path
+        if role in [QtCore.Qt.ToolTipRole, QtCore.Qt.UserRole]:
+            return path
+        return None
+
+    def add_paths(self, paths: List[str], sizes: Dict[str, int] = None) -> List[str]:
+        """Add paths to the end of the list. Paths which are already in the list are not added
+        again.
+        :param paths: The paths to add.
+        :param sizes: The sizes of the paths, if they are already known. The sizes of other
+          paths are found in a background thread.
+        :returns: The paths which were already in the list.
+        """
+        sizes = sizes or {}
+        new_paths = []
+        duplicates = []
+        for path in paths:
+            if path in self._path_set:
+                duplicates.append(path)
+            else:
+                self._path_set.add(path)
+                new_paths.append(path)
+        if new_paths:
+            first_row = len(self._paths)
+            self.beginInsertRows(QtCore.QModelIndex(), first_row, first_row + len(new_paths) - 1)
+            self._paths.extend(new_paths)
+            unsized_paths = []
+            for path in new_paths:
+                if path in sizes:
+                    self._sizes[path] = sizes[path]
+                    self.total_size += sizes[path]
+                else:
+                    unsized_paths.append(path)
+            self.endInsertRows()
+            if unsized_paths:
+                threading.Thread(target=self._find_sizes,
+                                 args=(unsized_paths, self._generation), daemon=True).start()
+            self.totals_changed.emit()
+        return duplicates
+
+    def remove_rows(self, rows: List[int]):
+        """Remove the entries at the given row numbers. Runs of neighbouring rows are removed
+        together."""
+        rows = sorted(set(rows), reverse=True)
+        while rows:
+            last_row = first_row = rows.pop(0)
+            while rows and rows[0] == first_row - 1:
+                first_row = rows.pop(0)
+            self.beginRemoveRows(QtCore.QModelIndex(), first_row, last_row)
+            for path in self._paths[first_row:last_row + 1]:
+                self._path_set.discard(path)
+                self.total_size -= self._sizes.pop(path, 0)
+            del self._paths[first_row:last_row + 1]
+            self.endRemoveRows()
+        self.totals_changed.emit()
+
+    def clear(self):
+        """Remove all entries."""
+        self.beginResetModel()
+        self._paths = []
+        self._path_set = set()
+        self._sizes = {}
+        self.total_size = 0
+        self._generation += 1
+        self.endResetModel()
+        self.totals_changed.emit()
+
+    def paths(self) -> List[str]:
+        """Return a copy of the list of paths."""
+        return list(self._paths)
+
+    def pending_sizes(self) -> int:
+        """Return the number of entries whose size has not been found yet."""
+        return len(self._paths) - len(self._sizes)
+
+    def _find_sizes(self, paths: List[str], generation: int):
+        """Find the sizes of `paths`. This runs in a background thread and sends the sizes to
+        the GUI thread in batches."""
+        sizes = {}
+        try:
+            for path in paths:
+                if generation != self._generation:
+                    return
+                sizes[path] = get_path_size(path)
+                if len(sizes) >= self.SIZE_BATCH:
+                    self._sizes_found.emit(generation, sizes)
+                    sizes = {}
+            if sizes:
+                self._sizes_found.emit(generation, sizes)
+        except RuntimeError:
+            # The model was deleted, for example because the application closed.
+            return
+
+    def _add_sizes(self, generation: int, sizes: Dict[str, int]):
+        if generation != self._generation:
+            return
+        new_sizes = False
+        for path, size in sizes.items():
+            # The path may have been removed while its size was found.
+            if path in self._path_set and path not in self._sizes:
+                self._sizes[path] = size
+                self.total_size += size
+                new_sizes = True
+        if new_sizes:
+            # Only rows in view are redrawn, so signalling the whole list is cheap.
+            self.dataChanged.emit(self.index(0), self.index(len(self._paths) - 1),
+                                  [QtCore.Qt.DisplayRole])
+            self.totals_changed.emit()
+
+
+class FileList(QtWidgets.QWidget, WidgetMixin):
+    """The list of files and folders to upload, with the number of entries and their total size
+    shown underneath.
+
+    :ivar model: The FileListModel holding the paths.
+    :ivar view: The list view showing the paths.
+    :ivar summary: The label showing the totals.
+    """
+    def __init__(self, parent_widget: Widget, widget_description: dict):
+        super().__init__(parent_widget)
+        super().set_common_properties(widget_description)
+
+        self.model = FileListModel(self)
+        self.view = QtWidgets.QListView(self)
+        self.view.setModel(self.model)
+        # All rows have the same height, so the view does not need to measure every row. Laying
+        # out the rows in batches stops the view from laying out every row again each time rows
+        # are added, which gets slower as the list grows.
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QtWidgets.QListView.Batched)
+        self.view.setBatchSize(1000)
+        self.view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.summary = QtWidgets.QLabel(self)
+
+        self.layout = QtWidgets.QVBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.layout.addWidget(self.view)
+        self.layout.addWidget(self.summary)
+
+        # The folder scans in progress and the threads they run in.
+        self._scans: List[Tuple[FolderScanWorker, QtCore.QThread]] = []
+
+        self.model.totals_changed.connect(self._update_summary)
+        self._update_summary()
+
+    def add_paths(self, paths: List[str]) -> List[str]:
+        """Add paths to the list.
+        :returns: The paths which were already in the list and so were not added.
+        """
+        return self.model.add_paths(paths)
+
+    def scan_folder(self, folder_path: str, include: List[str] = None,
+                    exclude: List[str] = None):
+        """Add the files in a folder tree to the list. The folder is scanned in a background
+        thread and the files are added in batches as they are found.
+        :param folder_path: The folder to scan.
+        :param include: If provided, only files matching one of these glob patterns are added.
+        :param exclude: Files and folders matching any of these glob patterns are skipped.
+        """
+        worker = FolderScanWorker(folder_path, include, exclude)
+        worker.files_found.connect(partial(self._add_scanned_files, worker))
+        worker.finished.connect(partial(self._scan_finished, worker))
+        self._scans.append((worker, start_worker(worker)))
+        self._update_summary()
+
+    def cancel_scans(self):
+        """Stop all folder scans and wait for them to finish. Files already added are kept."""
+        for worker, thread in self._scans:
+            worker.cancel()
+        for worker, thread in self._scans:
+            thread.wait()
+        self._scans = []
+        self._update_summary()
+
+    def remove_selected(self):
+        """Remove the selected entries from the list."""
+        rows = [index.row() for index in self.view.selectionModel().selectedRows()]
+        self.model.remove_rows(rows)
+
+    def count(self) -> int:
+        return self.model.rowCount()
+
+    def get_value(self) -> List[str]:
+        return self.model.paths()
+
+    def validate_input(self) -> bool:
+        if not self.optional and self.count() == 0:
+            return False
+        return True
+
+    def reset_value(self):
+        self.cancel_scans()
+        self.model.clear()
+
+    def _add_scanned_files(self, worker: FolderScanWorker, files: List[Tuple[str, int]]):
+        # Batches may still be waiting to be delivered after the scan is cancelled.
+        if not worker.cancel_event.is_set():
+            self.model.add_paths([path for path, _ in files], dict(files))
+
+    def _scan_finished(self, worker: FolderScanWorker, file_count: int):
+        for scan in self._scans:
+            if scan[0] is worker:
+                scan[1].wait()
+                self._scans.remove(scan)
+                break
+        self._update_summary()
+
+    def _update_summary(self):
+        count = self.model.rowCount()
+        text = f"{count} item{'s' if count != 1 else ''}, {format_size(self.model.total_size)}"
+        pending = self.model.pending_sizes()
+        if pending:
+            text += f" (finding the size of {pending} more)"
+        if self._scans:
+            text += f" - scanning {len(self._scans)} folder{'s' if len(self._scans) > 1 else ''}"
+        self.summary.setText(text)
+
 
 class LineEdit(QtWidgets.QLineEdit, WidgetMixin):
     """A free text box that spans a single line."""
@@ -306,8 +652,10 @@ class LineEdit(QtWidgets.QLineEdit, WidgetMixin):
         super().__init__(parent_widget)
         super().set_common_properties(widget_description)
 
+        self.default = ""
         if "default" in widget_description:
-            self.setText(str(widget_description["default"]))
+            self.default = str(widget_description["default"])
+        self.setText(self.default)
 
         if "minimum_length" in widget_description:
             self.minimum_length = widget_description["minimum_length"]
@@ -320,6 +668,9 @@ class LineEdit(QtWidgets.QLineEdit, WidgetMixin):
     def get_value(self) -> str:
         return self.text()
 
+    def reset_value(self):
+        self.setText(self.default)
+
     def check_length(self) -> bool:
         """Return True if value of Text box is greater than the minimum length."""
         if len(self.get_value()) >= self.minimum_length:
@@ -353,6 +704,10 @@ class Table(QtWidgets.QTableWidget, WidgetMixin):
     def get_value(self) -> List[list]:
         return self._collect_data()
 
+    def reset_value(self):
+        self.clearContents()
+        self.setRowCount(1)
+
     def _collect_data(self) -> List[list]:
         data = []
         for row_index in range(self.rowCount()):
@@ -367,6 +722,71 @@ class Table(QtWidgets.QTableWidget, WidgetMixin):
         return data
 
 
+class SpinBox(QtWidgets.QSpinBox, WidgetMixin):
+    """A box for entering a whole number."""
+    def __init__(self, parent_widget: Widget, widget_description: dict):
+        super().__init__(parent_widget)
+        super().set_common_properties(widget_description)
+
+        if "minimum" in widget_description:
+            self.setMinimum(widget_description["minimum"])
+        if "maximum" in widget_description:
+            self.setMaximum(widget_description["maximum"])
+        self.default = widget_description.get("default", self.minimum())
+        self.setValue(self.default)
+
+    def get_value(self) -> int:
+        return self.value()
+
+    def reset_value(self):
+        self.setValue(self.default)
+
+
+class UploadQueueTable(QtWidgets.QTableWidget, WidgetMixin):
+    """Lists the records in the upload queue along with the state and progress of each."""
+    def __init__(self, parent_widget: Widget, widget_description: dict):
+        super().__init__(parent_widget)
+        super().set_common_properties(widget_description)
+
+        self.setColumnCount(3)
+        self.setHorizontalHeaderLabels(["Record", "State", "Progress"])
+        self.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self._jobs: List["UploadJob"] = []
+
+    def update_job(self, job: "UploadJob"):
+        """Show the current state of a job, adding it to the table if it is new."""
+        if job in self._jobs:
+            row = self._jobs.index(job)
+        else:
+            row = self.rowCount()
+            self._jobs.append(job)
+            self.insertRow(row)
+            self.setItem(row, 0, QtWidgets.QTableWidgetItem(job.title))
+            self.setItem(row, 1, QtWidgets.QTableWidgetItem())
+            self.setCellWidget(row, 2, ProgressBar(self, {"_name": f"job_{row}_progress"}))
+
+        state_item = self.item(row, 1)
+        state_item.setText(job.state)
+        progress_bar = self.cellWidget(row, 2)
+        if job.status is not None:
+            # Show the details of the result when the mouse is over the state.
+            state_item.setToolTip(f"{job.status.message}\n{job.status.error_message or ''}")
+            progress_bar.set_message(job.status.message)
+        else:
+            progress_bar.set_message(job.state)
+
+    def set_job_progress(self, job: "UploadJob", progress: "UploadProgress"):
+        """Show the progress of a job which is uploading."""
+        self.cellWidget(self._jobs.index(job), 2).set_progress(progress)
+
+    def selected_jobs(self) -> List["UploadJob"]:
+        """Return the jobs in the selected rows."""
+        rows = sorted({index.row() for index in self.selectedIndexes()})
+        return [self._jobs[row] for row in rows]
+
+
 class Label(QtWidgets.QLabel, WidgetMixin):
     """A label to annotate the form."""
     def __init__(self, parent_widget: Widget, widget_description: dict):
@@ -383,6 +803,9 @@ class GroupBox(QtWidgets.QGroupBox, WidgetMixin):
     :ivar parent: (QWidget) The parent widget of the GroupBox.
     :ivar _layout: (QLayout) The layout applied to group_box.
     :ivar _widgets: (list of QWidget) The widgets contained within this GroupBox.
+    :ivar widget_index: (dict) Maps names to widgets. The index is shared by all of the
+      GroupBoxes nested inside the outermost GroupBox so any widget in the tree can be found
+      without searching it.
     """
 
     def __init__(self, parent: Widget, group_box_description: dict):
@@ -399,6 +822,10 @@ class GroupBox(QtWidgets.QGroupBox, WidgetMixin):
         self.parent = parent
         self._layout = None
         self._widgets: List[Widget] = []
+        self.widget_index: Dict[str, Widget] = getattr(parent, "widget_index", None)
+        is_outermost_group_box = self.widget_index is None
+        if is_outermost_group_box:
+            self.widget_index = {}
 
         if "title" in self.element_description:
             self.setTitle(self.element_description["title"])
@@ -407,6 +834,8 @@ class GroupBox(QtWidgets.QGroupBox, WidgetMixin):
 
         self._add_layout()
         self._add_children()
+        if is_outermost_group_box:
+            connect_dependencies(self.widget_index)
 
     def _add_layout(self):
         if "layout" not in self.element_description:
@@ -435,8 +864,15 @@ class GroupBox(QtWidgets.QGroupBox, WidgetMixin):
     def add_widget(self, widget: Widget, label: str = None, grid_layout=None):
         """Add 'widget' to this layout."""
         self._widgets.append(widget)
+        self.widget_index.setdefault(widget.objectName(), widget)
         self._add_widget_to_layout(self._widgets[-1], label, grid_layout)
 
+    def get_widget(self, name: str) -> Union[Widget, None]:
+        """Return the widget called `name` in the tree of GroupBoxes this GroupBox belongs to,
+        or None if there is no such widget. If more than one widget has the same name, the
+        first one created is returned."""
+        return self.widget_index.get(name)
+
     def _add_widget_to_layout(self, widget: Widget, label: str = None,
                               grid_position: List[int] = None):
         if isinstance(self._layout, QtWidgets.QFormLayout):
@@ -473,6 +909,38 @@ class GroupBox(QtWidgets.QGroupBox, WidgetMixin):
         return widgets
 
 
+def connect_dependencies(widget_index: Dict[str, Widget]):
+    """Build the graph of widgets activated by the values of ComboBoxes and set the initial
+    enabled state of the activated widgets. Afterwards widgets are only updated when the value of
+    a ComboBox changes.
+    :param widget_index: Maps the names of all of the widgets on a form to the widgets.
+    """
+    combo_boxes = [_get_input_widget(widget) for widget in widget_index.values()]
+    combo_boxes = [widget for widget in combo_boxes
+                   if isinstance(widget, ComboBox) and widget.activates_when]
+    dependent_widgets = set()
+    for combo_box in combo_boxes:
+        combo_box.resolve_dependencies(widget_index)
+        dependent_widgets.update(id(_get_input_widget(widget))
+                                 for _, widget in combo_box.dependent_widgets)
+
+    # Start from the boxes which do not depend on another box so each chain is evaluated in
+    # order. Boxes in a loop of dependencies have no such start so are evaluated afterwards.
+    for combo_box in combo_boxes:
+        if id(combo_box) not in dependent_widgets:
+            combo_box.update_dependent_widgets()
+    for combo_box in combo_boxes:
+        if id(combo_box) in dependent_widgets:
+            combo_box.update_dependent_widgets()
+
+
+def _get_input_widget(widget: Widget) -> Widget:
+    """Return the widget wrapped by a HelpWidget, or `widget` if it is not a HelpWidget."""
+    if isinstance(widget, HelpWidget):
+        return widget.input_widget[0]
+    return widget
+
+
 def message_box(message_text: str, message_type: QtWidgets.QMessageBox.Icon):
     """A generic message box to alert the user of something."""
     warning_widget = QtWidgets.QMessageBox()
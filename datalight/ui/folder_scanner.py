@@ -0,0 +1,59 @@
+"""Scans folders in a background thread so that folders with many files can be added to the
+upload list without freezing the GUI."""
+import threading
+import time
+from typing import List
+
+from PyQt5 import QtCore
+
+from datalight.folder_scan import scan_folder
+
+
+class FolderScanWorker(QtCore.QObject):
+    """Finds the files in a folder tree. The worker is moved to its own QThread and sends the
+    files it finds to the GUI in batches through the files_found signal.
+
+    :ivar folder_path: The folder to scan.
+    :ivar include: Glob patterns of the files to add. All files are added if this is empty.
+    :ivar exclude: Glob patterns of the files and folders to skip.
+    :ivar cancel_event: Set to stop the scan.
+    """
+    # Emitted with a list of (path, size) tuples as files are found.
+    files_found = QtCore.pyqtSignal(object)
+    # Emitted with the number of files found when the scan finishes or is cancelled.
+    finished = QtCore.pyqtSignal(int)
+
+    # The most files sent in one batch.
+    BATCH_SIZE = 2000
+    # The longest time in seconds files are held before being sent.
+    BATCH_INTERVAL = 0.2
+
+    def __init__(self, folder_path: str, include: List[str] = None, exclude: List[str] = None):
+        super().__init__()
+        self.folder_path = folder_path
+        self.include = include
+        self.exclude = exclude
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        """Scan the folder. This is called in the worker thread."""
+        file_count = 0
+        batch = []
+        next_batch_time = time.monotonic() + self.BATCH_INTERVAL
+        for entry in scan_folder(self.folder_path, self.include, self.exclude,
+                                 self.cancel_event):
+            batch.append(entry)
+            if len(batch) >= self.BATCH_SIZE or time.monotonic() >= next_batch_time:
+                self.files_found.emit(batch)
+                file_count += len(batch)
+                batch = []
+                next_batch_time = time.monotonic() + self.BATCH_INTERVAL
+        if batch and not self.cancel_event.is_set():
+            self.files_found.emit(batch)
+            file_count += len(batch)
+        self.finished.emit(file_count)
+
+    def cancel(self):
+        """Stop the scan. Files already sent to the GUI are kept. This can be called from any
+        thread."""
+        self.cancel_event.set()
@@ -1,13 +1,15 @@
 """Generates the UI which is used to input data into Datalight"""
+import copy
 import pathlib
 from functools import partial
 from typing import Union
 
 from PyQt5 import QtWidgets, QtGui
 
-import datalight.common
 from datalight.ui import slot_methods, custom_widgets, menu_bar
 from datalight.ui.custom_widgets import Widget
+from datalight.ui.ui_spec_cache import load_ui_spec
+from datalight.ui.upload_worker import UploadQueue
 from datalight.common import logger
 
 
@@ -22,6 +24,7 @@ class DatalightUIWindow:
     :ivar central_widget_layout: The layout of central_widget.
     :ivar group_box: The base group box.
     :ivar authors: A dictionary of Author names, Affiliations and ORCIDs.
+    :ivar upload_queue: Uploads queued records in the background.
     """
     def __init__(self, root_path: str):
         self.ui_specification = {}
@@ -59,6 +62,7 @@ class DatalightUIWindow:
         self._check_config()
         self.ui_path = self.root_path.joinpath("datalight/ui/")
         self.authors = {}
+        self.upload_queue = None
 
     def ui_setup(self):
         """ Load UI description from files and then add widgets hierarchically."""
@@ -69,10 +73,12 @@ class DatalightUIWindow:
         repository_path = self.ui_path.joinpath("ui_descriptions/zenodo.yaml")
         experimental_path = self.ui_path.joinpath("ui_descriptions/metadata.yaml")
 
-        self.ui_specification = datalight.common.read_yaml(repository_path)
-        self.ui_specification = {**self.ui_specification,**datalight.common.read_yaml(experimental_path)}
-        combined_ui = {**self.ui_specification, **datalight.common.read_yaml(experimental_path)}
+        self.ui_specification = {**load_ui_spec(repository_path),
+                                 **load_ui_spec(experimental_path)}
+        # Building the form modifies the widget descriptions so keep an unmodified copy.
+        combined_ui = copy.deepcopy(self.ui_specification)
         self.add_base_group_box()
+        self.setup_upload_queue()
         self.ui_specification = {"splitter": {"widget": "Splitter",
                                               "_name": "BaseSplitter",
                                               "children": combined_ui}
@@ -80,7 +86,7 @@ class DatalightUIWindow:
 
         # Get authors from file
         author_path = self.ui_path.joinpath("ui_descriptions/author_details.yaml")
-        self.authors = datalight.common.read_yaml(author_path)
+        self.authors = load_ui_spec(author_path)
 
     def setup_menu(self):
         """Add the menu bar to the form."""
@@ -98,10 +104,19 @@ class DatalightUIWindow:
                                                        base_description)[0]
         self.scroll_area_contents_layout.addWidget(self.group_box)
 
+    def setup_upload_queue(self):
+        """Create the upload queue and connect it to the queue panel on the form."""
+        queue_table = self.get_widget_by_name("upload_queue_table")
+        max_uploads = self.get_widget_by_name("max_uploads")
+        self.upload_queue = UploadQueue(max_uploads.get_value())
+        self.upload_queue.job_changed.connect(queue_table.update_job)
+        self.upload_queue.job_progress.connect(queue_table.set_job_progress)
+        max_uploads.valueChanged.connect(self.upload_queue.set_max_uploads)
+
     def add_author(self, name: str):
         """Given the name of an author in the authors file, add their details to the author details
         table."""
-        author_table = self.group_box.findChildren(QtWidgets.QWidget, "author_details")[0]
+        author_table = self.get_widget_by_name("author_details")
         if author_table.rowCount() == 1 and author_table.item(0, 0) is None:
             row_num = 0
         else:
@@ -130,13 +145,11 @@ class DatalightUIWindow:
                 self.get_widget_by_name(child).setEnabled(False)
 
     def get_widget_by_name(self, name: str) -> Union[Widget, None]:
-        """Return the widget in self.widgets whose objectName is name.
+        """Return the widget on the form whose objectName is name. Widgets are looked up in the
+        index of widget names kept by the base group box.
         :param name: The name of the widget to find.
         :returns widget if widget with `name` is found else returns None."""
-        for widget in self.group_box.list_widgets():
-            if widget.objectName() == name:
-                return widget
-        return None
+        return self.group_box.get_widget(name)
 
     def set_window_position(self):
         """Put the UI window in the middle of the screen."""
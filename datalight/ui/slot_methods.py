@@ -10,11 +10,12 @@ from typing import TYPE_CHECKING, List, Union
 
 from PyQt5 import QtWidgets, QtCore, QtGui
 
-import datalight.common
+from datalight.folder_scan import parse_patterns
 from datalight.ui import custom_widgets
 import datalight.ui.validation
-from datalight.zenodo import upload_record
 from datalight.ui.custom_widgets import Widget, get_new_widget, Table
+from datalight.ui.ui_spec_cache import load_ui_spec
+from datalight.ui.upload_worker import UploadJob
 
 if TYPE_CHECKING:
     from datalight.ui.main_form import DatalightUIWindow
@@ -22,11 +23,8 @@ if TYPE_CHECKING:
 
 def remove_item_button(datalight_ui: "DatalightUIWindow"):
     """Remove the selected item(s) from the file/folder upload list."""
-    list_widget = datalight_ui.get_widget_by_name("file_list")
-    files = list_widget.selectedItems()
-    for item in files:
-        row_index = list_widget.row(item)
-        list_widget.takeItem(row_index)
+    file_list = datalight_ui.get_widget_by_name("file_list")
+    file_list.remove_selected()
 
 
 def select_file_button(datalight_ui: "DatalightUIWindow"):
@@ -37,29 +35,36 @@ def select_file_button(datalight_ui: "DatalightUIWindow"):
 
 
 def select_folder_button(datalight_ui: "DatalightUIWindow"):
-    """Prepare to open a dialog box to select a folder` to upload."""
+    """Open a dialog box to select a folder. The files in the folder are found in the background
+    and added to the upload list as they are found."""
     file_dialogue = QtWidgets.QFileDialog()
     file_dialogue.setFileMode(QtWidgets.QFileDialog.Directory)
-    open_file_window(datalight_ui, file_dialogue)
+    if file_dialogue.exec():
+        file_list = datalight_ui.get_widget_by_name("file_list")
+        include = parse_patterns(datalight_ui.get_widget_by_name("include_files").get_value())
+        exclude = parse_patterns(datalight_ui.get_widget_by_name("exclude_files").get_value())
+        for folder_path in file_dialogue.selectedFiles():
+            file_list.scan_folder(folder_path, include, exclude)
 
 
 def open_file_window(datalight_ui: "DatalightUIWindow", file_dialogue):
     """Open a dialogue box to select a file or folder."""
-    list_widget = datalight_ui.get_widget_by_name("file_list")
+    file_list = datalight_ui.get_widget_by_name("file_list")
     if file_dialogue.exec():
-        for path in file_dialogue.selectedFiles():
-            if not list_widget.findItems(path, QtCore.Qt.MatchExactly):
-                list_widget.addItem(path)
-            else:
-                file_name = re.split(r"[\\/]", path)[-1]
-                QtWidgets.QMessageBox.warning(datalight_ui.central_widget, "Warning",
-                                              f"File {file_name}, already selected.")
+        duplicates = file_list.add_paths(file_dialogue.selectedFiles())
+        if len(duplicates) == 1:
+            file_name = re.split(r"[\\/]", duplicates[0])[-1]
+            QtWidgets.QMessageBox.warning(datalight_ui.central_widget, "Warning",
+                                          f"File {file_name}, already selected.")
+        elif duplicates:
+            QtWidgets.QMessageBox.warning(datalight_ui.central_widget, "Warning",
+                                          f"{len(duplicates)} files were already selected.")
 
 
 def ok_button(datalight_ui: "DatalightUIWindow"):
     """
-    The on click method for the OK button. Take all data from the form and package
-    it up into a dictionary.
+    The on click method for the OK button. Take all data from the form, package
+    it up into a dictionary and add it to the upload queue.
     """
     repository_metadata = validate_widgets(datalight_ui, "zenodo_core_metadata")
     experiment_metadata = validate_widgets(datalight_ui, "experimental_metadata")
@@ -77,18 +82,36 @@ def ok_button(datalight_ui: "DatalightUIWindow"):
 
         repository_metadata = preprocess_zenodo_metadata(repository_metadata)
 
-        upload_status = upload_record(experiment_metadata.pop("file_list"), repository_metadata,
-                                      datalight_ui.config_path, experiment_metadata, publish,
-                                      repository_metadata.pop("sandbox"))
-        if upload_status.code == 200:
-            custom_widgets.message_box("Datalight upload successful.",
-                                       QtWidgets.QMessageBox.Information)
-        else:
-            custom_widgets.message_box(f"Error in upload.\n"
-                                       f"Error type: '{upload_status.message}'\n"
-                                       f"Affected field: '{upload_status.error_field}'\n"
-                                       f"Error details: '{upload_status.error_message}'\n",
-                                       QtWidgets.QMessageBox.Warning)
+        # The folder filters control the file list and are not part of the record.
+        experiment_metadata.pop("include_files", None)
+        experiment_metadata.pop("exclude_files", None)
+        upload_arguments = {"file_paths": experiment_metadata.pop("file_list"),
+                            "sandbox": repository_metadata.pop("sandbox"),
+                            "repository_metadata": repository_metadata,
+                            "config_path": datalight_ui.config_path,
+                            "experimental_metadata": experiment_metadata,
+                            "publish": publish}
+        # The values have been copied out of the form so it can be cleared for the next record
+        # while this one waits to be uploaded.
+        datalight_ui.upload_queue.add_job(UploadJob(repository_metadata["title"],
+                                                    upload_arguments))
+        clear_widgets(datalight_ui, "zenodo_core_metadata")
+        clear_widgets(datalight_ui, "experimental_metadata")
+
+
+def cancel_button(datalight_ui: "DatalightUIWindow"):
+    """Cancel the selected uploads in the upload queue. Records which are being uploaded are
+    stopped and the partly uploaded record is deleted."""
+    queue_table = datalight_ui.get_widget_by_name("upload_queue_table")
+    for job in queue_table.selected_jobs():
+        datalight_ui.upload_queue.cancel_job(job)
+
+
+def stop_uploads(datalight_ui: "DatalightUIWindow"):
+    """Cancel all queued uploads and wait for the uploads in progress to stop. Folder scans are
+    also stopped. Called when the application closes."""
+    datalight_ui.get_widget_by_name("file_list").cancel_scans()
+    datalight_ui.upload_queue.stop()
 
 
 def preprocess_zenodo_metadata(raw_metadata: dict):
@@ -182,8 +205,19 @@ def validate_widgets(datalight_ui: "DatalightUIWindow", root_widget_name: str) -
     return None
 
 
+def clear_widgets(datalight_ui: "DatalightUIWindow", root_widget_name: str):
+    """Reset the child widgets of `root_widget_name` to their default values."""
+    for widget in get_child_widgets(datalight_ui, root_widget_name):
+        try:
+            widget.reset_value()
+        except AttributeError:
+            # If the widget does not have a reset_value method then leave it unchanged.
+            pass
+
+
 def get_child_widgets(datalight_ui: "DatalightUIWindow", root_widget_name: str) -> List[Widget]:
-    """Return the child widgets of the widget with name `root_widget_name`"""
+    """Return the child widgets of the widget with name `root_widget_name`. The root widget is
+    found from the widget index, then its children are listed by Qt."""
     root_widget = datalight_ui.get_widget_by_name(root_widget_name)
     return root_widget.findChildren(QtWidgets.QWidget)
 
@@ -211,7 +245,7 @@ def add_author_button(datalight_ui: "DatalightUIWindow"):
 
     # Set up the dialog widgets
     author_widget_path = datalight_ui.ui_path.joinpath("ui_descriptions/add_authors.yaml")
-    author_ui = datalight.common.read_yaml(author_widget_path)
+    author_ui = load_ui_spec(author_widget_path)
     base_description = {"widget": "GroupBox",
                         "layout": "HBoxLayout",
                         "_name": "BaseGroupBox",
@@ -226,23 +260,25 @@ def add_author_button(datalight_ui: "DatalightUIWindow"):
 
     # Get the list of authors and add them to the combobox
     author_path = datalight_ui.ui_path.joinpath("ui_descriptions/author_details.yaml")
-    authors = datalight.common.read_yaml(author_path)
+    authors = load_ui_spec(author_path)
 
-    list_widget = author_window.findChildren(QtWidgets.QWidget, "author_list")[0]
+    list_widget = group_box.get_widget("author_list")
     for author_name in authors:
         list_widget.addItem(author_name)
 
     # Add an action to the add author button
-    add_selected_button = author_window.findChildren(QtWidgets.QWidget, "select_author_button")[0]
+    add_selected_button = group_box.get_widget("select_author_button")
     add_selected_button.clicked.connect(partial(add_selected_author_button, datalight_ui,
-                                                author_window))
+                                                group_box, author_window))
 
     author_window.show()
 
 
-def add_selected_author_button(datalight_ui: "DatalightUIWindow", author_window: QtWidgets.QDialog):
+def add_selected_author_button(datalight_ui: "DatalightUIWindow",
+                               author_group_box: custom_widgets.GroupBox,
+                               author_window: QtWidgets.QDialog):
     """Method for the add selected combo button in the add authors dialog."""
-    author_list_widget = author_window.findChildren(QtWidgets.QWidget, "author_list")[0]
+    author_list_widget = author_group_box.get_widget("author_list")
     selected_authors = [item.text() for item in author_list_widget.selectedItems()]
 
     for author in selected_authors:
@@ -0,0 +1,88 @@
+"""This module loads the YAML files which describe the GUI. Parsed descriptions are cached in
+memory and on disk so that the files are only parsed again when they change."""
+
+import hashlib
+import os
+import pathlib
+import pickle
+from typing import Dict, Tuple, Union
+
+from datalight import common
+from datalight.common import logger
+
+# The directory in the datalight cache directory that parsed descriptions are stored in.
+UI_SPEC_CACHE_DIR = "ui_specs"
+# Increase this if the format of the cached files changes so that old caches are ignored.
+UI_SPEC_CACHE_VERSION = 1
+
+# Maps the path of a description file to its modification time, size and pickled contents.
+_loaded_specs: Dict[pathlib.Path, Tuple[int, int, bytes]] = {}
+
+
+def load_ui_spec(file_path: Union[pathlib.Path, str]) -> dict:
+    """Return the contents of a UI description YAML file.
+
+    The file is only parsed if it has changed since it was last parsed. Parsed files are kept in
+    memory and in the datalight cache directory, keyed by the modification time and size of the
+    file. If the modification time has changed, the file is only parsed again if its SHA-256
+    hash has also changed. A new object is returned from each call so callers may modify it.
+    :param file_path: The path of the YAML file.
+    """
+    file_path = pathlib.Path(file_path).resolve()
+    file_stat = file_path.stat()
+
+    loaded_spec = _loaded_specs.get(file_path)
+    if loaded_spec and loaded_spec[:2] == (file_stat.st_mtime_ns, file_stat.st_size):
+        return pickle.loads(loaded_spec[2])
+
+    contents = file_path.read_bytes()
+    file_hash = hashlib.sha256(contents).hexdigest()
+    cache_path = _get_cache_path(file_path)
+    pickled_spec = _read_cache(cache_path, file_hash)
+    if pickled_spec is None:
+        pickled_spec = pickle.dumps(_parse_yaml(contents), protocol=pickle.HIGHEST_PROTOCOL)
+        _write_cache(cache_path, file_hash, pickled_spec)
+
+    _loaded_specs[file_path] = (file_stat.st_mtime_ns, file_stat.st_size, pickled_spec)
+    return pickle.loads(pickled_spec)
+
+
+def _parse_yaml(contents: bytes) -> dict:
+    import yaml
+
+    return yaml.load(contents.decode("utf8"), Loader=common.get_yaml_loader())
+
+
+def _get_cache_path(file_path: pathlib.Path) -> pathlib.Path:
+    """Return the path the parsed contents of `file_path` are cached at."""
+    path_hash = hashlib.sha256(str(file_path).encode("utf8")).hexdigest()
+    return common.get_cache_dir() / UI_SPEC_CACHE_DIR / f"{path_hash}.pickle"
+
+
+def _read_cache(cache_path: pathlib.Path, file_hash: str) -> Union[bytes, None]:
+    """Return the pickled description stored at `cache_path` if it was parsed from a file with
+    hash `file_hash`, else return None."""
+    try:
+        with open(cache_path, "rb") as cache_file:
+            version, cached_hash, pickled_spec = pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        logger.warning(f"Ignoring unreadable UI description cache: {cache_path}")
+        return None
+    if version != UI_SPEC_CACHE_VERSION or cached_hash != file_hash:
+        return None
+    return pickled_spec
+
+
+def _write_cache(cache_path: pathlib.Path, file_hash: str, pickled_spec: bytes):
+    """Store a parsed description. A failure to write the cache is logged and ignored."""
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_suffix(".tmp")
+        with open(temp_path, "wb") as cache_file:
+            pickle.dump((UI_SPEC_CACHE_VERSION, file_hash, pickled_spec), cache_file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        logger.warning(f"Could not write UI description cache: {cache_path}")
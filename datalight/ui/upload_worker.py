@@ -0,0 +1,180 @@
+"""Runs uploads in background threads so that the GUI stays responsive while data is sent."""
+import threading
+import time
+from functools import partial
+from typing import List
+
+from PyQt5 import QtCore
+
+from datalight import api
+from datalight.common import logger, UploadStatus
+from datalight.zenodo import STATUS_CANCELLED, STATUS_SUCCESS
+
+JOB_QUEUED = "Queued"
+JOB_UPLOADING = "Uploading"
+JOB_UPLOADED = "Uploaded"
+JOB_FAILED = "Failed"
+JOB_CANCELLED = "Cancelled"
+
+# The longest time in seconds the application waits for uploads to stop when it closes.
+STOP_TIMEOUT = 10
+
+
+class UploadWorker(QtCore.QObject):
+    """Uploads one record. The worker is moved to its own QThread and reports back to the GUI
+    through signals, which Qt delivers to slots in the main thread.
+
+    :ivar upload_arguments: The keyword arguments passed to :func:`datalight.api.upload_record`.
+    :ivar cancel_event: Set to stop the upload.
+    """
+    # Emitted with a datalight.progress.UploadProgress as the files are uploaded.
+    progress = QtCore.pyqtSignal(object)
+    # Emitted with the final UploadStatus when the upload finishes.
+    finished = QtCore.pyqtSignal(object)
+
+    def __init__(self, upload_arguments: dict):
+        super().__init__()
+        self.upload_arguments = upload_arguments
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        """Upload the record. This is called in the worker thread."""
+        try:
+            status = api.upload_record(**self.upload_arguments,
+                                       progress_callback=self.progress.emit,
+                                       cancel_event=self.cancel_event)
+        except Exception as e:
+            logger.error(f"Upload failed: {e}")
+            status = UploadStatus(500, f"{type(e).__name__}: {e}")
+        self.finished.emit(status)
+
+    def cancel(self):
+        """Stop the upload. Transfers in progress are stopped and the deposition is deleted.
+        This can be called from any thread."""
+        self.cancel_event.set()
+
+
+def start_worker(worker: QtCore.QObject) -> QtCore.QThread:
+    """Start `worker` in a new thread. The thread stops when the worker finishes, after which
+    the thread and the worker are deleted by Qt.
+    :param worker: An object with a run method and a finished signal, such as an UploadWorker.
+    :returns: The thread. A reference to it must be kept until it finishes and must not be
+      used after the slots connected to the finished signal of the worker have run.
+    """
+    thread = QtCore.QThread()
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+    # QThread.quit is thread safe. Calling it directly from the worker thread means the thread
+    # is already stopping when the GUI handles the finished signal.
+    worker.finished.connect(thread.quit, QtCore.Qt.DirectConnection)
+    thread.finished.connect(worker.deleteLater)
+    thread.finished.connect(thread.deleteLater)
+    thread.start()
+    return thread
+
+
+class UploadJob:
+    """A record in the upload queue.
+    :ivar title: The title of the record, used to identify it in the queue.
+    :ivar upload_arguments: The keyword arguments passed to :func:`datalight.api.upload_record`.
+    :ivar state: One of the JOB_* states.
+    :ivar status: The result of the upload once it has finished.
+    :ivar worker: The worker uploading the record, while the upload is running.
+    :ivar thread: The thread the worker runs in, while the upload is running.
+    """
+    def __init__(self, title: str, upload_arguments: dict):
+        self.title = title
+        self.upload_arguments = upload_arguments
+        self.state = JOB_QUEUED
+        self.status = None
+        self.worker = None
+        self.thread = None
+
+
+class UploadQueue(QtCore.QObject):
+    """Uploads queued records in the background, running up to `max_uploads` uploads at the
+    same time. Jobs are started in the order they were added. The queue must be used from the
+    GUI thread.
+
+    :ivar jobs: All jobs added to the queue, in the order they were added.
+    :ivar max_uploads: The maximum number of records uploaded at the same time.
+    """
+    # Emitted with the job whenever the state of a job changes.
+    job_changed = QtCore.pyqtSignal(object)
+    # Emitted with the job and a datalight.progress.UploadProgress as a job is uploaded.
+    job_progress = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, max_uploads: int = 1):
+        super().__init__()
+        self.jobs: List[UploadJob] = []
+        self.max_uploads = max_uploads
+
+    def add_job(self, job: UploadJob):
+        """Add a record to the end of the queue. It starts uploading as soon as there is a free
+        upload slot."""
+        self.jobs.append(job)
+        self.job_changed.emit(job)
+        self._start_jobs()
+
+    def set_max_uploads(self, max_uploads: int):
+        """Change the number of records uploaded at the same time. Uploads already running are
+        not stopped if the limit is lowered."""
+        self.max_uploads = max_uploads
+        self._start_jobs()
+
+    def cancel_job(self, job: UploadJob):
+        """Remove a queued job from the queue or stop a job which is uploading."""
+        if job.state == JOB_QUEUED:
+            job.state = JOB_CANCELLED
+            self.job_changed.emit(job)
+        elif job.state == JOB_UPLOADING:
+            job.worker.cancel()
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> bool:
+        """Cancel all jobs and wait for the uploads in progress to stop.
+        :param timeout: The longest time in seconds to wait for all of the uploads to stop.
+        :returns: True if all uploads stopped, False if some were still running at the timeout.
+        """
+        for job in self.jobs:
+            self.cancel_job(job)
+        deadline = time.monotonic() + timeout
+        stopped = True
+        for job in self.jobs:
+            if job.thread:
+                remaining_ms = max(int((deadline - time.monotonic()) * 1000), 0)
+                stopped = job.thread.wait(remaining_ms) and stopped
+        if not stopped:
+            logger.warning(f"Uploads did not stop within {timeout} seconds.")
+        return stopped
+
+    def _start_jobs(self):
+        running = sum(1 for job in self.jobs if job.state == JOB_UPLOADING)
+        for job in self.jobs:
+            if running >= self.max_uploads:
+                break
+            if job.state == JOB_QUEUED:
+                self._start_job(job)
+                running += 1
+
+    def _start_job(self, job: UploadJob):
+        job.worker = UploadWorker(job.upload_arguments)
+        job.worker.progress.connect(partial(self.job_progress.emit, job))
+        job.worker.finished.connect(partial(self._job_finished, job))
+        job.state = JOB_UPLOADING
+        job.thread = start_worker(job.worker)
+        self.job_changed.emit(job)
+
+    def _job_finished(self, job: UploadJob, status: UploadStatus):
+        job.thread.wait()
+        # The thread and worker are deleted by Qt once the thread has finished.
+        job.thread = None
+        job.worker = None
+        job.status = status
+        if status.code in STATUS_SUCCESS:
+            job.state = JOB_UPLOADED
+        elif status.code == STATUS_CANCELLED:
+            job.state = JOB_CANCELLED
+        else:
+            job.state = JOB_FAILED
+        self.job_changed.emit(job)
+        self._start_jobs()
@@ -0,0 +1,172 @@
+"""This module keeps a local index of the checksums of files which have been uploaded or hashed,
+so that unchanged files do not need to be hashed again when they are compared with a deposition.
+
+Files are identified by their path, size, modification time and inode. If any of these change
+the file is treated as new content and hashed again. Whether a file needs to be uploaded is
+always decided by comparing its checksum with the files Zenodo lists in the deposition, so the
+cache only stores checksums and not where files were uploaded.
+"""
+
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Tuple, Union
+
+from datalight import common
+from datalight.common import logger
+
+# The cache is stored in the datalight cache directory.
+CACHE_FILE_NAME = "upload_cache.sqlite"
+# Files which have not been looked up or uploaded for this long are removed from the cache.
+DEFAULT_MAX_AGE_DAYS = 90
+# The most files kept in the cache. The least recently used files are removed first.
+DEFAULT_MAX_ENTRIES = 200000
+# The database file is only rewritten to reclaim space when more than this fraction is unused.
+VACUUM_FREE_FRACTION = 0.25
+
+
+class UploadCache:
+    """A SQLite index of file checksums.
+
+    The cache may be used by several upload threads at once so all access to the database
+    connection is serialised by a lock. Several processes may share the cache file.
+    """
+    def __init__(self, cache_path: Union[pathlib.Path, str],
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        :param cache_path: The path of the SQLite database file. It is created if it does not
+          exist.
+        :param max_age_days: Files which have not been used for this many days are removed when
+          the cache is compacted.
+        :param max_entries: The most files kept when the cache is compacted.
+        """
+        self.cache_path = pathlib.Path(cache_path)
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.cache_path), timeout=30,
+                                           check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                     "file_id INTEGER PRIMARY KEY, "
+                                     "path TEXT NOT NULL, "
+                                     "size INTEGER NOT NULL, "
+                                     "mtime_ns INTEGER NOT NULL, "
+                                     "inode INTEGER NOT NULL, "
+                                     "checksum TEXT NOT NULL, "
+                                     "last_used REAL NOT NULL, "
+                                     "UNIQUE (path, size, mtime_ns, inode))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS files_last_used "
+                                     "ON files (last_used)")
+
+    def get_checksum(self, filepath: Union[pathlib.Path, str]) -> Union[str, None]:
+        """Return the MD5 checksum of a file if it is in the cache and has not changed since it
+        was added, else return None."""
+        key = _get_file_key(filepath)
+        if key is None:
+            return None
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT file_id, checksum FROM files WHERE "
+                                           "path = ? AND size = ? AND mtime_ns = ? AND "
+                                           "inode = ?", key).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE files SET last_used = ? WHERE file_id = ?",
+                                     (time.time(), row[0]))
+        return row[1]
+
+    def set_checksum(self, filepath: Union[pathlib.Path, str], checksum: str,
+                     stat: os.stat_result = None):
+        """Add the MD5 checksum of a file to the cache, replacing any entries for earlier
+        contents of the file.
+        :param filepath: The path of the file.
+        :param checksum: The MD5 checksum of the file.
+        :param stat: The result of os.stat on the file from before it was hashed. If given, the
+          checksum is only stored if the file has not changed since then.
+        """
+        key = _get_file_key(filepath)
+        if key is None or (stat is not None and key[1:] != _stat_key(stat)):
+            return
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM files WHERE path = ?", (key[0],))
+            self._connection.execute("INSERT INTO files (path, size, mtime_ns, inode, checksum, "
+                                     "last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                                     (*key, checksum, time.time()))
+
+    def compact(self):
+        """If the cache has grown past its limits, remove files which have not been used for
+        `max_age_days` and the least recently used files beyond `max_entries`. The database
+        file is only rewritten to reclaim space if a large part of it is unused, as rewriting
+        is slow for a large cache."""
+        oldest_allowed = time.time() - self.max_age_days * 24 * 60 * 60
+        with self._lock:
+            oldest_used, file_count = self._connection.execute(
+                "SELECT MIN(last_used), COUNT(*) FROM files").fetchone()
+            removed = 0
+            with self._connection:
+                if oldest_used is not None and oldest_used < oldest_allowed:
+                    removed += self._connection.execute("DELETE FROM files WHERE last_used < ?",
+                                                        (oldest_allowed,)).rowcount
+                if file_count - removed > self.max_entries:
+                    removed += self._connection.execute(
+                        "DELETE FROM files WHERE file_id NOT IN (SELECT file_id FROM files "
+                        "ORDER BY last_used DESC LIMIT ?)", (self.max_entries,)).rowcount
+            if not removed:
+                return
+            logger.debug(f"Removed {removed} files from the upload cache.")
+            free_pages = self._connection.execute("PRAGMA freelist_count").fetchone()[0]
+            total_pages = self._connection.execute("PRAGMA page_count").fetchone()[0]
+            if free_pages > total_pages * VACUUM_FREE_FRACTION:
+                self._connection.execute("VACUUM")
+
+    def close(self):
+        """Close the connection to the cache database."""
+        self._connection.close()
+
+    def __enter__(self) -> "UploadCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _stat_key(stat: os.stat_result) -> Tuple[int, int, int]:
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def _get_file_key(filepath: Union[pathlib.Path, str]) -> Union[Tuple[str, int, int, int], None]:
+    """Return the path, size, modification time and inode identifying the current contents of
+    a file, or None if the file cannot be read."""
+    filepath = pathlib.Path(filepath).resolve()
+    try:
+        stat = filepath.stat()
+    except OSError:
+        return None
+    return (str(filepath), *_stat_key(stat))
+
+
+def open_upload_cache() -> Union[UploadCache, None]:
+    """Open the upload cache in the datalight cache directory. If the cache cannot be opened a
+    warning is logged and None is returned, as uploads work without it."""
+    cache_path = common.get_cache_dir() / CACHE_FILE_NAME
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        return UploadCache(cache_path)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Could not open the upload cache {cache_path}: {e}")
+        return None
+
+
+def close_upload_cache(upload_cache: Union[UploadCache, None]):
+    """Close a cache opened by :func:`open_upload_cache`, compacting it first if it has grown
+    past its limits. Errors are logged and ignored."""
+    if upload_cache is None:
+        return
+    try:
+        upload_cache.compact()
+    except sqlite3.Error as e:
+        logger.warning(f"Could not compact the upload cache {upload_cache.cache_path}: {e}")
+    upload_cache.close()
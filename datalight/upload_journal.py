@@ -0,0 +1,127 @@
+"""This module keeps a local journal of uploads so that a failed upload can be resumed."""
+
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, List, Union
+
+from datalight.common import logger
+
+# The journal is stored alongside the datalight config file.
+JOURNAL_FILE_NAME = "datalight_journal.sqlite"
+
+FILE_PENDING = "pending"
+FILE_UPLOADED = "uploaded"
+FILE_FAILED = "failed"
+
+
+class JournalEntry:
+    """The journalled state of one file in a deposition."""
+    def __init__(self, path: str, name: str, size: int, mtime: float, checksum: str,
+                 state: str):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.checksum = checksum
+        self.state = state
+
+    def matches(self, filepath: pathlib.Path) -> bool:
+        """Return True if the file at `filepath` is unchanged since it was journalled."""
+        try:
+            stat = filepath.stat()
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+
+class UploadJournal:
+    """A SQLite record of the depositions being uploaded and the state of each file in them.
+
+    The journal may be written to by several upload threads at once so all access to the
+    database connection is serialised by a lock.
+    """
+    def __init__(self, journal_path: Union[pathlib.Path, str]):
+        """
+        :param journal_path: The path of the SQLite database file. It is created if it does
+          not exist.
+        """
+        self.journal_path = pathlib.Path(journal_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.journal_path), check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS depositions ("
+                                     "deposition_id INTEGER PRIMARY KEY, "
+                                     "bucket_url TEXT NOT NULL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                     "deposition_id INTEGER NOT NULL, "
+                                     "path TEXT NOT NULL, "
+                                     "name TEXT NOT NULL, "
+                                     "size INTEGER, "
+                                     "mtime REAL, "
+                                     "checksum TEXT, "
+                                     "state TEXT NOT NULL, "
+                                     "PRIMARY KEY (deposition_id, path))")
+
+    def start_deposition(self, deposition_id: int, bucket_url: str):
+        """Record that files are being uploaded to the bucket of a deposition."""
+        logger.info(f"Journalling upload of deposition {deposition_id} to {self.journal_path}")
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO depositions VALUES (?, ?)",
+                                     (deposition_id, bucket_url))
+
+    def add_files(self, deposition_id: int, filepaths: List[str]):
+        """Record files as waiting to be uploaded. Files already in the journal are left
+        unchanged."""
+        rows = [(deposition_id, str(pathlib.Path(path).resolve()), pathlib.Path(path).name,
+                 FILE_PENDING) for path in filepaths]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO files "
+                                         "(deposition_id, path, name, state) "
+                                         "VALUES (?, ?, ?, ?)", rows)
+
+    def set_file_state(self, deposition_id: int, filepath: str, state: str,
+                       checksum: str = None, stat: os.stat_result = None):
+        """Record the upload state of a file along with its size and modification time.
+        :param deposition_id: The deposition the file belongs to.
+        :param filepath: The local path of the file.
+        :param state: The upload state of the file.
+        :param checksum: The MD5 checksum of the file if it has been uploaded.
+        :param stat: The result of os.stat on the file from before it was read for the upload.
+          If the file was changed during the upload, this no longer matches the file, so the
+          upload is not trusted when resuming. If not given, the file is stat'ed now.
+        """
+        filepath = pathlib.Path(filepath).resolve()
+        if stat is None:
+            stat = filepath.stat()
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (deposition_id, str(filepath), filepath.name, stat.st_size,
+                                      stat.st_mtime, checksum, state))
+
+    def get_files(self, deposition_id: int) -> Dict[str, JournalEntry]:
+        """Return the journalled files of a deposition, keyed by their resolved local path."""
+        with self._lock:
+            rows = self._connection.execute("SELECT path, name, size, mtime, checksum, state "
+                                            "FROM files WHERE deposition_id = ?",
+                                            (deposition_id,)).fetchall()
+        return {row[0]: JournalEntry(*row) for row in rows}
+
+    def finish_deposition(self, deposition_id: int):
+        """Remove a deposition from the journal once it no longer needs to be resumed."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM files WHERE deposition_id = ?",
+                                     (deposition_id,))
+            self._connection.execute("DELETE FROM depositions WHERE deposition_id = ?",
+                                     (deposition_id,))
+
+    def close(self):
+        """Close the connection to the journal database."""
+        self._connection.close()
+
+    def __enter__(self) -> "UploadJournal":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,219 @@
+"""This module describes the things which are uploaded as single files in a deposition."""
+
+import abc
+import hashlib
+import io
+import json
+import pathlib
+from typing import BinaryIO, List, Union
+
+from datalight import archive, common
+from datalight.common import DatalightException, logger
+
+# Files smaller than this are packed into archives by default.
+DEFAULT_PACKING_THRESHOLD = 2 ** 20
+# The default maximum size of each archive of packed files.
+DEFAULT_MAX_PACKED_ARCHIVE_SIZE = 2 ** 30
+
+
+class UploadSource(abc.ABC):
+    """Something that is uploaded as one file in a deposition bucket.
+    :ivar name: The name of the file in the bucket.
+    :ivar path: The local path the upload is made from, or None if it is not made from a single
+      local file or folder.
+    :ivar size: The number of bytes that will be uploaded. If `exact_size` is False this is an
+      upper estimate.
+    :ivar exact_size: Whether `size` is exactly the number of bytes that will be uploaded.
+    """
+    def __init__(self, name: str, path: pathlib.Path, size: int, exact_size: bool = True):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.exact_size = exact_size
+
+    @abc.abstractmethod
+    def open(self) -> BinaryIO:
+        """Return a binary stream of the data to upload. The stream can seek to its start."""
+
+    def get_md5(self) -> str:
+        """Return the MD5 checksum of the data that would be uploaded."""
+        md5 = hashlib.md5()
+        with self.open() as stream:
+            for chunk in iter(lambda: stream.read(archive.CHUNK_SIZE), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+
+class FileSource(UploadSource):
+    """A single file uploaded as it is."""
+    def __init__(self, path: Union[pathlib.Path, str]):
+        path = pathlib.Path(path)
+        super().__init__(path.name, path, path.stat().st_size)
+
+    def open(self) -> BinaryIO:
+        return open(self.path, 'rb')
+
+    def get_md5(self) -> str:
+        return common.get_md5(self.path)
+
+
+class ArchiveSource(UploadSource):
+    """A folder uploaded as a tar archive which is generated while it is being uploaded, so the
+    archive is never written to disk. If the archive is compressed its size is not known until
+    it has been generated."""
+    def __init__(self, path: Union[pathlib.Path, str], compression: str = None):
+        """
+        :param path: The folder to archive.
+        :param compression: The compression to apply to the archive, None, "gzip" or "zstd".
+        """
+        path = pathlib.Path(path)
+        self.compression = compression
+        self.members = archive.list_folder(path)
+        tar_size = len(archive.TarStream(self.members))
+        name = path.name + archive.COMPRESSION_SUFFIXES[compression]
+        super().__init__(name, path, tar_size, exact_size=compression is None)
+
+    def open(self) -> BinaryIO:
+        stream = archive.TarStream(self.members)
+        if self.compression:
+            return archive.CompressedReader(stream, self.compression)
+        return stream
+
+
+class PackedSource(UploadSource):
+    """Many small files uploaded together as one uncompressed tar archive which is generated
+    while it is being uploaded. The archive is not compressed so that the offsets listed in
+    the packing index can be used to read single files straight out of it."""
+    def __init__(self, name: str, sources: List[FileSource]):
+        """
+        :param name: The name of the archive in the bucket.
+        :param sources: The files to pack. Each is stored under its bucket name.
+        """
+        self.members = [archive.ArchiveMember(source.path, source.name, source.path.stat())
+                        for source in sources]
+        super().__init__(name, None, len(archive.TarStream(self.members)))
+
+    def open(self) -> BinaryIO:
+        return archive.TarStream(self.members)
+
+
+class BytesSource(UploadSource):
+    """Data generated in memory and uploaded as a file."""
+    def __init__(self, name: str, data: bytes):
+        self.data = data
+        super().__init__(name, None, len(data))
+
+    def open(self) -> BinaryIO:
+        return io.BytesIO(self.data)
+
+
+class PackingPolicy:
+    """Decides which files are packed together into archives rather than being uploaded
+    individually. Each upload costs at least one API request, so when a record has many
+    small files it is much faster to upload them in a few archives.
+
+    Packed files are listed in an index file which is uploaded alongside the archives. For
+    each packed file the index gives the archive it is in, the offset of its data from the
+    start of the archive and its size.
+    """
+    def __init__(self, size_threshold: int = DEFAULT_PACKING_THRESHOLD,
+                 max_archive_size: int = DEFAULT_MAX_PACKED_ARCHIVE_SIZE, min_files: int = 3,
+                 archive_prefix: str = "packed_files"):
+        """
+        :param size_threshold: Files smaller than this many bytes are packed.
+        :param max_archive_size: Start a new archive once an archive reaches this many bytes.
+        :param min_files: Files are only packed if at least this many are below the
+          threshold. Packing fewer files does not save any requests as the index is uploaded
+          too.
+        :param archive_prefix: The start of the names of the archives and the index file.
+        """
+        self.size_threshold = size_threshold
+        self.max_archive_size = max_archive_size
+        self.min_files = min_files
+        self.archive_prefix = archive_prefix
+
+    def pack(self, sources: List[UploadSource]) -> List[UploadSource]:
+        """Replace the small files in `sources` with archives of them and an index file
+        describing the archives. Other sources are returned unchanged.
+        :raises DatalightException: If the name of an archive or the index is already used by
+          an upload in `sources`.
+        """
+        small_files = [source for source in sources
+                       if isinstance(source, FileSource) and source.size < self.size_threshold]
+        if len(small_files) < self.min_files:
+            return sources
+        packed = set(small_files)
+        remaining = [source for source in sources if source not in packed]
+
+        groups = [[]]
+        group_size = 0
+        for source in small_files:
+            if groups[-1] and group_size + source.size > self.max_archive_size:
+                groups.append([])
+                group_size = 0
+            groups[-1].append(source)
+            group_size += source.size
+
+        archives = [PackedSource(f"{self.archive_prefix}_{number}.tar", group)
+                    for number, group in enumerate(groups, start=1)]
+        index = BytesSource(f"{self.archive_prefix}_index.json", _get_packing_index(archives))
+
+        remaining_names = {source.name for source in remaining}
+        for source in archives + [index]:
+            if source.name in remaining_names:
+                raise DatalightException(f'Cannot pack files into "{source.name}" as a file '
+                                         f'with that name is already being uploaded.')
+        logger.info(f"Packed {len(small_files)} files smaller than {self.size_threshold} "
+                    f"bytes into {len(archives)} archives.")
+        return remaining + archives + [index]
+
+
+def _get_packing_index(archives: List[PackedSource]) -> bytes:
+    """Return a JSON index listing where each file packed in `archives` is stored."""
+    files = []
+    for packed_archive in archives:
+        tar_stream = archive.TarStream(packed_archive.members)
+        for member, offset in zip(tar_stream.members, tar_stream.get_member_offsets()):
+            files.append({"name": member.arcname, "archive": packed_archive.name,
+                          "offset": offset, "size": member.size})
+    return json.dumps({"files": files}, indent=1).encode("utf-8")
+
+
+def check_unique_names(sources: List[UploadSource]):
+    """Check that no two uploads have the same name. Zenodo buckets are flat, so files with
+    the same name in different folders would overwrite each other.
+    :raises DatalightException: If any names are used more than once.
+    """
+    paths_by_name = {}
+    for source in sources:
+        paths_by_name.setdefault(source.name, []).append(str(source.path))
+    duplicates = {name: paths for name, paths in paths_by_name.items() if len(paths) > 1}
+    if duplicates:
+        examples = "; ".join(f'"{name}" from {", ".join(paths)}'
+                             for name, paths in list(duplicates.items())[:5])
+        raise DatalightException(f"{len(duplicates)} file names would be uploaded more than "
+                                 f"once, so the files would overwrite each other in the "
+                                 f"deposition. Rename the files or upload their folders as "
+                                 f"archives. {examples}")
+
+
+def get_upload_sources(paths: List[Union[pathlib.Path, str]], archive_compression: str = None,
+                       packing_policy: PackingPolicy = None) -> List[UploadSource]:
+    """Return an UploadSource for each path. Files are uploaded as they are and folders are
+    uploaded as archives.
+    :param paths: The paths of files and folders to upload.
+    :param archive_compression: The compression to apply to folder archives.
+    :param packing_policy: If provided, small files are packed into archives according to this
+      policy.
+    :raises DatalightException: If two of the paths would be uploaded with the same name.
+    """
+    sources = []
+    for path in paths:
+        if pathlib.Path(path).is_dir():
+            sources.append(ArchiveSource(path, archive_compression))
+        else:
+            sources.append(FileSource(path))
+    check_unique_names(sources)
+    if packing_policy:
+        sources = packing_policy.pack(sources)
+    return sources
@@ -1,41 +1,184 @@
 """This module is implements high level functions to upload and download data to Zenodo."""
 
+import concurrent.futures
 import json
+import os
 import pathlib
-from typing import List, Union, Tuple
+import threading
+import time
+from typing import Dict, List, Union, Tuple, TYPE_CHECKING
 import tempfile
 
-import requests
-import yaml
-
 import datalight.zenodo_metadata as zenodo_metadata
-from datalight import common
-from datalight.common import logger, UploadStatus
+from datalight import common, progress, upload_cache, upload_journal
+from datalight.common import (logger, get_yaml_loader, DatalightException, UploadCancelled,
+                              UploadStatus)
+from datalight.progress import ProgressCallback
+from datalight.retry import RateLimiter, RetryPolicy, get_bandwidth_limiter, get_server_delay
+from datalight.scheduler import UploadScheduler
+from datalight.streaming import CancellableReader, ChunkedBody, HashingReader, ThrottledReader
+from datalight.upload_source import (FileSource, PackingPolicy, UploadSource,
+                                     get_upload_sources)
+
+# requests is imported when it is first needed so that importing datalight is fast.
+if TYPE_CHECKING:
+    import requests
 
 STATUS_SUCCESS = [200, 201, 202, 204]
+# Status code given to uploads which were cancelled before they finished.
+STATUS_CANCELLED = 499
+# Status code given to uploads where the data received by Zenodo does not match the local file.
+STATUS_CHECKSUM_MISMATCH = 422
+# Status code given to uploads where the local files cannot be uploaded as they are, for
+# example because two files have the same name.
+STATUS_INVALID_FILES = 400
+
+# The number of pooled connections kept open to each Zenodo host.
+DEFAULT_POOL_SIZE = 10
+# Zenodo allows authenticated users 100 requests per minute.
+DEFAULT_REQUESTS_PER_MINUTE = 100
 
 
 class ZenodoException(Exception):
     """General exception raised when there is some failure to interface with Zenodo."""
 
 
+class ZenodoClient:
+    """A connection to the Zenodo API which is shared by every request in an upload.
+
+    Requests are sent through a single pooled :class:`requests.Session` so TCP and TLS
+    connections are kept alive and reused rather than being set up again for every call.
+    The API token is sent in the Authorization header rather than as a query parameter.
+    Requests which fail due to rate limiting, server errors or dropped connections are retried
+    according to `retry_policy`, and all requests made through the client share `rate_limiter`
+    so that parallel uploads stay under the Zenodo API quota.
+
+    :ivar session: The session used to send requests to Zenodo.
+    :ivar retry_policy: Decides when failed requests are retried.
+    :ivar rate_limiter: Limits the rate requests are sent at.
+    :ivar max_bytes_per_second: The limit on the total rate files are uploaded at, or None.
+    :ivar bandwidth_limiter: Limits the total rate files are uploaded at, or None.
+    :ivar cancel_event: If set, failed requests are no longer retried.
+    """
+    def __init__(self, token: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 retry_policy: RetryPolicy = None,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 max_bytes_per_second: float = None,
+                 cancel_event: threading.Event = None):
+        """
+        :param token: API token for connecting to Zenodo. If this is empty, requests are sent
+          without authentication, which is enough to download public records.
+        :param pool_size: The maximum number of connections to keep open to each host.
+        :param retry_policy: How failed requests are retried. Defaults to RetryPolicy().
+        :param requests_per_minute: The maximum average rate at which requests are sent.
+        :param max_bytes_per_second: If provided, the maximum total rate at which all uploads
+          through this client send data.
+        :param cancel_event: If provided, setting this event from another thread stops any
+          wait before a retry, and the failed response or error is returned straight away.
+        """
+        import requests
+
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.max_bytes_per_second = max_bytes_per_second
+        self.bandwidth_limiter = None
+        if max_bytes_per_second:
+            self.bandwidth_limiter = get_bandwidth_limiter(max_bytes_per_second)
+        self.cancel_event = cancel_event
+
+    def request(self, method: str, url: str, **kwargs) -> "requests.models.Response":
+        """Send an HTTP request to Zenodo using the pooled session, retrying it if it fails
+        with a temporary error. If the request has a seekable body, it is rewound before each
+        retry.
+        :raises requests.exceptions.RequestException: If the connection fails and the
+          request cannot be retried any more.
+        """
+        import requests
+
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                if not self.retry_policy.should_retry(attempt, None):
+                    raise
+                failure = error
+                delay = self.retry_policy.get_delay(attempt)
+                logger.warning(f"{method} {url} failed with '{error}'. "
+                               f"Retrying in {delay:.1f} seconds.")
+            else:
+                server_delay = get_server_delay(response.headers)
+                if response.headers.get("X-RateLimit-Remaining") == "0" and server_delay:
+                    self.rate_limiter.pause(server_delay)
+                if not self.retry_policy.should_retry(attempt, response.status_code):
+                    return response
+                delay = self.retry_policy.get_delay(attempt, response.headers)
+                logger.warning(f"{method} {url} returned status {response.status_code}. "
+                               f"Retrying in {delay:.1f} seconds.")
+                failure = response
+            if self._wait_to_retry(delay):
+                logger.info(f"Not retrying {method} {url} as the operation was cancelled.")
+                if isinstance(failure, Exception):
+                    raise failure
+                return failure
+            attempt += 1
+            body = kwargs.get("data")
+            if hasattr(body, "seek"):
+                body.seek(0)
+
+    def _wait_to_retry(self, delay: float) -> bool:
+        """Wait `delay` seconds before a retry. Return True if the client was cancelled."""
+        if self.cancel_event is None:
+            time.sleep(delay)
+            return False
+        return self.cancel_event.wait(delay)
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self) -> "ZenodoClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def load_yaml(metadata_path: str) -> dict:
     """Method to read metadata from a file.
     :param metadata_path: A path to a file which contains zenodo metadata (yaml format).
     """
+    import yaml
+
     logger.info(f'Metadata read from file: {metadata_path}')
     try:
         with open(metadata_path) as input_file:
-            return yaml.load(input_file, Loader=yaml.FullLoader)
+            return yaml.load(input_file, Loader=get_yaml_loader())
     except FileNotFoundError:
         raise FileNotFoundError(f'Metadata file {metadata_path} not found.')
 
 
 def upload_record(file_paths: List[str], repository_metadata: Union[dict, str],
                   config_path: Union[pathlib.Path, str], experimental_metadata: dict,
-                  publish: bool, sandbox: bool, deposition_ID: int = None) -> UploadStatus:
+                  publish: bool, sandbox: bool, deposition_ID: int = None,
+                  upload_workers: int = 1, resumable: bool = False,
+                  archive_compression: str = None,
+                  packing_policy: PackingPolicy = None,
+                  max_bytes_per_second: float = None,
+                  progress_callback: ProgressCallback = None,
+                  cancel_event: threading.Event = None,
+                  use_upload_cache: bool = True) -> UploadStatus:
     """Run datalight scripts to upload file to data repository
-    :param file_paths: One or more paths of files to upload.
+    :param file_paths: One or more paths of files or folders to upload. Each folder is uploaded
+      as a single tar archive which is generated as it is uploaded.
     :param repository_metadata: Either a path to load metadata from or a dictionary of metadata
       describing the record.
     :param config_path: Path to the file containing zenodo API tokens.
@@ -44,6 +187,27 @@ def upload_record(file_paths: List[str], repository_metadata: Union[dict, str],
     :param publish: Whether to publish this record on Zenodo after uploading.
     :param sandbox: Whether to put the record on Zenodo sandbox or the real Zenodo.
     :param deposition_ID: If provided, an existing Zenodo deposition to amend.
+    :param upload_workers: The maximum number of files to upload at the same time.
+    :param resumable: If True, keep a journal of the upload next to the config file. If the
+      upload fails the deposition is kept rather than deleted and the upload can be resumed
+      by calling this function again with its `deposition_ID`. Files which were already
+      uploaded are then skipped.
+    :param archive_compression: The compression to apply to folder archives. One of None,
+      "gzip" or "zstd".
+    :param packing_policy: If provided, files smaller than the policy's threshold are packed
+      into tar archives, with an index file listing where each file is, so that many small
+      files do not each need their own request.
+    :param max_bytes_per_second: If provided, the maximum total rate at which files are
+      uploaded, so that an upload does not use all of a shared network link.
+    :param progress_callback: If provided, a function which is passed an
+      :class:`datalight.progress.UploadProgress` reporting the bytes sent, upload rate,
+      estimated time remaining and state of each file as the files are uploaded. It is called
+      from the upload threads.
+    :param cancel_event: If provided, setting this event from another thread stops the upload,
+      including transfers in progress, and deletes the deposition.
+    :param use_upload_cache: If True, checksums of uploaded files are kept in the upload cache
+      in the datalight cache directory, so that unchanged files do not need to be hashed again
+      when comparing them with an existing deposition.
     :returns: None if upload successful else returns a string describing the error.
     """
     if isinstance(repository_metadata, str):
@@ -58,10 +222,84 @@ def upload_record(file_paths: List[str], repository_metadata: Union[dict, str],
 
     depositions_url = get_deposition_url(sandbox)
 
-    upload_status = deposit_record(file_paths, repository_metadata, depositions_url,
-                                   token, publish, deposition_ID)
+    journal = None
+    if resumable:
+        journal_path = credentials_location.parent / upload_journal.JOURNAL_FILE_NAME
+        journal = upload_journal.UploadJournal(journal_path)
 
-    return upload_status
+    cache = upload_cache.open_upload_cache() if use_upload_cache else None
+
+    try:
+        # Each upload worker needs its own connection so size the pool to match.
+        with ZenodoClient(token, pool_size=max(upload_workers, DEFAULT_POOL_SIZE),
+                          max_bytes_per_second=max_bytes_per_second,
+                          cancel_event=cancel_event) as client:
+            return deposit_record(file_paths, repository_metadata, depositions_url, client,
+                                  publish, deposition_ID, upload_workers, journal,
+                                  archive_compression, packing_policy, progress_callback,
+                                  cancel_event, cache)
+    finally:
+        if journal:
+            journal.close()
+        upload_cache.close_upload_cache(cache)
+
+
+def upload_new_version(file_paths: List[str], record_ID: int,
+                       config_path: Union[pathlib.Path, str], sandbox: bool,
+                       repository_metadata: Union[dict, str] = None,
+                       experimental_metadata: dict = None, publish: bool = True,
+                       upload_workers: int = 1, resumable: bool = False,
+                       archive_compression: str = None,
+                       packing_policy: PackingPolicy = None,
+                       max_bytes_per_second: float = None,
+                       progress_callback: ProgressCallback = None,
+                       cancel_event: threading.Event = None,
+                       use_upload_cache: bool = True) -> UploadStatus:
+    """Publish a new version of a record, uploading only the files which have been added or
+    changed since the previous version. See :func:`deposit_new_version`.
+    :param file_paths: One or more paths of files or folders making up the new version.
+    :param record_ID: The ID of any published version of the record.
+    :param config_path: Path to the file containing zenodo API tokens.
+    :param sandbox: Whether the record is on Zenodo sandbox or the real Zenodo.
+    :param repository_metadata: If provided, either a path to load metadata from or a
+      dictionary of metadata describing the new version. Otherwise the metadata of the previous
+      version is kept.
+    :param experimental_metadata: A dictionary of experimental metadata - if not None, this will
+      be written to a text file and added to the upload.
+    :param publish: Whether to publish the new version after uploading.
+    The other parameters are the same as for :func:`upload_record`.
+    """
+    if isinstance(repository_metadata, str):
+        repository_metadata = load_yaml(repository_metadata)
+
+    if experimental_metadata:
+        experimental_metadata = ExperimentalMetadata(experimental_metadata)
+        file_paths.append(experimental_metadata.metadata_path)
+
+    credentials_location = pathlib.Path(config_path).resolve()
+    token = common.get_authentication_token(credentials_location, sandbox)
+
+    depositions_url = get_deposition_url(sandbox)
+
+    journal = None
+    if resumable:
+        journal_path = credentials_location.parent / upload_journal.JOURNAL_FILE_NAME
+        journal = upload_journal.UploadJournal(journal_path)
+
+    cache = upload_cache.open_upload_cache() if use_upload_cache else None
+
+    try:
+        with ZenodoClient(token, pool_size=max(upload_workers, DEFAULT_POOL_SIZE),
+                          max_bytes_per_second=max_bytes_per_second,
+                          cancel_event=cancel_event) as client:
+            return deposit_new_version(file_paths, depositions_url, client, record_ID,
+                                       repository_metadata, publish, upload_workers, journal,
+                                       archive_compression, packing_policy, progress_callback,
+                                       cancel_event, cache)
+    finally:
+        if journal:
+            journal.close()
+        upload_cache.close_upload_cache(cache)
 
 
 def get_deposition_url(sandbox: bool):
@@ -97,52 +335,348 @@ class ExperimentalMetadata:
         del self.temp_directory
 
 
-def deposit_record(files: List[str], raw_metadata: dict, deposition_url: str, token: str,
-                   publish: bool, deposition_ID: int) -> UploadStatus:
+def deposit_record(files: List[str], raw_metadata: dict, deposition_url: str,
+                   client: ZenodoClient, publish: bool, deposition_ID: int,
+                   upload_workers: int = 1,
+                   journal: upload_journal.UploadJournal = None,
+                   archive_compression: str = None,
+                   packing_policy: PackingPolicy = None,
+                   progress_callback: ProgressCallback = None,
+                   cancel_event: threading.Event = None,
+                   cache: upload_cache.UploadCache = None) -> UploadStatus:
     """Method which calls the parts of the upload process.
+    :param files: Paths of files or folders to upload. Folders are uploaded as archives.
+    :param journal: If provided, the upload is recorded in this journal and a failed upload
+      keeps the deposition so that it can be resumed.
+    :param archive_compression: The compression to apply to folder archives.
+    :param packing_policy: If provided, small files are packed into archives according to this
+      policy.
+    :param progress_callback: If provided, a function which is passed an
+      :class:`datalight.progress.UploadProgress` as the files are uploaded.
+    :param cancel_event: If provided, setting this event from another thread stops the upload,
+      including transfers in progress, and deletes the deposition.
+    :param cache: If provided, the checksums of uploaded files are recorded in this cache and
+      files which are unchanged since they were cached are not hashed again.
     :returns: An UploadStatus object indicating whether there was an error or if the upload
         was successful."""
     status, checked_metadata = validate_metadata(raw_metadata)
     if status.code not in STATUS_SUCCESS:
         return status
 
-    status = try_connection(deposition_url, token)
+    status, sources = load_upload_sources(files, archive_compression, packing_policy)
     if status.code not in STATUS_SUCCESS:
         return status
 
-    status, upload_details = _get_upload_details(deposition_url, token, deposition_ID)
+    status = try_connection(deposition_url, client)
+    if status.code not in STATUS_SUCCESS:
+        return status
+
+    status, upload_details = _get_upload_details(deposition_url, client, deposition_ID)
     if status.code not in STATUS_SUCCESS:
         return status
 
     deposition_id = upload_details['id']
     upload_url = upload_details['links']["bucket"]
 
-    status = _upload_files(upload_url, token, files)
+    if deposition_ID:
+        sources = remove_unchanged_files(sources, upload_details, journal, cache)
+
+    start_journal(journal, deposition_id, upload_url, sources)
+
+    status = _upload_files(upload_url, client, sources, upload_workers, journal, deposition_id,
+                           progress_callback, cancel_event, cache)
+    if status.code not in STATUS_SUCCESS:
+        return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    status = _upload_metadata(deposition_url, deposition_id, client, checked_metadata)
+    if status.code not in STATUS_SUCCESS:
+        return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    # Check for cancellation one last time as a published record cannot be deleted.
+    if cancel_event and cancel_event.is_set():
+        status = UploadStatus(STATUS_CANCELLED, "The upload was cancelled.")
+        return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    if publish:
+        status = publish_record(deposition_url, deposition_id, client)
+    if status.code not in STATUS_SUCCESS:
+        return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+    else:
+        if journal:
+            journal.finish_deposition(deposition_id)
+        return UploadStatus(200, "Upload Completed successfully", deposition_id=deposition_id)
+
+
+def _abort_deposition(deposition_url: str, deposition_id: int, client: ZenodoClient,
+                      journal: Union[upload_journal.UploadJournal, None],
+                      status: UploadStatus) -> UploadStatus:
+    """Clean up after a failed upload, deleting the deposition unless
+    :func:`keep_failed_deposition` says it should be kept.
+    :param status: The status of the failed step of the upload.
+    :returns: The status of the failed step of the upload.
+    """
+    if not keep_failed_deposition(deposition_id, journal, status):
+        delete_record(deposition_url, deposition_id, client)
+    return status
+
+
+def keep_failed_deposition(deposition_id: int,
+                           journal: Union[upload_journal.UploadJournal, None],
+                           status: UploadStatus) -> bool:
+    """Decide whether to keep a deposition after a failed upload. If the upload is journalled,
+    the deposition is kept so that the upload can be resumed. Otherwise, and if the upload was
+    cancelled, it should be deleted and it is removed from the journal.
+    :param status: The status of the failed step of the upload. If the deposition is kept, its
+      deposition_id is set.
+    :returns: True if the deposition should be kept, False if it should be deleted.
+    """
+    if journal and status.code != STATUS_CANCELLED:
+        logger.warning(f"Upload of deposition {deposition_id} failed. It can be resumed by "
+                       f"uploading again with deposition_ID={deposition_id}.")
+        status.deposition_id = deposition_id
+        return True
+    if journal:
+        journal.finish_deposition(deposition_id)
+    return False
+
+
+def start_journal(journal: Union[upload_journal.UploadJournal, None], deposition_id: int,
+                  upload_url: str, sources: List[UploadSource]):
+    """Record in `journal`, if there is one, that `sources` are about to be uploaded to the
+    deposition. Uploads which are not made from a single local file or folder are not
+    journalled."""
+    if journal:
+        journal.start_deposition(deposition_id, upload_url)
+        journal.add_files(deposition_id, [source.path for source in sources
+                                          if source.path is not None])
+
+
+def deposit_new_version(files: List[str], deposition_url: str, client: ZenodoClient,
+                        record_ID: int, raw_metadata: dict = None, publish: bool = True,
+                        upload_workers: int = 1,
+                        journal: upload_journal.UploadJournal = None,
+                        archive_compression: str = None,
+                        packing_policy: PackingPolicy = None,
+                        progress_callback: ProgressCallback = None,
+                        cancel_event: threading.Event = None,
+                        cache: upload_cache.UploadCache = None) -> UploadStatus:
+    """Create a new version of a published record containing `files`.
+
+    A draft of the new version is created with Zenodo's newversion action, which starts with
+    the files of the previous version. The local files are compared with these by name, size
+    and MD5 checksum. Files which are no longer present locally are deleted from the draft,
+    changed files are replaced and new files are uploaded, so only the differences are sent.
+    :param files: Paths of files or folders making up the new version. Folders are uploaded as
+      archives.
+    :param deposition_url: URL of the Zenodo depositions API.
+    :param client: The connection to Zenodo.
+    :param record_ID: The ID of any published version of the record.
+    :param raw_metadata: If provided, the metadata of the new version. If None, the metadata of
+      the previous version is kept.
+    :param publish: Whether to publish the new version once its files are uploaded.
+    :param journal: If provided, the upload is recorded in this journal and a failed upload
+      keeps the draft so that it can be resumed with :func:`deposit_record`.
+    :param archive_compression: The compression to apply to folder archives.
+    :param packing_policy: If provided, small files are packed into archives according to this
+      policy.
+    :param progress_callback: If provided, a function which is passed an
+      :class:`datalight.progress.UploadProgress` as the files are uploaded.
+    :param cancel_event: If provided, setting this event from another thread stops the upload,
+      including transfers in progress, and deletes the draft.
+    :param cache: If provided, the checksums of uploaded files are recorded in this cache and
+      files which are unchanged since they were cached are not hashed again.
+    :returns: An UploadStatus object indicating whether there was an error or if the upload
+        was successful. Its deposition_id is the ID of the new version.
+    """
+    checked_metadata = None
+    if raw_metadata is not None:
+        status, checked_metadata = validate_metadata(raw_metadata)
+        if status.code not in STATUS_SUCCESS:
+            return status
+
+    status, sources = load_upload_sources(files, archive_compression, packing_policy)
     if status.code not in STATUS_SUCCESS:
-        delete_record(deposition_url, deposition_id, token)
         return status
 
-    status = _upload_metadata(deposition_url, deposition_id, token, checked_metadata)
+    status = try_connection(deposition_url, client)
     if status.code not in STATUS_SUCCESS:
-        delete_record(deposition_url, deposition_id, token)
         return status
 
-    if publish:
-        status = publish_record(deposition_url, deposition_id, token)
+    status, draft_details = _create_new_version(deposition_url, record_ID, client)
     if status.code not in STATUS_SUCCESS:
-        delete_record(deposition_url, deposition_id, token)
         return status
-    else:
-        return UploadStatus(200, "Upload Completed successfully")
 
+    deposition_id = draft_details['id']
+    upload_url = draft_details['links']["bucket"]
+
+    changed_sources = remove_unchanged_files(sources, draft_details, journal, cache)
+    remote_files = {deposition_file["filename"]: deposition_file
+                    for deposition_file in draft_details.get("files", [])}
+    local_names = {source.name for source in sources}
+    removed_files = [remote_file for name, remote_file in remote_files.items()
+                     if name not in local_names]
+    replaced_files = [remote_files[source.name] for source in changed_sources
+                      if source.name in remote_files]
+    logger.info(f"New version {deposition_id} of record {record_ID}: "
+                f"{len(sources) - len(changed_sources)} files unchanged, "
+                f"{len(changed_sources) - len(replaced_files)} added, "
+                f"{len(replaced_files)} changed and {len(removed_files)} removed.")
+
+    # Files copied from the previous version must be deleted before they can be replaced.
+    for remote_file in removed_files + replaced_files:
+        status = _delete_file(remote_file, client)
+        if status.code not in STATUS_SUCCESS:
+            return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    start_journal(journal, deposition_id, upload_url, changed_sources)
+
+    status = _upload_files(upload_url, client, changed_sources, upload_workers, journal,
+                           deposition_id, progress_callback, cancel_event, cache)
+    if status.code not in STATUS_SUCCESS:
+        return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    if checked_metadata is not None:
+        status = _upload_metadata(deposition_url, deposition_id, client, checked_metadata)
+        if status.code not in STATUS_SUCCESS:
+            return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    # Check for cancellation one last time as a published record cannot be deleted.
+    if cancel_event and cancel_event.is_set():
+        status = UploadStatus(STATUS_CANCELLED, "The upload was cancelled.")
+        return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    if publish:
+        status = publish_record(deposition_url, deposition_id, client)
+    if status.code not in STATUS_SUCCESS:
+        return _abort_deposition(deposition_url, deposition_id, client, journal, status)
+    if journal:
+        journal.finish_deposition(deposition_id)
+    return UploadStatus(200, "New version uploaded successfully", deposition_id=deposition_id)
+
+
+def load_upload_sources(files: List[str], archive_compression: str = None,
+                        packing_policy: PackingPolicy = None
+                        ) -> Tuple[UploadStatus, List[UploadSource]]:
+    """Get the uploads to make for `files`, see :func:`datalight.upload_source.get_upload_sources`.
+    :returns: An error status and no uploads if the files cannot be uploaded as they are, for
+      example because two of them have the same name.
+    """
+    try:
+        sources = get_upload_sources(files, archive_compression, packing_policy)
+    except DatalightException as e:
+        logger.error(str(e))
+        return UploadStatus(STATUS_INVALID_FILES, str(e)), []
+    return UploadStatus(200, f"Found {len(sources)} files to upload."), sources
+
+
+def _create_new_version(deposition_url: str, record_ID: int,
+                        client: ZenodoClient) -> Tuple[UploadStatus, dict]:
+    """Create a draft of a new version of a published record and return its details."""
+    response = client.request("POST", f"{deposition_url}/{record_ID}/actions/newversion")
+    status = check_request_response(response)
+    if status.code not in STATUS_SUCCESS:
+        return status, {}
+
+    # The response describes the published record, with a link to the new draft.
+    response = client.request("GET", response.json()["links"]["latest_draft"])
+    status = check_request_response(response)
+    if status.code not in STATUS_SUCCESS:
+        return status, {}
+    return status, response.json()
 
-def try_connection(deposition_url: str, token: str) -> UploadStatus:
+
+def _delete_file(deposition_file: dict, client: ZenodoClient) -> UploadStatus:
+    """Delete a file from an unpublished deposition.
+    :param deposition_file: The description of the file in the deposition returned by Zenodo.
+    """
+    logger.info(f'Deleting file "{deposition_file["filename"]}" from the deposition.')
+    response = client.request("DELETE", deposition_file["links"]["self"])
+    return check_request_response(response)
+
+
+def remove_unchanged_files(sources: List[UploadSource], upload_details: dict,
+                           journal: upload_journal.UploadJournal = None,
+                           cache: upload_cache.UploadCache = None) -> List[UploadSource]:
+    """Remove uploads from `sources` which are already in the deposition with the same size and
+    MD5 checksum. Local checksums are calculated in parallel, and only for files whose size
+    matches the file in the deposition. If the journal records that a file
+    was uploaded and the file has not changed since then, its journalled checksum is used
+    rather than hashing the file again. Likewise, checksums are taken from the upload cache
+    for files which have not changed since they were cached.
+    :param sources: The files and archives to upload.
+    :param upload_details: The description of the existing deposition returned by Zenodo.
+    :param journal: If provided, a journal of previous uploads to the deposition.
+    :param cache: If provided, a cache of the checksums of local files. Files which are hashed
+      are added to it.
+    :returns: The uploads still to be made.
+    """
+    remote_files = {deposition_file["filename"]: deposition_file
+                    for deposition_file in upload_details.get("files", [])}
+    # The API may prefix checksums with the algorithm, as bucket checksums are.
+    remote_checksums = {name: strip_checksum_algorithm(remote_file["checksum"])
+                        for name, remote_file in remote_files.items()}
+    journal_entries = {}
+    if journal:
+        journal_entries = journal.get_files(upload_details["id"])
+
+    local_checksums = {}
+    sources_to_hash = []
+    for source in sources:
+        if source.name not in remote_checksums:
+            continue
+        # A file whose size has changed has changed, so there is no need to hash it.
+        remote_size = remote_files[source.name].get("filesize")
+        if source.exact_size and remote_size is not None and source.size != remote_size:
+            continue
+        # The modification time of a folder does not show changes to the files inside it, so
+        # journalled checksums are only trusted for single files.
+        entry = None
+        if isinstance(source, FileSource):
+            entry = journal_entries.get(str(source.path.resolve()))
+        cached_checksum = None
+        if cache and isinstance(source, FileSource):
+            cached_checksum = cache.get_checksum(source.path)
+        if (entry and entry.state == upload_journal.FILE_UPLOADED
+                and entry.matches(source.path.resolve())):
+            local_checksums[source] = entry.checksum
+        elif cached_checksum:
+            local_checksums[source] = cached_checksum
+        else:
+            sources_to_hash.append(source)
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        local_checksums.update(zip(sources_to_hash,
+                                   executor.map(lambda source: _get_md5(source, cache),
+                                                sources_to_hash)))
+
+    remaining_sources = []
+    for source in sources:
+        if source in local_checksums and local_checksums[source] == remote_checksums[source.name]:
+            logger.info(f'Skipping file "{source.name}", it is already in the deposition.')
+        else:
+            remaining_sources.append(source)
+    return remaining_sources
+
+
+def _get_md5(source: UploadSource, cache: upload_cache.UploadCache = None) -> str:
+    """Return the MD5 checksum of the data `source` uploads, adding it to `cache` if the
+    source is a single file."""
+    if cache is None or not isinstance(source, FileSource):
+        return source.get_md5()
+    stat = source.path.stat()
+    checksum = source.get_md5()
+    cache.set_checksum(source.path, checksum, stat)
+    return checksum
+
+
+def try_connection(deposition_url: str, client: ZenodoClient) -> UploadStatus:
     """Method to test that the API token and connection with Zenodo website is working."""
-    request = requests.get(deposition_url, params={'access_token': token})
-    return _check_request_response(request)
+    request = client.request("GET", deposition_url)
+    return check_request_response(request)
 
 
-def _get_upload_details(deposition_url: str, token: str, deposition_ID : int) -> Tuple[UploadStatus, dict]:
+def _get_upload_details(deposition_url: str, client: ZenodoClient,
+                        deposition_ID: int) -> Tuple[UploadStatus, dict]:
     """Get a dictionary of data about where to upload the files."""
     upload_details = {}
     headers = {'Content-Type': 'application/json'}
@@ -150,45 +684,209 @@ def _get_upload_details(deposition_url: str, token: str, deposition_ID : int) ->
     logger.debug(f'deposition url: {deposition_url}')
     
     if deposition_ID:
-        req_method = requests.get
+        req_method = "GET"
         deposition_url = f"{deposition_url}/{deposition_ID}"
     else:
-        req_method = requests.post
+        req_method = "POST"
 
-    request = req_method(
-        deposition_url,
-        params={'access_token': token}, 
-        json={},
-        headers=headers,
-    )
+    request = client.request(req_method, deposition_url, json={}, headers=headers)
 
-    upload_status = _check_request_response(request)
+    upload_status = check_request_response(request)
     if upload_status.code in STATUS_SUCCESS:
         upload_details = request.json()
     return upload_status, upload_details
 
 
-def _upload_files(upload_url: int, token: str, filepaths: List[str]) -> UploadStatus:
-    """Method to upload a file to Zenodo
-    :param filepaths: Paths of one or more files to upload.
+def strip_checksum_algorithm(checksum: str) -> str:
+    """Zenodo bucket checksums are prefixed with the algorithm, e.g. "md5:<hex digest>".
+    Return just the digest."""
+    return checksum.split(":", 1)[-1]
+
+
+def _upload_files(upload_url: str, client: ZenodoClient, sources: List[UploadSource],
+                  upload_workers: int = 1, journal: upload_journal.UploadJournal = None,
+                  deposition_id: int = None,
+                  progress_callback: ProgressCallback = None,
+                  cancel_event: threading.Event = None,
+                  cache: upload_cache.UploadCache = None) -> UploadStatus:
+    """Method to upload files to Zenodo. Files are uploaded concurrently by a pool of
+    `upload_workers` threads, largest first so that the workers finish at about the same time.
+    If any upload fails, including with an exception, files that have not started uploading are
+    cancelled and the status of the failed upload is returned.
+    :param upload_url: The URL of the bucket to upload the files to.
+    :param client: The connection to Zenodo.
+    :param sources: The files and archives to upload.
+    :param upload_workers: The maximum number of files to upload at the same time.
+    :param journal: If provided, the state of each file is recorded in this journal.
+    :param deposition_id: The deposition the files belong to. Required if `journal` is given.
+    :param progress_callback: If provided, a function which is passed the progress of the
+      upload as it is made.
+    :param cancel_event: If provided, setting this event stops the uploads in progress and
+      cancels those which have not started.
+    :param cache: If provided, the checksum of each file uploaded is added to this cache.
     """
-    for filepath in filepaths:
-        filepath = pathlib.Path(filepath)
-        logger.info(f'Uploading file "{filepath.name}" from {filepath.parent}')
-
-        url = f'{upload_url}/{filepath.name}'
-
-        # Open the file to upload in binary mode and upload it.
-        with open(filepath, 'rb') as input_file:
-            request = requests.put(url, data=input_file, params={'access_token': token})
+    file_statuses: Dict[str, UploadStatus] = {}
+    failed = threading.Event()
+    if cancel_event is None:
+        cancel_event = threading.Event()
+    scheduler = UploadScheduler(sources, upload_workers, client.max_bytes_per_second,
+                                progress_callback)
+
+    def upload_if_not_failed(source: UploadSource) -> UploadStatus:
+        if failed.is_set() or cancel_event.is_set():
+            scheduler.file_finished(source, progress.FILE_CANCELLED)
+            return UploadStatus(STATUS_CANCELLED, f'Upload of "{source.name}" cancelled.')
+        scheduler.file_started(source)
+        try:
+            status = _upload_file(upload_url, client, source, journal, deposition_id,
+                                  scheduler.progress, cancel_event, cache)
+        except UploadCancelled:
+            scheduler.file_finished(source, progress.FILE_CANCELLED)
+            return UploadStatus(STATUS_CANCELLED, f'Upload of "{source.name}" cancelled.')
+        except Exception as e:
+            # Errors such as a connection failing after every retry, or a local file which
+            # cannot be read, fail the upload so that the deposition is cleaned up.
+            message = f'Upload of "{source.name}" failed with {type(e).__name__}: {e}'
+            logger.error(message)
+            scheduler.file_finished(source, progress.FILE_FAILED)
+            failed.set()
+            return UploadStatus(500, message, source.name, str(e))
+        if status.code in STATUS_SUCCESS:
+            scheduler.file_finished(source)
+        else:
+            scheduler.file_finished(source, progress.FILE_FAILED)
+            failed.set()
+        return status
 
-        status = _check_request_response(request)
-        if status.code not in STATUS_SUCCESS:
-            return status
+    scheduler.start()
+    # The executor starts uploads in the order they are submitted.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(upload_workers, 1)) as executor:
+        futures = {executor.submit(upload_if_not_failed, source): source
+                   for source in scheduler.sources}
+        for future in concurrent.futures.as_completed(futures):
+            if future.cancelled():
+                scheduler.file_finished(futures[future], progress.FILE_CANCELLED)
+                continue
+            file_statuses[futures[future].name] = future.result()
+            if failed.is_set() or cancel_event.is_set():
+                for pending in futures:
+                    pending.cancel()
+
+    for name, status in file_statuses.items():
+        logger.debug(f'Upload of "{name}" finished with status {status.code}.')
+
+    failures = [status for status in file_statuses.values()
+                if status.code not in STATUS_SUCCESS and status.code != STATUS_CANCELLED]
+    if failures:
+        return failures[0]
+    if cancel_event.is_set():
+        logger.info("Upload cancelled.")
+        return UploadStatus(STATUS_CANCELLED, "The upload was cancelled.")
     return UploadStatus(200, "All files uploaded successfully.")
 
 
-def _upload_metadata(deposition_url: str, deposition_id: int, token: str,
+def _upload_file(upload_url: str, client: ZenodoClient, source: UploadSource,
+                 journal: upload_journal.UploadJournal = None,
+                 deposition_id: int = None,
+                 progress_tracker: progress.ProgressTracker = None,
+                 cancel_event: threading.Event = None,
+                 cache: upload_cache.UploadCache = None) -> UploadStatus:
+    """Upload a single file or archive to a Zenodo bucket.
+    :param upload_url: The URL of the bucket to upload the file to.
+    :param client: The connection to Zenodo.
+    :param source: The file or archive to upload.
+    :param journal: If provided, the result of the upload is recorded in this journal.
+    :param deposition_id: The deposition the file belongs to. Required if `journal` is given.
+    :param progress_tracker: If provided, the bytes sent are counted in this tracker.
+    :param cancel_event: If provided, setting this event stops the upload.
+    :param cache: If provided, the checksum of a single file is added to this cache once it has
+      been uploaded.
+    :raises UploadCancelled: If the upload is stopped by `cancel_event`.
+    """
+    logger.info(f'Uploading file "{source.name}" from {source.path}')
+
+    url = f'{upload_url}/{source.name}'
+    # The size and modification time are taken before the file is read, so that if the file is
+    # changed during the upload the journal and cache do not match the new contents.
+    file_stat = source.path.stat() if source.path is not None else None
+
+    # Stream the data to upload, calculating its checksum as it is sent. Data whose size is
+    # not known in advance is sent with chunked transfer encoding.
+    with source.open() as input_file:
+        if client.bandwidth_limiter:
+            input_file = ThrottledReader(input_file, client.bandwidth_limiter)
+        if progress_tracker:
+            input_file = progress.ProgressReader(input_file, progress_tracker, source.name)
+        if cancel_event:
+            input_file = CancellableReader(input_file, cancel_event)
+        if source.exact_size:
+            reader = HashingReader(input_file, source.size)
+            request = client.request("PUT", url, data=reader)
+        else:
+            reader = HashingReader(input_file, None)
+            request = client.request("PUT", url, data=ChunkedBody(reader))
+
+    status = check_file_upload(source.name, request, reader.hexdigest("md5"))
+    record_file_upload(source, status, reader.hexdigest("md5"), file_stat, journal,
+                       deposition_id, cache)
+    return status
+
+
+def check_file_upload(file_name: str, response: "requests.models.Response",
+                      local_checksum: str) -> UploadStatus:
+    """Check the response to the upload of a file to a Zenodo bucket, including that the data
+    Zenodo received has the checksum of the data that was sent.
+    :param file_name: The name of the file in the bucket.
+    :param response: The response to the upload.
+    :param local_checksum: The MD5 checksum of the data that was sent.
+    """
+    status = check_request_response(response)
+    if status.code in STATUS_SUCCESS:
+        status = verify_checksum(file_name, local_checksum,
+                                 strip_checksum_algorithm(response.json()["checksum"]))
+    return status
+
+
+def record_file_upload(source: UploadSource, status: UploadStatus, checksum: str,
+                       file_stat: Union[os.stat_result, None],
+                       journal: upload_journal.UploadJournal = None, deposition_id: int = None,
+                       cache: upload_cache.UploadCache = None):
+    """Record the result of an upload in the journal and the upload cache.
+    :param source: The file or archive which was uploaded.
+    :param status: The result of the upload.
+    :param checksum: The MD5 checksum of the data that was sent.
+    :param file_stat: The result of os.stat on the local file or folder from before it was
+      read, or None if the upload was not made from one.
+    :param journal: If provided, the state of the file is recorded in this journal.
+    :param deposition_id: The deposition the file belongs to. Required if `journal` is given.
+    :param cache: If provided, the checksum of a single file is added to this cache if the
+      upload succeeded.
+    """
+    # Uploads which are not made from a single local file or folder, such as packed archives,
+    # are not journalled. When resuming they are compared with the deposition by checksum.
+    if journal and source.path is not None:
+        if status.code in STATUS_SUCCESS:
+            journal.set_file_state(deposition_id, source.path, upload_journal.FILE_UPLOADED,
+                                   checksum, file_stat)
+        else:
+            journal.set_file_state(deposition_id, source.path, upload_journal.FILE_FAILED,
+                                   stat=file_stat)
+    if cache and isinstance(source, FileSource) and status.code in STATUS_SUCCESS:
+        cache.set_checksum(source.path, checksum, file_stat)
+
+
+def verify_checksum(file_name: str, local_checksum: str, remote_checksum: str) -> UploadStatus:
+    """Compare the checksum of the data sent with the checksum Zenodo calculated for the data
+    it received."""
+    if local_checksum != remote_checksum:
+        message = f'Checksum mismatch for uploaded file "{file_name}". The local MD5 is ' \
+                  f'{local_checksum} but Zenodo received data with MD5 {remote_checksum}.'
+        logger.error(message)
+        return UploadStatus(STATUS_CHECKSUM_MISMATCH, message, file_name, message)
+    return UploadStatus(200, f'Checksum of "{file_name}" verified.')
+
+
+def _upload_metadata(deposition_url: str, deposition_id: int, client: ZenodoClient,
                      metadata: dict) -> UploadStatus:
     """Upload metadata to Zenodo repository.
 
@@ -201,13 +899,13 @@ def _upload_metadata(deposition_url: str, deposition_id: int, token: str,
     logger.info(f'url: {url}')
 
     headers = {"Content-Type": "application/json"}
-    request = requests.put(url, params={'access_token': token},
-                           data=json.dumps(metadata), headers=headers)
+    request = client.request("PUT", url, data=json.dumps(metadata), headers=headers)
 
-    return _check_request_response(request)
+    return check_request_response(request)
 
 
-def publish_record(deposition_url: str, deposition_id: int, token: str) -> UploadStatus:
+def publish_record(deposition_url: str, deposition_id: int,
+                   client: ZenodoClient) -> UploadStatus:
     """Method which will publish the deposition linked with the id.
 
     .. warning: After publishing a record it is not possible to delete it.
@@ -216,30 +914,31 @@ def publish_record(deposition_url: str, deposition_id: int, token: str) -> Uploa
     """
 
     publish_url = f'{deposition_url}/{deposition_id}/actions/publish'
-    request = requests.post(publish_url, params={'access_token': token})
+    request = client.request("POST", publish_url)
 
-    return _check_request_response(request)
+    return check_request_response(request)
 
 
-def delete_record(deposition_url: str, deposition_id: int, token: str) -> UploadStatus:
+def delete_record(deposition_url: str, deposition_id: int,
+                  client: ZenodoClient) -> UploadStatus:
     """Method to delete an unpublished deposition.
     If id not provided, use deposition_id, else use provided id
 
     :param deposition_url: URL to make the Zenodo API request.
     :param deposition_id: Deposition id of the record to delete. Record can only be deleted
       if it was not published.
-    :param token: API token for connecting to Zenodo.
+    :param client: The connection to Zenodo.
     """
 
     # Create the request url
     request_url = f'{deposition_url}/{deposition_id}'
 
     logger.info('Delete url: {}'.format(request_url))
-    request = requests.delete(request_url, params={'access_token': token})
-    return _check_request_response(request)
+    request = client.request("DELETE", request_url)
+    return check_request_response(request)
 
 
-def _check_request_response(response: requests.models.Response) -> Union[UploadStatus, None]:
+def check_request_response(response: "requests.models.Response") -> Union[UploadStatus, None]:
     """Check the status code returned from an interaction with the Zenodo API.
 
     :param response: A response to an HTTP request.
@@ -251,7 +950,11 @@ def _check_request_response(response: requests.models.Response) -> Union[UploadS
         message = f'Request succeeded with status code: {response.status_code}'
         return UploadStatus(response.status_code, message)
 
-    content = json.loads(response.text)
+    # Gateways in front of Zenodo answer some errors with an HTML page rather than JSON.
+    try:
+        content = json.loads(response.text)
+    except ValueError:
+        content = response.text
 
     if response.status_code == 400:
         message = f'Request failed with error: {response.status_code}. ' \
@@ -273,20 +976,21 @@ def _check_request_response(response: requests.models.Response) -> Union[UploadS
         message = f'Unclassified error: {response.status_code}. Details: {content}'
 
     logger.error(message)
+    if not isinstance(content, dict) or "status" not in content or "message" not in content:
+        return UploadStatus(response.status_code, response.text or message)
     code = content["status"]
     message = content["message"]
-    if "errors" in content:
-        error_field = content["errors"][0]["field"]
-        error_content = content["errors"][0]["message"]
+    if content.get("errors"):
+        error_field = content["errors"][0].get("field")
+        error_content = content["errors"][0].get("message")
         return UploadStatus(code, message, error_field, error_content)
     return UploadStatus(code, message)
 
 
 def validate_metadata(raw_metadata: dict) -> Tuple[UploadStatus, dict]:
     """Compare the metadata to the schema and remove anything not allowed by Zenodo."""
-    schema = zenodo_metadata.read_schema_from_file()
     try:
-        validated_metadata = zenodo_metadata.validate_metadata(raw_metadata, schema)
+        validated_metadata = zenodo_metadata.validate_metadata(raw_metadata)
     except zenodo_metadata.ZenodoMetadataException as e:
         upload_status = UploadStatus(401, str(e))
         checked_metadata = {}
@@ -294,3 +998,13 @@ def validate_metadata(raw_metadata: dict) -> Tuple[UploadStatus, dict]:
         upload_status = UploadStatus(200, "Metadata successfully validated.")
         checked_metadata = {'metadata': validated_metadata}
     return upload_status, checked_metadata
+
+
+def validate_many(raw_metadata_records: List[dict]) -> List[Tuple[UploadStatus, dict]]:
+    """Validate many metadata records, for example before submitting them in bulk. Each record
+    is validated in the same way as by `validate_metadata` but the compiled schema is shared
+    between records.
+    :returns: A status and the checked metadata for each record, in the same order as
+      `raw_metadata_records`.
+    """
+    return [validate_metadata(raw_metadata) for raw_metadata in raw_metadata_records]
@@ -0,0 +1,410 @@
+"""This module implements the Zenodo upload process with asyncio so that uploads can run inside
+an event loop without blocking it. Many depositions can be driven at once from a single thread.
+
+This module requires the optional dependency aiohttp which can be installed with
+``pip install datalight[async]``.
+"""
+
+import asyncio
+import json
+import threading
+from typing import AsyncIterator, Callable, List, Tuple
+
+from datalight import progress, upload_cache, upload_journal, zenodo
+from datalight.common import logger, UploadCancelled, UploadStatus
+from datalight.progress import ProgressCallback
+from datalight.retry import RateLimiter, RetryPolicy, get_bandwidth_limiter, get_server_delay
+from datalight.scheduler import UploadScheduler
+from datalight.streaming import HashingReader
+from datalight.upload_source import PackingPolicy, UploadSource
+from datalight.zenodo import STATUS_CANCELLED, STATUS_SUCCESS
+
+# The size of the chunks files are read and sent in.
+CHUNK_SIZE = 2 ** 20
+# How often in seconds a cancel event is checked while waiting to retry a request.
+CANCEL_CHECK_INTERVAL = 0.1
+
+
+class AsyncResponse:
+    """The parts of a response that are used to check the result of a request. This has the
+    same attributes as the :class:`requests.Response` used by the synchronous client so
+    responses can be checked with the same code."""
+    def __init__(self, status_code: int, text: str, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncZenodoClient:
+    """An asyncio connection to the Zenodo API which is shared by every request in an upload.
+
+    This is the asyncio equivalent of :class:`datalight.zenodo.ZenodoClient`. It keeps a pool of
+    connections open, sends the API token in the Authorization header, retries requests which
+    fail with temporary errors and limits the rate requests are sent at.
+
+    The client must be used as an async context manager, or be closed with :meth:`close`.
+    """
+    def __init__(self, token: str, pool_size: int = zenodo.DEFAULT_POOL_SIZE,
+                 retry_policy: RetryPolicy = None,
+                 requests_per_minute: float = zenodo.DEFAULT_REQUESTS_PER_MINUTE,
+                 max_bytes_per_second: float = None,
+                 cancel_event: threading.Event = None):
+        """
+        :param token: API token for connecting to Zenodo. If this is empty, requests are sent
+          without authentication, which is enough to download public records.
+        :param pool_size: The maximum number of connections to keep open.
+        :param retry_policy: How failed requests are retried. Defaults to RetryPolicy().
+        :param requests_per_minute: The maximum average rate at which requests are sent.
+        :param max_bytes_per_second: If provided, the maximum total rate at which all uploads
+          through this client send data.
+        :param cancel_event: If provided, setting this event stops any wait before a retry,
+          and the failed response or error is returned straight away.
+        """
+        import aiohttp
+
+        headers = {}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        self.session = aiohttp.ClientSession(headers=headers,
+                                             connector=aiohttp.TCPConnector(limit=pool_size))
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.max_bytes_per_second = max_bytes_per_second
+        self.bandwidth_limiter = None
+        if max_bytes_per_second:
+            self.bandwidth_limiter = get_bandwidth_limiter(max_bytes_per_second)
+        self.cancel_event = cancel_event
+
+    async def request(self, method: str, url: str,
+                      body_factory: Callable[[], AsyncIterator[bytes]] = None,
+                      **kwargs) -> AsyncResponse:
+        """Send an HTTP request to Zenodo, retrying it if it fails with a temporary error. If
+        `cancel_event` is set while waiting to retry, the last failure is returned.
+        :param method: The HTTP method of the request.
+        :param url: The URL to send the request to.
+        :param body_factory: If provided, a function returning an async iterator of the chunks
+          of the request body. It is called again for each retry so the body can be resent.
+        :param kwargs: Other arguments are passed to :meth:`aiohttp.ClientSession.request`.
+        :raises aiohttp.ClientError: If the connection fails and the request cannot be retried
+          any more.
+        :raises UploadCancelled: If the body iterator raises UploadCancelled.
+        """
+        import aiohttp
+
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self.rate_limiter.reserve()
+
+            if body_factory is not None:
+                kwargs["data"] = body_factory()
+            try:
+                async with self.session.request(method, url, **kwargs) as raw_response:
+                    response = AsyncResponse(raw_response.status, await raw_response.text(),
+                                             raw_response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                # aiohttp reports errors raised while sending the body as connection errors.
+                # A body which was cancelled is not retried.
+                if isinstance(error.__cause__, UploadCancelled):
+                    raise error.__cause__
+                if not self.retry_policy.should_retry(attempt, None):
+                    raise
+                failure = error
+                delay = self.retry_policy.get_delay(attempt)
+                logger.warning(f"{method} {url} failed with '{error}'. "
+                               f"Retrying in {delay:.1f} seconds.")
+            else:
+                server_delay = get_server_delay(response.headers)
+                if response.headers.get("X-RateLimit-Remaining") == "0" and server_delay:
+                    self.rate_limiter.pause(server_delay)
+                if not self.retry_policy.should_retry(attempt, response.status_code):
+                    return response
+                delay = self.retry_policy.get_delay(attempt, response.headers)
+                logger.warning(f"{method} {url} returned status {response.status_code}. "
+                               f"Retrying in {delay:.1f} seconds.")
+                failure = response
+            if await self._wait_to_retry(delay):
+                logger.info(f"Not retrying {method} {url} as the operation was cancelled.")
+                if isinstance(failure, Exception):
+                    raise failure
+                return failure
+            attempt += 1
+
+    async def _wait_to_retry(self, delay: float) -> bool:
+        """Wait `delay` seconds before a retry. Return True if the client was cancelled."""
+        if self.cancel_event is None:
+            await asyncio.sleep(delay)
+            return False
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + delay
+        while not self.cancel_event.is_set():
+            remaining = end_time - loop.time()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(remaining, CANCEL_CHECK_INTERVAL))
+        return True
+
+    async def close(self):
+        """Close all pooled connections."""
+        await self.session.close()
+
+    async def __aenter__(self) -> "AsyncZenodoClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def deposit_record(files: List[str], raw_metadata: dict, deposition_url: str,
+                         client: AsyncZenodoClient, publish: bool, deposition_ID: int = None,
+                         upload_workers: int = 1,
+                         journal: upload_journal.UploadJournal = None,
+                         archive_compression: str = None,
+                         packing_policy: PackingPolicy = None,
+                         progress_callback: ProgressCallback = None,
+                         cancel_event: threading.Event = None,
+                         cache: upload_cache.UploadCache = None) -> UploadStatus:
+    """The asyncio equivalent of :func:`datalight.zenodo.deposit_record`, which takes the same
+    arguments. Each step which is the same for both clients, such as comparing local files
+    with the deposition and recording the upload in the journal, is shared with it.
+
+    The journal and the upload cache are SQLite databases, and are used from the executor so
+    that the event loop is not blocked. The upload can also be stopped by cancelling the task
+    running this coroutine, in which case the deposition is not deleted.
+    :returns: An UploadStatus object indicating whether there was an error or if the upload
+        was successful."""
+    status, checked_metadata = zenodo.validate_metadata(raw_metadata)
+    if status.code not in STATUS_SUCCESS:
+        return status
+
+    # Listing folders and hashing local files is blocking work so do it outside of the event
+    # loop.
+    loop = asyncio.get_running_loop()
+    status, sources = await loop.run_in_executor(None, zenodo.load_upload_sources, files,
+                                                 archive_compression, packing_policy)
+    if status.code not in STATUS_SUCCESS:
+        return status
+
+    status = await try_connection(deposition_url, client)
+    if status.code not in STATUS_SUCCESS:
+        return status
+
+    status, upload_details = await _get_upload_details(deposition_url, client, deposition_ID)
+    if status.code not in STATUS_SUCCESS:
+        return status
+
+    deposition_id = upload_details['id']
+    upload_url = upload_details['links']["bucket"]
+
+    if deposition_ID:
+        sources = await loop.run_in_executor(None, zenodo.remove_unchanged_files, sources,
+                                             upload_details, journal, cache)
+
+    await loop.run_in_executor(None, zenodo.start_journal, journal, deposition_id, upload_url,
+                               sources)
+
+    status = await _upload_files(upload_url, client, sources, upload_workers, journal,
+                                 deposition_id, progress_callback, cancel_event, cache)
+    if status.code not in STATUS_SUCCESS:
+        return await _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    status = await _upload_metadata(deposition_url, deposition_id, client, checked_metadata)
+    if status.code not in STATUS_SUCCESS:
+        return await _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    # Check for cancellation one last time as a published record cannot be deleted.
+    if cancel_event and cancel_event.is_set():
+        status = UploadStatus(STATUS_CANCELLED, "The upload was cancelled.")
+        return await _abort_deposition(deposition_url, deposition_id, client, journal, status)
+
+    if publish:
+        status = await publish_record(deposition_url, deposition_id, client)
+    if status.code not in STATUS_SUCCESS:
+        return await _abort_deposition(deposition_url, deposition_id, client, journal, status)
+    else:
+        if journal:
+            await loop.run_in_executor(None, journal.finish_deposition, deposition_id)
+        return UploadStatus(200, "Upload Completed successfully", deposition_id=deposition_id)
+
+
+async def _abort_deposition(deposition_url: str, deposition_id: int, client: AsyncZenodoClient,
+                            journal: upload_journal.UploadJournal,
+                            status: UploadStatus) -> UploadStatus:
+    """Clean up after a failed upload, deleting the deposition unless
+    :func:`datalight.zenodo.keep_failed_deposition` says it should be kept.
+    :param status: The status of the failed step of the upload.
+    :returns: The status of the failed step of the upload.
+    """
+    keep = await asyncio.get_running_loop().run_in_executor(
+        None, zenodo.keep_failed_deposition, deposition_id, journal, status)
+    if not keep:
+        await delete_record(deposition_url, deposition_id, client)
+    return status
+
+
+async def try_connection(deposition_url: str, client: AsyncZenodoClient) -> UploadStatus:
+    """Test that the API token and connection with Zenodo website is working."""
+    response = await client.request("GET", deposition_url)
+    return zenodo.check_request_response(response)
+
+
+async def _get_upload_details(deposition_url: str, client: AsyncZenodoClient,
+                              deposition_ID: int) -> Tuple[UploadStatus, dict]:
+    """Get a dictionary of data about where to upload the files."""
+    upload_details = {}
+    if deposition_ID:
+        response = await client.request("GET", f"{deposition_url}/{deposition_ID}")
+    else:
+        response = await client.request("POST", deposition_url, json={})
+
+    upload_status = zenodo.check_request_response(response)
+    if upload_status.code in STATUS_SUCCESS:
+        upload_details = response.json()
+    return upload_status, upload_details
+
+
+async def _upload_files(upload_url: str, client: AsyncZenodoClient,
+                        sources: List[UploadSource], upload_workers: int = 1,
+                        journal: upload_journal.UploadJournal = None,
+                        deposition_id: int = None,
+                        progress_callback: ProgressCallback = None,
+                        cancel_event: threading.Event = None,
+                        cache: upload_cache.UploadCache = None) -> UploadStatus:
+    """Upload files to Zenodo with up to `upload_workers` files being sent at once, largest
+    first. If any upload fails, including with an exception, or `cancel_event` is set, the
+    uploads still in progress are cancelled and the status of the failed upload is returned.
+    The arguments are the same as for :func:`deposit_record`."""
+    semaphore = asyncio.Semaphore(max(upload_workers, 1))
+    scheduler = UploadScheduler(sources, upload_workers, client.max_bytes_per_second,
+                                progress_callback)
+
+    async def upload_with_limit(source: UploadSource) -> UploadStatus:
+        try:
+            async with semaphore:
+                if cancel_event and cancel_event.is_set():
+                    raise UploadCancelled()
+                scheduler.file_started(source)
+                status = await _upload_file(upload_url, client, source, journal, deposition_id,
+                                            scheduler.progress, cancel_event, cache)
+        except UploadCancelled:
+            scheduler.file_finished(source, progress.FILE_CANCELLED)
+            return UploadStatus(STATUS_CANCELLED, f'Upload of "{source.name}" cancelled.')
+        except asyncio.CancelledError:
+            scheduler.file_finished(source, progress.FILE_CANCELLED)
+            raise
+        except Exception as e:
+            # Errors such as a connection failing after every retry, or a local file which
+            # cannot be read, fail the upload so that the deposition is cleaned up.
+            message = f'Upload of "{source.name}" failed with {type(e).__name__}: {e}'
+            logger.error(message)
+            scheduler.file_finished(source, progress.FILE_FAILED)
+            return UploadStatus(500, message, source.name, str(e))
+        if status.code in STATUS_SUCCESS:
+            scheduler.file_finished(source)
+        else:
+            scheduler.file_finished(source, progress.FILE_FAILED)
+        return status
+
+    scheduler.start()
+    # Waiting tasks acquire the semaphore in the order they were created.
+    tasks = [asyncio.ensure_future(upload_with_limit(source)) for source in scheduler.sources]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            status = await next_done
+            if status.code not in STATUS_SUCCESS:
+                if status.code == STATUS_CANCELLED:
+                    logger.info("Upload cancelled.")
+                    return UploadStatus(STATUS_CANCELLED, "The upload was cancelled.")
+                return status
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return UploadStatus(200, "All files uploaded successfully.")
+
+
+async def _upload_file(upload_url: str, client: AsyncZenodoClient, source: UploadSource,
+                       journal: upload_journal.UploadJournal = None,
+                       deposition_id: int = None,
+                       progress_tracker: progress.ProgressTracker = None,
+                       cancel_event: threading.Event = None,
+                       cache: upload_cache.UploadCache = None) -> UploadStatus:
+    """Upload a single file or archive to a Zenodo bucket. The data is streamed in chunks and its
+    checksum is calculated as it is sent and compared with the checksum Zenodo reports. The
+    arguments are the same as for :func:`deposit_record`.
+    :raises UploadCancelled: If the upload is stopped by `cancel_event`.
+    """
+    logger.info(f'Uploading file "{source.name}" from {source.path}')
+    url = f'{upload_url}/{source.name}'
+    headers = {}
+    if source.exact_size:
+        headers["Content-Length"] = str(source.size)
+
+    loop = asyncio.get_running_loop()
+    # The size and modification time are taken before the file is read, so that if the file is
+    # changed during the upload the journal and cache do not match the new contents.
+    file_stat = None
+    if source.path is not None:
+        file_stat = await loop.run_in_executor(None, source.path.stat)
+
+    with source.open() as input_file:
+        if progress_tracker:
+            input_file = progress.ProgressReader(input_file, progress_tracker, source.name)
+        reader = HashingReader(input_file, source.size if source.exact_size else None)
+
+        async def file_chunks() -> AsyncIterator[bytes]:
+            reader.seek(0)
+            while True:
+                if cancel_event and cancel_event.is_set():
+                    raise UploadCancelled()
+                # Read from disk in the executor so the event loop is not blocked.
+                chunk = await loop.run_in_executor(None, reader.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                if client.bandwidth_limiter:
+                    wait = client.bandwidth_limiter.reserve(len(chunk))
+                    while wait:
+                        await asyncio.sleep(wait)
+                        wait = client.bandwidth_limiter.reserve(len(chunk))
+                yield chunk
+
+        response = await client.request("PUT", url, body_factory=file_chunks, headers=headers)
+
+    status = zenodo.check_file_upload(source.name, response, reader.hexdigest("md5"))
+    await loop.run_in_executor(None, zenodo.record_file_upload, source, status,
+                               reader.hexdigest("md5"), file_stat, journal, deposition_id, cache)
+    return status
+
+
+async def _upload_metadata(deposition_url: str, deposition_id: int, client: AsyncZenodoClient,
+                           metadata: dict) -> UploadStatus:
+    """Upload metadata to Zenodo repository."""
+    url = f'{deposition_url}/{deposition_id}'
+    headers = {"Content-Type": "application/json"}
+    response = await client.request("PUT", url, data=json.dumps(metadata), headers=headers)
+    return zenodo.check_request_response(response)
+
+
+async def publish_record(deposition_url: str, deposition_id: int,
+                         client: AsyncZenodoClient) -> UploadStatus:
+    """Publish the deposition linked with the id.
+
+    .. warning: After publishing a record it is not possible to delete it.
+    """
+    publish_url = f'{deposition_url}/{deposition_id}/actions/publish'
+    response = await client.request("POST", publish_url)
+    return zenodo.check_request_response(response)
+
+
+async def delete_record(deposition_url: str, deposition_id: int,
+                        client: AsyncZenodoClient) -> UploadStatus:
+    """Delete an unpublished deposition."""
+    request_url = f'{deposition_url}/{deposition_id}'
+    logger.info('Delete url: {}'.format(request_url))
+    response = await client.request("DELETE", request_url)
+    return zenodo.check_request_response(response)
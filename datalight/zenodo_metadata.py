@@ -1,9 +1,13 @@
 """This module processes and validates metadata."""
+import bisect
 import json
-import urllib
+import os
 import pathlib
-import jsonschema
+import threading
+import time
+from typing import List, Union
 
+from datalight import common
 from datalight.common import logger
 
 
@@ -34,6 +38,19 @@ ZENODO_VALID_PROPERTIES = ['publication_date', 'title', 'creators',
 SCHEMAS_DIR = pathlib.Path(__file__).parent / pathlib.Path('schemas')
 SCHEMA_FILE = SCHEMAS_DIR / pathlib.Path('zenodo/zenodo_upload_metadata_schema.json5')
 
+# The list of open licenses and where a copy of it is kept.
+LICENSE_URL = 'https://licenses.opendefinition.org/licenses/groups/all.json'
+LOCAL_LICENSE_FILE = SCHEMAS_DIR / pathlib.Path('zenodo/opendefinition-licenses.json')
+LICENSE_CACHE_FILE = 'opendefinition-licenses.json'
+# Refresh the cached license list once a week.
+LICENSE_CACHE_TTL = 7 * 24 * 60 * 60
+# The maximum time in seconds to wait for the license list to download.
+LICENSE_DOWNLOAD_TIMEOUT = 10
+
+# The compiled schema validator and the modification time of the schema file it was built from.
+_validator_cache = {"mtime": None, "validator": None}
+_validator_lock = threading.Lock()
+
 
 def read_schema_from_file() -> dict:
     """Method to read the schema. Reads schema from self.schema_path
@@ -46,14 +63,46 @@ def read_schema_from_file() -> dict:
         raise ZenodoMetadataException(f'Schema file: {SCHEMA_FILE} not found.')
 
 
-def validate_metadata(metadata: dict, schema: dict) -> dict:
+def get_validator():
+    """Return a validator for the Zenodo schema. The schema is read, checked and compiled into
+    a validator once and then cached. The cache is rebuilt if the schema file is modified.
+
+    :returns: A jsonschema validator instance for the schema.
+    """
+    import jsonschema
+
+    try:
+        mtime = SCHEMA_FILE.stat().st_mtime
+    except FileNotFoundError:
+        raise ZenodoMetadataException(f'Schema file: {SCHEMA_FILE} not found.')
+
+    with _validator_lock:
+        if _validator_cache["mtime"] != mtime:
+            schema = read_schema_from_file()
+            validator_class = jsonschema.validators.validator_for(schema)
+            validator_class.check_schema(schema)
+            _validator_cache["validator"] = validator_class(schema)
+            _validator_cache["mtime"] = mtime
+        return _validator_cache["validator"]
+
+
+def validate_metadata(metadata: dict, schema: dict = None) -> dict:
     """Method which verifies that the metadata have the correct type and that
-     dependencies are respected."""
+     dependencies are respected.
+    :param metadata: The metadata to validate.
+    :param schema: The schema to validate against. If not provided, the cached validator for
+      the Zenodo schema is used.
+    """
+
+    import jsonschema
 
     # Validate metadata before license to be sure that the "license" and "access_right"
     # keys are present.
     try:
-        jsonschema.validate(metadata, schema)
+        if schema is None:
+            get_validator().validate(metadata)
+        else:
+            jsonschema.validate(metadata, schema)
     except jsonschema.exceptions.ValidationError as err:
         raise ZenodoMetadataException(f'ValidationError: {err.message}')
 
@@ -98,6 +147,128 @@ def remove_extra_properties(metadata: dict) -> dict:
     return metadata
 
 
+class _OpenLicenseIndex:
+    """A sorted index of the identifiers of licenses that are accepted as Open.
+
+    Licenses are first read from a local cache of the Open Definition License Service list or,
+    if there is no readable cache, from the copy bundled with datalight, so looking up a license
+    never waits for the network. If the cache is missing, unreadable or older than `ttl` seconds,
+    a fresh list is downloaded in a background thread and used once it arrives.
+
+    :ivar license_ids: The sorted license identifiers.
+    """
+    def __init__(self, cache_path: pathlib.Path, ttl: float = LICENSE_CACHE_TTL):
+        """
+        :param cache_path: The path of the local license cache file.
+        :param ttl: The age in seconds after which the cache is refreshed.
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.license_ids: List[str] = []
+        self._refresh_thread = None
+
+        licenses = None
+        if self.cache_path.exists():
+            licenses = self._read_licenses(self.cache_path)
+        if licenses is not None:
+            self._set_licenses(licenses)
+            if time.time() - self.cache_path.stat().st_mtime > self.ttl:
+                self.start_refresh()
+        else:
+            licenses = self._read_licenses(LOCAL_LICENSE_FILE)
+            if licenses is None:
+                error = f"Could not get open license definitions from local file " \
+                        f"{LOCAL_LICENSE_FILE}."
+                logger.error(error)
+                raise ZenodoMetadataException(error)
+            self._set_licenses(licenses)
+            self.start_refresh()
+
+    def _set_licenses(self, licenses: dict):
+        # Replace the whole list at once so lookups in other threads see a consistent index.
+        self.license_ids = sorted(licenses)
+
+    @staticmethod
+    def _read_licenses(license_path: pathlib.Path) -> Union[dict, None]:
+        """Get open license definitions from a local file.
+
+        :returns open_licenses: (dict) details of open licenses, or None if the file cannot be
+          read or is not a license list.
+        """
+        try:
+            with open(license_path, encoding="utf8") as input_file:
+                open_licenses = _check_licenses(json.load(input_file))
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read open license definitions from {license_path}: {e}')
+            return None
+        logger.info(f'Using file: {license_path} to validate license')
+        return open_licenses
+
+    def start_refresh(self):
+        """Start downloading the latest license list in a background thread."""
+        if self._refresh_thread is None or not self._refresh_thread.is_alive():
+            self._refresh_thread = threading.Thread(target=self._refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh(self):
+        """Download the definition file for open source licenses accepted by Zenodo, store it in
+        the cache and update the index. If the licenses cannot be downloaded, the current index
+        is kept."""
+        import urllib.error
+        import urllib.request
+
+        try:
+            with urllib.request.urlopen(LICENSE_URL, timeout=LICENSE_DOWNLOAD_TIMEOUT) as response:
+                license_data = response.read()
+            licenses = _check_licenses(json.loads(license_data))
+        except (urllib.error.URLError, OSError, ValueError):
+            logger.warning(f'Not possible to get a valid open license list from: {LICENSE_URL}')
+            return
+
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.cache_path.with_suffix(".tmp")
+            temp_path.write_bytes(license_data)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            logger.warning(f'Could not write open license cache: {self.cache_path}')
+        self._set_licenses(licenses)
+        logger.info(f'open licenses file use for validation: {LICENSE_URL}')
+
+    def find(self, prefix: str) -> Union[str, None]:
+        """Return the first license identifier that starts with `prefix`, or None if no
+        license identifier does."""
+        license_ids = self.license_ids
+        index = bisect.bisect_left(license_ids, prefix)
+        if index < len(license_ids) and license_ids[index].startswith(prefix):
+            return license_ids[index]
+        return None
+
+
+def _check_licenses(licenses) -> dict:
+    """Check that data read as a license list maps license identifiers to license details.
+    :raises ValueError: If it does not.
+    """
+    if (not isinstance(licenses, dict) or not licenses
+            or not all(isinstance(license_id, str) and isinstance(details, dict)
+                       for license_id, details in licenses.items())):
+        raise ValueError("The data is not a list of open licenses.")
+    return licenses
+
+
+_open_license_index = None
+_open_license_index_lock = threading.Lock()
+
+
+def get_open_license_index() -> _OpenLicenseIndex:
+    """Return the shared index of open licenses, creating it on first use."""
+    global _open_license_index
+    with _open_license_index_lock:
+        if _open_license_index is None:
+            _open_license_index = _OpenLicenseIndex(common.get_cache_dir() / LICENSE_CACHE_FILE)
+        return _open_license_index
+
+
 class _LicenseStatus:
     """An object representing the license status of a metadata file.
 
@@ -109,7 +280,7 @@ class _LicenseStatus:
 
     license = ""
     access_right = ""
-    open_licenses = {}
+    open_licenses = None
     license_valid = False
 
     def __init__(self, metadata_license, access_right):
@@ -121,50 +292,7 @@ class _LicenseStatus:
         self.license = metadata_license
         self.access_right = access_right
         if self.access_right in ["open", "embargoed"]:
-            self.open_licenses = self._get_open_licenses()
-
-    def _get_open_licenses(self):
-        # Try to retrieve the latest open licenses from the internet.
-        open_licenses = self._get_internet_open_licenses()
-
-        # If the open licenses cannot be downloaded, read them from a local file instead.
-        if open_licenses is None:
-            open_licenses = self._get_local_open_licenses()
-        return open_licenses
-
-    @staticmethod
-    def _get_internet_open_licenses():
-        """Download the definition file for open source licenses accepted by Zenodo.
-
-        :returns licenses: (dict) Information about the different license types.
-        if licenses cannot be accessed, returns none.
-        """
-        url = 'https://licenses.opendefinition.org/licenses/groups/all.json'
-        try:
-            with urllib.request.urlopen(url) as input_file:
-                licenses = json.load(input_file)
-                logger.info(f'open licenses file use for validation: {url}')
-                return licenses
-        except urllib.error.URLError:
-            logger.warning(f'Not possible to access open license list from: {url}')
-            return None
-
-    @staticmethod
-    def _get_local_open_licenses():
-        """Get open license definitions from a local file.
-
-        :returns open_licenses: (dict) details of open licenses.
-        """
-        license_path = SCHEMAS_DIR / pathlib.Path('zenodo/opendefinition-licenses.json')
-        try:
-            with open(license_path) as input_file:
-                open_licenses = json.load(input_file)
-                logger.info(f'Using file: {license_path} to validate license')
-                return open_licenses
-        except FileNotFoundError:
-            error = f"Could not get open license definitions from local file {license_path}."
-            logger.error(error)
-            raise ZenodoMetadataException(error)
+            self.open_licenses = get_open_license_index()
 
     def validate_license(self):
         """Method to verify the status of the metadata license."""
@@ -178,8 +306,7 @@ class _LicenseStatus:
             logger.info(f'Specified license type is: {self.license}')
             logger.info(f'access_right: "{self.access_right}"')
 
-            for lic in self.open_licenses.keys():
-                if lic.startswith(metadata_license):
-                    logger.info(f'license: "{lic}" validated.')
-                    self.license_valid = True
-                    break
+            lic = self.open_licenses.find(metadata_license)
+            if lic is not None:
+                logger.info(f'license: "{lic}" validated.')
+                self.license_valid = True
@@ -7,7 +7,7 @@ requirements = ["requests", "PyYaml>=5.1", "jsonschema", "PyQt5"]
 
 setup(
     name="datalight",
-    packages=find_packages(),
+    packages=find_packages(exclude=["tests", "tests.*", "benchmarks", "benchmarks.*"]),
     version="0.9.1",
     description="Data uploader to Zenodo repository",
     long_description=readme,
@@ -18,5 +18,7 @@ setup(
     url="https://github.com/LightForm-group/datalight",
     keywords=[],
     install_requires=requirements,
+    extras_require={"async": ["aiohttp"]},
+    entry_points={"console_scripts": ["datalight=datalight.cli:main"]},
     license="MIT",
 )
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from datalight import progress
+from datalight.retry import RetryPolicy
+from datalight.zenodo import ZenodoClient
+from tests.mock_zenodo import MockZenodo
+
+
+@pytest.fixture
+def zenodo_server() -> MockZenodo:
+    server = MockZenodo()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client() -> ZenodoClient:
+    """A client which retries failed requests without waiting."""
+    with ZenodoClient("token", retry_policy=RetryPolicy(max_retries=3, backoff_factor=0),
+                      requests_per_minute=60000) as zenodo_client:
+        yield zenodo_client
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Keep the datalight cache of each test in its own temporary directory."""
+    cache_home = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    return cache_home / "datalight"
+
+
+@pytest.fixture
+def files(tmp_path) -> list:
+    """Three files of random data with different sizes."""
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"file{index}.bin"
+        path.write_bytes(os.urandom(1000 * (index + 1)))
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def metadata() -> dict:
+    return {"title": "Test record", "upload_type": "dataset", "description": "A test record",
+            "creators": [{"name": "Doe, Jane", "affiliation": "Somewhere"}],
+            "access_right": "open", "license": "CC-BY-4.0", "publication_date": "2020-01-01"}
+
+
+@pytest.fixture
+def clock(monkeypatch) -> list:
+    """Replace the clock used to measure upload progress with one that only moves when the
+    time in the returned list is changed."""
+    now = [1000.0]
+    monkeypatch.setattr(progress.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    """A Qt application for tests of widgets. Without a display the offscreen platform is
+    used."""
+    QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    yield app
@@ -0,0 +1,244 @@
+"""A minimal in-process imitation of the parts of the Zenodo REST API that datalight uses."""
+
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class Deposition:
+    def __init__(self, deposition_id: int, files: Dict[str, bytes] = None,
+                 state: str = "unsubmitted"):
+        self.id = deposition_id
+        self.files = dict(files or {})
+        self.state = state
+        self.metadata = {}
+        self.latest_draft = None
+
+
+class MockZenodo:
+    """Runs a mock Zenodo server in a background thread.
+
+    :ivar url: The base URL of the server.
+    :ivar depositions: The depositions on the server, keyed by ID.
+    :ivar requests: The method and path of each request received.
+    :ivar failures: Maps a regular expression to a list of status codes. A request whose path
+      matches the expression is answered with the next status code in the list until the list
+      is empty.
+    :ivar failure_body: If set, the raw body sent with failure responses instead of a JSON
+      error, for example to imitate an HTML error page from a gateway.
+    :ivar support_ranges: Whether file downloads honour the Range header.
+    :ivar checksum_prefix: Put in front of the checksums of deposition files, for example
+      "md5:".
+    :ivar corrupt_uploads: The names of uploaded files whose checksum is reported wrongly, as
+      if the data had been corrupted in transit.
+    """
+    def __init__(self):
+        self.depositions: Dict[int, Deposition] = {}
+        self.requests: List[Tuple[str, str]] = []
+        self.failures: Dict[str, List[int]] = {}
+        self.failure_body: Optional[bytes] = None
+        self.support_ranges = True
+        self.checksum_prefix = ""
+        self.corrupt_uploads: Set[str] = set()
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def deposition_url(self) -> str:
+        return f"{self.url}/api/deposit/depositions"
+
+    @property
+    def records_url(self) -> str:
+        return f"{self.url}/api/records"
+
+    def add_deposition(self, files: Dict[str, bytes] = None,
+                       state: str = "unsubmitted") -> Deposition:
+        with self._lock:
+            deposition = Deposition(self._next_id, files, state)
+            self.depositions[deposition.id] = deposition
+            self._next_id += 1
+        return deposition
+
+    def requests_matching(self, method: str, pattern: str) -> List[str]:
+        return [path for request_method, path in self.requests
+                if request_method == method and re.search(pattern, path)]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def take_failure(self, path: str):
+        with self._lock:
+            for pattern, codes in self.failures.items():
+                if codes and re.search(pattern, path):
+                    return codes.pop(0)
+        return None
+
+    def describe(self, deposition: Deposition) -> dict:
+        base = f"{self.deposition_url}/{deposition.id}"
+        latest_draft = deposition.latest_draft or deposition.id
+        return {"id": deposition.id, "state": deposition.state,
+                "submitted": deposition.state == "done", "metadata": deposition.metadata,
+                "links": {"bucket": f"{self.url}/bucket/{deposition.id}",
+                          "latest_draft": f"{self.deposition_url}/{latest_draft}"},
+                "files": [{"id": name, "filename": name, "filesize": len(data),
+                           "checksum": self.checksum_prefix + hashlib.md5(data).hexdigest(),
+                           "links": {"self": f"{base}/files/{name}"}}
+                          for name, data in deposition.files.items()]}
+
+    def describe_record(self, deposition: Deposition) -> dict:
+        return {"id": deposition.id,
+                "files": [{"key": name, "size": len(data),
+                           "checksum": f"md5:{hashlib.md5(data).hexdigest()}",
+                           "links": {"self": f"{self.url}/files/{deposition.id}/{name}"}}
+                          for name, data in deposition.files.items()]}
+
+
+class _Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients close streamed responses early, which is not an error.
+        pass
+
+
+def _make_handler(zenodo: MockZenodo):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # The headers and body of a response are written separately, which Nagle's algorithm
+        # would delay on a kept-alive connection.
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self._handle()
+
+        def do_POST(self):
+            self._handle()
+
+        def do_PUT(self):
+            self._handle()
+
+        def do_DELETE(self):
+            self._handle()
+
+        def _handle(self):
+            body = self._read_body()
+            path = self.path.split("?")[0]
+            with zenodo._lock:
+                zenodo.requests.append((self.command, path))
+            failure = zenodo.take_failure(path)
+            if failure:
+                return self._send(failure, {"status": failure, "message": "Mock failure"},
+                                  {"Retry-After": "0"}, zenodo.failure_body)
+            for method, pattern, function in ROUTES:
+                match = re.fullmatch(pattern, path)
+                if method == self.command and match:
+                    deposition = None
+                    if "deposition_id" in match.groupdict():
+                        deposition = zenodo.depositions.get(int(match["deposition_id"]))
+                        if deposition is None:
+                            return self._send(404, {"status": 404, "message": "Not found"})
+                    return function(self, deposition, match, body)
+            self._send(404, {"status": 404, "message": "Not found"})
+
+        def _read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding") == "chunked":
+                data = b""
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return data
+                    data += self.rfile.read(size)
+                    self.rfile.readline()
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def _send(self, code: int, content=None, headers: dict = None, raw: bytes = None):
+            body = raw if raw is not None else json.dumps(content).encode() \
+                if content is not None else b""
+            self.send_response(code)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Content-Type", "application/json")
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def list_depositions(self, deposition, match, body):
+            self._send(200, [zenodo.describe(item) for item in zenodo.depositions.values()])
+
+        def create_deposition(self, deposition, match, body):
+            self._send(201, zenodo.describe(zenodo.add_deposition()))
+
+        def get_deposition(self, deposition, match, body):
+            self._send(200, zenodo.describe(deposition))
+
+        def update_deposition(self, deposition, match, body):
+            deposition.metadata = json.loads(body)["metadata"]
+            self._send(200, zenodo.describe(deposition))
+
+        def delete_deposition(self, deposition, match, body):
+            zenodo.depositions.pop(deposition.id)
+            self._send(204)
+
+        def publish(self, deposition, match, body):
+            deposition.state = "done"
+            self._send(202, zenodo.describe(deposition))
+
+        def new_version(self, deposition, match, body):
+            draft = zenodo.add_deposition(deposition.files)
+            draft.metadata = dict(deposition.metadata)
+            deposition.latest_draft = draft.id
+            self._send(201, zenodo.describe(deposition))
+
+        def delete_file(self, deposition, match, body):
+            deposition.files.pop(match["name"], None)
+            self._send(204)
+
+        def put_file(self, deposition, match, body):
+            deposition.files[match["name"]] = body
+            checksum = hashlib.md5(body).hexdigest()
+            if match["name"] in zenodo.corrupt_uploads:
+                checksum = hashlib.md5(body + b"corrupt").hexdigest()
+            self._send(201, {"key": match["name"], "size": len(body),
+                             "checksum": f"md5:{checksum}"})
+
+        def get_record(self, deposition, match, body):
+            self._send(200, zenodo.describe_record(deposition))
+
+        def download_file(self, deposition, match, body):
+            data = deposition.files.get(match["name"])
+            if data is None:
+                return self._send(404, {"status": 404, "message": "Not found"})
+            range_header = self.headers.get("Range")
+            if range_header and zenodo.support_ranges:
+                start, end = range_header.split("=")[1].split("-")
+                start, end = int(start), int(end) if end else len(data) - 1
+                return self._send(206, raw=data[start:end + 1],
+                                  headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+            self._send(200, raw=data)
+
+    deposition_path = r"/api/deposit/depositions/(?P<deposition_id>\d+)"
+    ROUTES = [
+        ("GET", r"/api/deposit/depositions", Handler.list_depositions),
+        ("POST", r"/api/deposit/depositions", Handler.create_deposition),
+        ("GET", deposition_path, Handler.get_deposition),
+        ("PUT", deposition_path, Handler.update_deposition),
+        ("DELETE", deposition_path, Handler.delete_deposition),
+        ("POST", deposition_path + r"/actions/publish", Handler.publish),
+        ("POST", deposition_path + r"/actions/newversion", Handler.new_version),
+        ("DELETE", deposition_path + r"/files/(?P<name>.+)", Handler.delete_file),
+        ("PUT", r"/bucket/(?P<deposition_id>\d+)/(?P<name>.+)", Handler.put_file),
+        ("GET", r"/api/records/(?P<deposition_id>\d+)", Handler.get_record),
+        ("GET", r"/files/(?P<deposition_id>\d+)/(?P<name>.+)", Handler.download_file),
+    ]
+    return Handler
@@ -0,0 +1,16 @@
+import json
+import subprocess
+import sys
+
+# Modules which are slow to import and are only needed once a request is sent or a GUI opened.
+HEAVY_MODULES = ["PyQt5", "requests", "yaml", "jsonschema", "aiohttp", "datalight.ui"]
+
+
+def test_api_import_is_light():
+    """Importing the headless API must not import the GUI or the HTTP and YAML libraries."""
+    code = "import json, sys, datalight.api; print(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.PIPE)
+    modules = json.loads(output.stdout)
+    imported = [name for name in HEAVY_MODULES
+                if any(module == name or module.startswith(name + ".") for module in modules)]
+    assert imported == []
@@ -0,0 +1,78 @@
+import gzip
+import io
+import os
+import tarfile
+
+import pytest
+
+from datalight import archive
+from datalight.common import DatalightException
+
+
+@pytest.fixture
+def folder(tmp_path):
+    """A folder with files whose headers and data need different amounts of padding."""
+    folder = tmp_path / "data"
+    (folder / "nested" / "deeper").mkdir(parents=True)
+    files = {"empty": b"", "one_block": os.urandom(archive.BLOCK_SIZE),
+             "one_byte_over": os.urandom(archive.BLOCK_SIZE + 1),
+             "nested/deeper/" + "long_name_" * 12: os.urandom(1000),
+             "nested/ünïcödé.txt": b"unicode name"}
+    for name, data in files.items():
+        (folder / name).write_bytes(data)
+    return folder
+
+
+def test_tar_stream_size_is_exact(folder):
+    stream = archive.TarStream(archive.list_folder(folder))
+    data = stream.read()
+    assert len(stream) == len(data)
+    # Reading in small pieces gives the same archive.
+    stream.seek(0)
+    assert b"".join(iter(lambda: stream.read(1000), b"")) == data
+
+
+def test_tar_stream_matches_files(folder):
+    members = archive.list_folder(folder)
+    stream = archive.TarStream(members)
+    data = stream.read()
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar_file:
+        names = tar_file.getnames()
+        assert names == [member.arcname for member in members]
+        for member in members:
+            assert tar_file.extractfile(member.arcname).read() == member.path.read_bytes()
+    # The data of each member can be read straight from the archive at its offset.
+    for member, offset in zip(members, stream.get_member_offsets()):
+        assert data[offset:offset + member.size] == member.path.read_bytes()
+
+
+@pytest.mark.parametrize("arcname, size", [("short", 10), ("x" * 101, 10),
+                                           ("ünïcödé", 10), ("huge", 8 ** 11 + 1)])
+def test_header_size(tmp_path, arcname, size):
+    path = tmp_path / "file"
+    path.write_bytes(b"")
+    stat = os.stat_result((0o644, 0, 0, 1, 0, 0, size, 0, 0, 0))
+    member = archive.ArchiveMember(path, arcname, stat)
+    assert member.get_header_size() == len(member.get_header())
+    assert member.get_archived_size() % archive.BLOCK_SIZE == 0
+
+
+def test_file_changing_size_is_detected(folder):
+    stream = archive.TarStream(archive.list_folder(folder))
+    (folder / "one_block").write_bytes(b"shorter")
+    with pytest.raises(DatalightException):
+        stream.read()
+
+
+def test_gzip_archive(folder):
+    tar_data = archive.TarStream(archive.list_folder(folder)).read()
+    reader = archive.CompressedReader(archive.TarStream(archive.list_folder(folder)), "gzip")
+    assert gzip.decompress(reader.read()) == tar_data
+
+
+def test_reader_must_generate_chunks():
+    class IncompleteReader(archive._GeneratedReader):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteReader()
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+import yaml
+
+from datalight import bulk, common, zenodo
+
+
+@pytest.fixture
+def bulk_server(zenodo_server, monkeypatch):
+    monkeypatch.setattr(zenodo, "get_deposition_url",
+                        lambda sandbox: zenodo_server.deposition_url)
+    monkeypatch.setattr(common, "get_authentication_token", lambda path, sandbox: "token")
+    return zenodo_server
+
+
+def test_bulk_upload_with_folder_and_broken_file(bulk_server, metadata, tmp_path):
+    (tmp_path / "metadata.yaml").write_text(yaml.safe_dump(metadata))
+    folder = tmp_path / "run1"
+    folder.mkdir()
+    (folder / "a.bin").write_bytes(os.urandom(1000))
+    (folder / "b.bin").write_bytes(os.urandom(2000))
+    (tmp_path / "run2").mkdir()
+    os.symlink(tmp_path / "missing.bin", tmp_path / "run2" / "broken.bin")
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text('{"files": "run1", "metadata": "metadata.yaml"}\n'
+                        '{"files": "run2/*", "metadata": "metadata.yaml"}\n')
+
+    records = bulk.read_manifest(manifest)
+    results = bulk.upload_records(records, tmp_path / "datalight.ini")
+    assert results[0]["success"]
+    assert results[0]["bytes"] == 3000
+    assert not results[1]["success"]
+    assert results[1]["bytes"] == 0
+
+    bulk.write_report(results, 1.0, tmp_path / "report.json")
+    assert (tmp_path / "report.json").exists()
@@ -0,0 +1,176 @@
+import time
+
+import pytest
+
+QtCore = pytest.importorskip("PyQt5.QtCore")
+from datalight.ui import custom_widgets  # noqa: E402
+
+
+def make_form(children: dict) -> custom_widgets.GroupBox:
+    description = custom_widgets.element_setup(
+        "form", {"widget": "GroupBox", "layout": "VBoxLayout", "children": children})
+    return custom_widgets.GroupBox(None, description)
+
+
+def test_nested_widgets_are_indexed(qapp):
+    form = make_form({
+        "title": {"widget": "LineEdit"},
+        "details": {"widget": "GroupBox", "layout": "FormLayout", "children": {
+            "description": {"widget": "PlainTextEdit", "label": "Description"}}},
+        "split": {"widget": "Splitter", "children": {
+            "notes": {"widget": "LineEdit"},
+            "inner": {"widget": "GroupBox", "layout": "HBoxLayout", "children": {
+                "count": {"widget": "SpinBox"}}}}}})
+    assert isinstance(form.get_widget("title"), custom_widgets.LineEdit)
+    assert isinstance(form.get_widget("description"), custom_widgets.PlainTextEdit)
+    assert isinstance(form.get_widget("notes"), custom_widgets.LineEdit)
+    assert isinstance(form.get_widget("count"), custom_widgets.SpinBox)
+    # Every GroupBox in the form shares the same index.
+    assert form.get_widget("details").get_widget("count") is form.get_widget("count")
+    assert form.get_widget("missing") is None
+
+
+def test_first_widget_with_a_name_is_found(qapp):
+    form = make_form({
+        "first": {"widget": "GroupBox", "layout": "VBoxLayout", "children": {
+            "value": {"widget": "LineEdit"}}},
+        "second": {"widget": "GroupBox", "layout": "VBoxLayout", "children": {
+            "value": {"widget": "SpinBox"}}}})
+    assert isinstance(form.get_widget("value"), custom_widgets.LineEdit)
+    assert form.findChild(custom_widgets.LineEdit, "value") is form.get_widget("value")
+
+
+def test_separate_forms_have_separate_indexes(qapp):
+    first_form = make_form({"title": {"widget": "LineEdit"}})
+    second_form = make_form({"title": {"widget": "LineEdit"}})
+    assert first_form.get_widget("title") is not second_form.get_widget("title")
+    assert first_form.get_widget("title").parent() is first_form
+
+
+def test_combo_box_enables_dependent_widgets(qapp):
+    form = make_form({
+        "access_right": {"widget": "ComboBox", "values": {"open": "Open", "embargoed": "Embargo"},
+                         "activates_when": {"embargoed": "embargo_date"}},
+        "embargo_date": {"widget": "DateEdit"}})
+    combo_box = form.get_widget("access_right")
+    embargo_date = form.get_widget("embargo_date")
+    assert not embargo_date.isEnabled()
+    combo_box.setCurrentIndex(1)
+    assert embargo_date.isEnabled()
+    combo_box.setCurrentIndex(0)
+    assert not embargo_date.isEnabled()
+
+
+def test_chained_dependencies_are_disabled(qapp):
+    form = make_form({
+        "first": {"widget": "ComboBox", "values": ["a", "b"], "activates_when": {"b": "second"}},
+        "second": {"widget": "ComboBox", "values": ["c", "d"],
+                   "activates_when": {"d": "third"}},
+        "third": {"widget": "LineEdit"}})
+    first, second, third = (form.get_widget(name) for name in ["first", "second", "third"])
+    second.setCurrentIndex(1)
+    assert not second.isEnabled() and not third.isEnabled()
+    first.setCurrentIndex(1)
+    assert second.isEnabled() and third.isEnabled()
+    first.setCurrentIndex(0)
+    assert not second.isEnabled() and not third.isEnabled()
+
+
+def test_dependency_loop_does_not_recurse_forever(qapp):
+    form = make_form({
+        "first": {"widget": "ComboBox", "values": ["a", "b"], "activates_when": {"b": "second"}},
+        "second": {"widget": "ComboBox", "values": ["a", "b"],
+                   "activates_when": {"b": "first"}}})
+    # Each box is updated once however the loop is entered.
+    form.get_widget("first").setCurrentIndex(1)
+    form.get_widget("second").setCurrentIndex(1)
+
+
+def test_dependency_on_help_widget(qapp):
+    form = make_form({
+        "upload_type": {"widget": "ComboBox", "values": ["dataset", "image"],
+                        "activates_when": {"image": "image_type"}},
+        "image_type": {"widget": "ComboBox", "values": ["figure", "photo"],
+                       "help_text": "The type of image."}})
+    image_type = form.get_widget("image_type")
+    assert isinstance(image_type, custom_widgets.HelpWidget)
+    assert not image_type.isEnabled()
+    form.get_widget("upload_type").setCurrentIndex(1)
+    assert image_type.isEnabled()
+
+
+def test_unknown_dependency_is_an_error(qapp):
+    with pytest.raises(KeyError, match="missing"):
+        make_form({"first": {"widget": "ComboBox", "values": ["a", "b"],
+                             "activates_when": {"b": "missing"}}})
+
+
+def wait_for(qapp, condition, timeout: float = 5):
+    """Process Qt events until `condition` returns True."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for the GUI."
+        qapp.processEvents()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def file_list(qapp):
+    description = custom_widgets.element_setup("file_list", {"widget": "FileList"})
+    return custom_widgets.FileList(None, description)
+
+
+def test_duplicate_paths_are_not_added(file_list):
+    assert file_list.add_paths(["a", "b", "c"]) == []
+    assert file_list.add_paths(["c", "d", "a"]) == ["c", "a"]
+    assert file_list.get_value() == ["a", "b", "c", "d"]
+
+
+def test_rows_are_removed(file_list):
+    file_list.add_paths([f"file{index}" for index in range(8)])
+    file_list.model.remove_rows([6, 1, 2, 3, 7])
+    assert file_list.get_value() == ["file0", "file4", "file5"]
+    # Removed paths can be added again.
+    assert file_list.add_paths(["file1"]) == []
+    assert file_list.count() == 4
+
+
+def test_sizes_are_found(qapp, file_list, tmp_path):
+    (tmp_path / "folder").mkdir()
+    (tmp_path / "folder" / "inner.bin").write_bytes(bytes(300))
+    (tmp_path / "file.bin").write_bytes(bytes(200))
+    paths = [str(tmp_path / "folder"), str(tmp_path / "file.bin")]
+    file_list.add_paths(paths)
+    wait_for(qapp, lambda: file_list.model.pending_sizes() == 0)
+    assert file_list.model.total_size == 500
+    assert file_list.summary.text() == "2 items, 500 B"
+    index = file_list.model.index(1)
+    assert file_list.model.data(index) == f"{paths[1]}  (200 B)"
+    assert file_list.model.data(index, QtCore.Qt.UserRole) == paths[1]
+
+    file_list.model.remove_rows([0])
+    assert file_list.model.total_size == 200
+    assert file_list.summary.text() == "1 item, 200 B"
+
+
+def test_sizes_found_before_clearing_are_ignored(qapp, file_list, tmp_path):
+    (tmp_path / "file.bin").write_bytes(bytes(200))
+    file_list.add_paths([str(tmp_path / "file.bin")])
+    file_list.reset_value()
+    file_list.model.add_paths(["other"], {"other": 50})
+    # Deliver any sizes the background thread found for the cleared entry.
+    for _ in range(20):
+        qapp.processEvents()
+        time.sleep(0.01)
+    assert file_list.get_value() == ["other"]
+    assert file_list.model.total_size == 50
+    assert file_list.summary.text() == "1 item, 50 B"
+
+
+def test_required_file_list_must_not_be_empty(qapp):
+    description = custom_widgets.element_setup("file_list",
+                                               {"widget": "FileList", "optional": False})
+    file_list = custom_widgets.FileList(None, description)
+    assert not file_list.validate_input()
+    file_list.add_paths(["a"])
+    assert file_list.validate_input()
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+from datalight import api, cli, download
+from datalight.zenodo import STATUS_CANCELLED, STATUS_CHECKSUM_MISMATCH
+
+PART_SIZE = 64 * 1024
+
+
+@pytest.fixture
+def record(zenodo_server):
+    files = {"big.bin": os.urandom(5 * PART_SIZE + 123), "small.txt": b"hello", "empty": b""}
+    return zenodo_server.add_deposition(files, state="done")
+
+
+def download_record(zenodo_server, client, record, output_directory, **kwargs):
+    return download.download_record(record.id, output_directory, zenodo_server.records_url,
+                                    client, part_size=PART_SIZE, **kwargs)
+
+
+def assert_downloaded(record, output_directory):
+    assert sorted(os.listdir(output_directory)) == sorted(record.files)
+    for name, data in record.files.items():
+        assert (output_directory / name).read_bytes() == data
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_download_in_parts(zenodo_server, client, record, tmp_path, workers):
+    status = download_record(zenodo_server, client, record, tmp_path, download_workers=workers)
+    assert status.code == 200
+    assert_downloaded(record, tmp_path)
+    # One probe for range support and one request for each part.
+    assert len(zenodo_server.requests_matching("GET", "/files/.*/big.bin")) == 1 + 6
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_download_without_range_support(zenodo_server, client, record, tmp_path, workers):
+    zenodo_server.support_ranges = False
+    status = download_record(zenodo_server, client, record, tmp_path, download_workers=workers)
+    assert status.code == 200
+    assert_downloaded(record, tmp_path)
+    # The probe and then a single download of the whole file.
+    assert len(zenodo_server.requests_matching("GET", "/files/.*/big.bin")) == 2
+
+
+def test_server_ignoring_ranges_after_probe(zenodo_server, client, record, tmp_path,
+                                            monkeypatch):
+    """A server which answers range requests with the whole file is handled even if it was not
+    detected by the probe."""
+    monkeypatch.setattr(download, "_supports_ranges", lambda remote_file, client: True)
+    zenodo_server.support_ranges = False
+    for workers in (1, 4):
+        output_directory = tmp_path / str(workers)
+        status = download_record(zenodo_server, client, record, output_directory,
+                                 download_workers=workers)
+        assert status.code == 200
+        assert_downloaded(record, output_directory)
+    # With one worker, the parts after the first one are skipped.
+    assert len(zenodo_server.requests_matching("GET", "/files/.*/big.bin")) <= 1 + 4
+
+
+def test_completed_files_are_skipped(zenodo_server, client, record, tmp_path):
+    download_record(zenodo_server, client, record, tmp_path)
+    zenodo_server.requests.clear()
+    status = download_record(zenodo_server, client, record, tmp_path)
+    assert status.code == 200
+    assert zenodo_server.requests_matching("GET", "/files/") == []
+
+
+def test_resume_download(zenodo_server, client, record, tmp_path):
+    # Fail the third part of the large file so the download stops part way.
+    zenodo_server.failures["/files/.*/big.bin"] = [None, None, None, 404]
+    status = download_record(zenodo_server, client, record, tmp_path, download_workers=1)
+    assert status.code == 404
+    state = json.loads((tmp_path / "big.bin.part.json").read_text())
+    assert state["done_parts"] == [0, 1]
+
+    zenodo_server.requests.clear()
+    status = download_record(zenodo_server, client, record, tmp_path, download_workers=1)
+    assert status.code == 200
+    assert_downloaded(record, tmp_path)
+    # Only the parts which were not done are downloaded again, with no probe.
+    assert len(zenodo_server.requests_matching("GET", "/files/.*/big.bin")) == 4
+
+
+def test_checksum_mismatch(zenodo_server, client, record, tmp_path, monkeypatch):
+    original_get_record_files = download.get_record_files
+
+    def get_record_files(*args):
+        status, remote_files = original_get_record_files(*args)
+        for remote_file in remote_files:
+            if remote_file.name == "small.txt":
+                remote_file.checksum = "0" * 32
+        return status, remote_files
+
+    monkeypatch.setattr(download, "get_record_files", get_record_files)
+    status = download_record(zenodo_server, client, record, tmp_path)
+    assert status.code == STATUS_CHECKSUM_MISMATCH
+    assert not (tmp_path / "small.txt").exists()
+    assert not (tmp_path / "small.txt.part").exists()
+
+
+def test_cancelled_download(zenodo_server, client, record, tmp_path):
+    cancel_event = threading.Event()
+    cancel_event.set()
+    status = download_record(zenodo_server, client, record, tmp_path,
+                             cancel_event=cancel_event)
+    assert status.code == STATUS_CANCELLED
+    assert not (tmp_path / "big.bin").exists()
+
+
+def test_failed_part_returns_status(zenodo_server, client, record, tmp_path, monkeypatch):
+    original_request = client.request
+
+    def failing_request(method, url, headers=None, **kwargs):
+        if url.endswith("big.bin") and headers == {"Range": f"bytes={2 * PART_SIZE}-"
+                                                             f"{3 * PART_SIZE - 1}"}:
+            raise requests.exceptions.ConnectionError("Connection reset")
+        return original_request(method, url, headers=headers, **kwargs)
+
+    monkeypatch.setattr(client, "request", failing_request)
+    status = download_record(zenodo_server, client, record, tmp_path, download_workers=1)
+    assert status.code == 500
+    assert "ConnectionError" in status.message
+    # The parts before the failure are kept so the download can be resumed.
+    state = json.loads((tmp_path / "big.bin.part.json").read_text())
+    assert state["done_parts"] == [0, 1]
+
+
+def test_cancel_stops_retry_wait(zenodo_server, client, record, tmp_path, monkeypatch):
+    class BrokenResponse:
+        status_code = 206
+
+        def iter_content(self, chunk_size):
+            raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+        def close(self):
+            pass
+
+    original_request = client.request
+
+    def request(method, url, headers=None, **kwargs):
+        if headers and headers["Range"] != "bytes=0-0":
+            return BrokenResponse()
+        return original_request(method, url, headers=headers, **kwargs)
+
+    monkeypatch.setattr(client, "request", request)
+    monkeypatch.setattr(client.retry_policy, "get_delay", lambda attempt, headers=None: 60)
+    cancel_event = threading.Event()
+    threading.Timer(0.3, cancel_event.set).start()
+    start = time.monotonic()
+    status = download_record(zenodo_server, client, record, tmp_path, cancel_event=cancel_event)
+    assert status.code == STATUS_CANCELLED
+    assert time.monotonic() - start < 10
+
+
+def test_resume_single_request_download(zenodo_server, client, record, tmp_path):
+    zenodo_server.support_ranges = False
+    # The probe succeeds and the download of the whole file fails.
+    zenodo_server.failures["/files/.*/big.bin"] = [None, 404]
+    status = download_record(zenodo_server, client, record, tmp_path)
+    assert status.code == 404
+    state = json.loads((tmp_path / "big.bin.part.json").read_text())
+    assert state["part_size"] == PART_SIZE and state["single_part"]
+
+    zenodo_server.requests.clear()
+    status = download_record(zenodo_server, client, record, tmp_path)
+    assert status.code == 200
+    assert_downloaded(record, tmp_path)
+    # The server is not asked about range requests again. The file is requested once.
+    assert len(zenodo_server.requests_matching("GET", "/files/.*/big.bin")) == 1
+
+
+def test_cli_reports_failed_download(zenodo_server, record, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(download, "get_records_url", lambda sandbox: zenodo_server.records_url)
+
+    def failing_download_part(*args):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(download, "_download_part", failing_download_part)
+    assert cli.main(["download", str(record.id), "--output", str(tmp_path)]) == 1
+    assert "No space left on device" in caplog.text
+
+    def failing_download(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("Connection refused")
+
+    monkeypatch.setattr(api, "download_record", failing_download)
+    assert cli.main(["download", str(record.id), "--output", str(tmp_path)]) == 1
+    assert "Connection refused" in caplog.text
@@ -0,0 +1,57 @@
+import os
+import threading
+
+import pytest
+
+from datalight import folder_scan
+
+
+@pytest.fixture
+def tree(tmp_path):
+    files = {"top.txt": 1, "data/frame001.tif": 10, "data/frame002.tif": 20,
+             "data/notes.txt": 5, "data/.cache/tmp.bin": 100, "logs/run.log": 7}
+    for name, size in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(bytes(size))
+    return tmp_path
+
+
+def scan(folder, **kwargs) -> dict:
+    return {os.path.relpath(path, folder).replace(os.sep, "/"): size
+            for path, size in folder_scan.scan_folder(str(folder), **kwargs)}
+
+
+def test_all_files_are_found(tree):
+    assert scan(tree) == {"top.txt": 1, "data/frame001.tif": 10, "data/frame002.tif": 20,
+                          "data/notes.txt": 5, "data/.cache/tmp.bin": 100, "logs/run.log": 7}
+
+
+def test_include_and_exclude_patterns(tree):
+    assert scan(tree, include=["*.tif"]) == {"data/frame001.tif": 10, "data/frame002.tif": 20}
+    assert scan(tree, include=["data/*"], exclude=[".cache", "*.txt"]) == {
+        "data/frame001.tif": 10, "data/frame002.tif": 20}
+    assert scan(tree, exclude=["data", "logs/*"]) == {"top.txt": 1}
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink") or os.name == "nt",
+                    reason="Symbolic links need extra permissions on Windows")
+def test_folder_links_are_not_followed(tree):
+    os.symlink(tree / "data", tree / "linked_data")
+    assert "linked_data/notes.txt" not in scan(tree)
+
+
+def test_cancelled_scan_stops(tree):
+    cancel_event = threading.Event()
+    cancel_event.set()
+    assert scan(tree, cancel_event=cancel_event) == {}
+
+
+def test_path_size(tree):
+    assert folder_scan.get_path_size(tree / "data") == 135
+    assert folder_scan.get_path_size(tree / "top.txt") == 1
+    assert folder_scan.get_path_size(tree / "missing") == 0
+
+
+def test_parse_patterns():
+    assert folder_scan.parse_patterns(" *.tif, raw/*,, ") == ["*.tif", "raw/*"]
@@ -0,0 +1,84 @@
+import io
+
+from datalight import progress, zenodo
+from datalight.upload_source import BytesSource
+
+
+def make_tracker(callback, report_interval=1.0):
+    sources = [BytesSource("file0.bin", bytes(1000)), BytesSource("file1.bin", bytes(500))]
+    return progress.ProgressTracker(sources, callback=callback, report_interval=report_interval)
+
+
+def test_byte_reports_are_throttled(clock):
+    reports = []
+    tracker = make_tracker(reports.append)
+    tracker.start()
+    assert len(reports) == 1
+
+    for _ in range(10):
+        tracker.add_bytes("file0.bin", 10)
+    assert len(reports) == 2
+    clock[0] += 0.5
+    tracker.add_bytes("file0.bin", 10)
+    assert len(reports) == 2
+    clock[0] += 0.5
+    tracker.add_bytes("file0.bin", 10)
+    assert len(reports) == 3
+    assert reports[-1].bytes_sent == 120
+
+
+def test_state_changes_are_always_reported(clock):
+    reports = []
+    tracker = make_tracker(reports.append)
+    tracker.start()
+    tracker.add_bytes("file1.bin", 100)
+    tracker.set_state("file1.bin", progress.FILE_UPLOADING)
+    tracker.set_state("file1.bin", progress.FILE_UPLOADED)
+    assert len(reports) == 4
+    assert [file.state for file in reports[-1].files] == [progress.FILE_QUEUED,
+                                                           progress.FILE_UPLOADED]
+    assert reports[-1].bytes_sent == 500
+    assert reports[-1].fraction_complete == 500 / 1500
+
+
+def test_failing_callback_does_not_stop_upload(clock):
+    def broken_callback(_):
+        raise RuntimeError("Display closed")
+
+    tracker = make_tracker(broken_callback)
+    tracker.start()
+    tracker.add_bytes("file0.bin", 10)
+    assert tracker.get_progress().bytes_sent == 10
+
+
+def test_rewinding_reader_restarts_file(clock):
+    tracker = make_tracker(None)
+    tracker.add_bytes("file1.bin", 200)
+    reader = progress.ProgressReader(io.BytesIO(bytes(1000)), tracker, "file0.bin")
+    reader.read(600)
+    # Bytes are counted in batches, and reaching the end of the stream flushes the batch.
+    assert tracker.get_progress().bytes_sent == 200
+    reader.read()
+    assert reader.read() == b""
+    assert tracker.get_progress().bytes_sent == 1200
+
+    # A retried request rewinds the body, so the bytes already sent are not counted twice.
+    reader.seek(0)
+    assert tracker.get_progress().files[0].bytes_sent == 0
+    assert tracker.get_progress().bytes_sent == 200
+    reader.read()
+    reader.read()
+    assert tracker.get_progress().bytes_sent == 1200
+
+
+def test_retried_upload_is_counted_once(zenodo_server, client, metadata, tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(bytes(5000))
+    zenodo_server.failures["/bucket/"] = [500, 500]
+    reports = []
+    status = zenodo.deposit_record([path], metadata, zenodo_server.deposition_url, client,
+                                   False, None, progress_callback=reports.append)
+    assert status.code == 200
+    assert len(zenodo_server.requests_matching("PUT", "/bucket/")) == 3
+    assert max(report.bytes_sent for report in reports) == 5000
+    assert reports[-1].fraction_complete == 1.0
@@ -0,0 +1,134 @@
+import email.utils
+import os
+import threading
+import time
+
+import pytest
+
+from datalight import zenodo
+from datalight.retry import RateLimiter, RetryPolicy, get_bandwidth_limiter, get_server_delay
+from datalight.zenodo import ZenodoClient
+
+
+def test_should_retry():
+    policy = RetryPolicy(max_retries=2)
+    assert policy.should_retry(0, 503)
+    assert policy.should_retry(1, None)
+    assert not policy.should_retry(2, 503)
+    assert not policy.should_retry(0, 400)
+
+
+@pytest.mark.parametrize("attempt, limit", [(0, 0.5), (2, 2.0), (10, 3.0)])
+def test_backoff_with_jitter(attempt, limit):
+    policy = RetryPolicy(backoff_factor=0.5, max_backoff=3.0)
+    delays = [policy.get_delay(attempt) for _ in range(1000)]
+    assert all(0 <= delay <= limit for delay in delays)
+    # Full jitter spreads the delays over the whole range.
+    assert min(delays) < limit * 0.1 and max(delays) > limit * 0.9
+
+
+def test_server_delay():
+    assert get_server_delay({}) is None
+    assert get_server_delay({"Retry-After": "7"}) == 7
+    assert get_server_delay({"Retry-After": "-1"}) == 0
+    retry_date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < get_server_delay({"Retry-After": retry_date}) <= 30
+    reset = str(time.time() + 20)
+    assert 15 < get_server_delay({"X-RateLimit-Remaining": "0",
+                                  "X-RateLimit-Reset": reset}) <= 20
+    # The reset time only matters once the quota is used up.
+    assert get_server_delay({"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": reset}) is None
+
+
+@pytest.mark.parametrize("headers", [{"Retry-After": "soon"}, {"Retry-After": ""},
+                                     {"Retry-After": "Mon, 99 Foo 2020 25:00:00"},
+                                     {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "x"}])
+def test_malformed_server_delay_is_ignored(headers):
+    assert get_server_delay(headers) is None
+    # The policy falls back to its own backoff.
+    assert 0 <= RetryPolicy(backoff_factor=1).get_delay(0, headers) <= 1
+
+
+def test_server_delay_is_capped():
+    policy = RetryPolicy(max_backoff=10)
+    assert policy.get_delay(0, {"Retry-After": "3"}) == 3
+    assert policy.get_delay(0, {"Retry-After": "3600"}) == 10
+
+
+def test_rate_limiter_burst_and_rate():
+    limiter = RateLimiter(requests_per_minute=60, burst=3)
+    assert [limiter.reserve() for _ in range(3)] == [0, 0, 0]
+    # The bucket is empty, so the next request waits for a token at one per second.
+    assert 0.9 < limiter.reserve() <= 1
+
+
+def test_rate_limiter_pause():
+    limiter = RateLimiter(requests_per_minute=6000)
+    limiter.pause(5)
+    assert 4 < limiter.reserve() <= 5
+
+
+def test_bandwidth_limiter():
+    limiter = get_bandwidth_limiter(1000)
+    # A chunk larger than a second of data is allowed when the bucket is full, leaving it in
+    # debt until the extra data would have been sent.
+    assert limiter.reserve(3000) == 0
+    assert 1.9 < limiter.reserve(1) <= 2.01
+
+
+def test_upload_retries_server_errors(zenodo_server, client, metadata, tmp_path):
+    paths = []
+    for index in range(3):
+        paths.append(tmp_path / f"file{index}.bin")
+        paths[-1].write_bytes(os.urandom(10000))
+    zenodo_server.failures["/bucket/"] = [503, 503]
+    zenodo_server.failures[r"/api/deposit/depositions/\d+$"] = [429]
+    status = zenodo.deposit_record(paths, metadata, zenodo_server.deposition_url, client,
+                                   True, None, 2)
+    assert status.code == 200
+    deposition = zenodo_server.depositions[status.deposition_id]
+    assert deposition.state == "done"
+    # The file bodies are rewound before each retry.
+    assert deposition.files == {path.name: path.read_bytes() for path in paths}
+    assert len(zenodo_server.requests_matching("PUT", "/bucket/")) == 3 + 2
+
+
+@pytest.mark.parametrize("step", ["/bucket/", r"/api/deposit/depositions/\d+$",
+                                  "/actions/publish"])
+def test_html_error_page_deletes_deposition(zenodo_server, client, metadata, tmp_path, step):
+    """Gateways answer some errors with an HTML page. Once the retries run out, the error is
+    reported and the deposition is deleted."""
+    path = tmp_path / "file.bin"
+    path.write_bytes(os.urandom(1000))
+    zenodo_server.failures[step] = [502] * 4
+    zenodo_server.failure_body = b"<html><body>502 Bad Gateway</body></html>"
+    status = zenodo.deposit_record([path], metadata, zenodo_server.deposition_url, client,
+                                   True, None)
+    assert status.code == 502
+    assert "Bad Gateway" in status.message
+    assert list(zenodo_server.depositions) == []
+
+
+def test_upload_fails_when_retries_run_out(zenodo_server, client, metadata, tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(os.urandom(1000))
+    zenodo_server.failures["/bucket/"] = [503] * 4
+    status = zenodo.deposit_record([path], metadata, zenodo_server.deposition_url, client,
+                                   True, None)
+    assert status.code == 503
+    assert len(zenodo_server.requests_matching("PUT", "/bucket/")) == 4
+    assert zenodo_server.depositions == {}
+
+
+def test_cancel_stops_retry_wait(zenodo_server, monkeypatch):
+    zenodo_server.failures["/api/deposit/depositions"] = [503] * 5
+    cancel_event = threading.Event()
+    retry_policy = RetryPolicy(max_retries=5)
+    monkeypatch.setattr(retry_policy, "get_delay", lambda attempt, headers=None: 60)
+    with ZenodoClient("token", retry_policy=retry_policy, cancel_event=cancel_event) as client:
+        threading.Timer(0.2, cancel_event.set).start()
+        start = time.monotonic()
+        response = client.request("GET", zenodo_server.deposition_url)
+    assert response.status_code == 503
+    assert time.monotonic() - start < 10
+    assert len(zenodo_server.requests) == 1
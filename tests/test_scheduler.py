@@ -0,0 +1,65 @@
+import pytest
+
+from datalight import progress, scheduler, zenodo
+from datalight.upload_source import BytesSource
+
+
+def make_sources(*sizes):
+    return [BytesSource(f"file{index}.bin", bytes(size)) for index, size in enumerate(sizes)]
+
+
+def test_largest_uploads_start_first():
+    upload_scheduler = scheduler.UploadScheduler(make_sources(100, 300, 50, 200), workers=2)
+    assert [source.size for source in upload_scheduler.sources] == [300, 200, 100, 50]
+
+
+def test_deposit_uploads_largest_file_first(zenodo_server, client, metadata, tmp_path):
+    paths = []
+    for index, size in enumerate([1000, 5000, 3000]):
+        paths.append(tmp_path / f"file{index}.bin")
+        paths[-1].write_bytes(bytes(size))
+    status = zenodo.deposit_record(paths, metadata, zenodo_server.deposition_url, client,
+                                   False, None)
+    assert status.code == 200
+    bucket = f"/bucket/{status.deposition_id}"
+    assert zenodo_server.requests_matching("PUT", "/bucket/") == [
+        f"{bucket}/file1.bin", f"{bucket}/file2.bin", f"{bucket}/file0.bin"]
+
+
+def test_eta_updates_as_files_finish(clock):
+    sources = make_sources(300, 200, 100)
+    upload_scheduler = scheduler.UploadScheduler(sources, workers=1, bytes_per_second=100)
+    upload_scheduler.start()
+    # Before any data is sent the bandwidth limit is used as the rate.
+    assert upload_scheduler.progress.get_progress().eta_seconds == pytest.approx(6)
+
+    for source in upload_scheduler.sources[:2]:
+        upload_scheduler.file_started(source)
+        clock[0] += source.size / 50
+        upload_scheduler.progress.add_bytes(source.name, source.size)
+        upload_scheduler.file_finished(source)
+    # 500 bytes took 10 seconds, so the last 100 bytes are expected to take 2 seconds.
+    upload_progress = upload_scheduler.progress.get_progress()
+    assert upload_progress.rate == pytest.approx(50)
+    assert upload_progress.eta_seconds == pytest.approx(2)
+
+    upload_scheduler.file_finished(upload_scheduler.sources[2], progress.FILE_FAILED)
+    assert upload_scheduler.progress.get_progress().eta_seconds == 0
+
+
+def test_eta_allows_for_largest_file(clock):
+    # Two workers share the bandwidth, so the large file is sent at half of the total rate.
+    upload_scheduler = scheduler.UploadScheduler(make_sources(900, 100), workers=2,
+                                                 bytes_per_second=100)
+    upload_scheduler.start()
+    assert upload_scheduler.progress.get_progress().eta_seconds == pytest.approx(18)
+
+    upload_scheduler.file_finished(upload_scheduler.sources[1])
+    assert upload_scheduler.progress.get_progress().eta_seconds == pytest.approx(9)
+
+
+def test_format_size():
+    assert scheduler.format_size(999) == "999 B"
+    assert scheduler.format_size(1500) == "1.5 KB"
+    assert scheduler.format_size(2.5e12) == "2.5 TB"
+    assert scheduler.format_size(3e15) == "3000.0 TB"
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from datalight.ui import ui_spec_cache
+
+
+@pytest.fixture
+def parse_count(monkeypatch):
+    """Count the number of times a description is parsed."""
+    count = [0]
+    original_parse = ui_spec_cache._parse_yaml
+
+    def parse(contents):
+        count[0] += 1
+        return original_parse(contents)
+
+    monkeypatch.setattr(ui_spec_cache, "_parse_yaml", parse)
+    monkeypatch.setattr(ui_spec_cache, "_loaded_specs", {})
+    return count
+
+
+@pytest.fixture
+def spec_file(tmp_path):
+    path = tmp_path / "form.yaml"
+    path.write_text("title:\n  widget: LineEdit\n  label: Title\n")
+    return path
+
+
+def test_file_is_parsed_once(spec_file, parse_count):
+    first = ui_spec_cache.load_ui_spec(spec_file)
+    first["title"]["label"] = "Modified"
+    second = ui_spec_cache.load_ui_spec(spec_file)
+    assert second == {"title": {"widget": "LineEdit", "label": "Title"}}
+    assert parse_count[0] == 1
+
+
+def test_disk_cache_is_used_by_a_new_process(spec_file, parse_count):
+    ui_spec_cache.load_ui_spec(spec_file)
+    ui_spec_cache._loaded_specs.clear()
+    assert ui_spec_cache.load_ui_spec(spec_file)["title"]["label"] == "Title"
+    assert parse_count[0] == 1
+
+
+def test_touched_file_is_not_parsed_again(spec_file, parse_count):
+    ui_spec_cache.load_ui_spec(spec_file)
+    stat = spec_file.stat()
+    os.utime(spec_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    ui_spec_cache.load_ui_spec(spec_file)
+    assert parse_count[0] == 1
+
+
+def test_changed_file_is_parsed_again(spec_file, parse_count):
+    ui_spec_cache.load_ui_spec(spec_file)
+    spec_file.write_text("title:\n  widget: LineEdit\n  label: A longer title\n")
+    assert ui_spec_cache.load_ui_spec(spec_file)["title"]["label"] == "A longer title"
+    assert parse_count[0] == 2
+
+
+def test_corrupt_disk_cache_is_ignored(spec_file, parse_count):
+    ui_spec_cache.load_ui_spec(spec_file)
+    ui_spec_cache._get_cache_path(spec_file.resolve()).write_bytes(b"not a pickle")
+    ui_spec_cache._loaded_specs.clear()
+    assert ui_spec_cache.load_ui_spec(spec_file)["title"]["label"] == "Title"
+    assert parse_count[0] == 2
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from datalight import common, upload_cache, zenodo
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with upload_cache.UploadCache(tmp_path / "cache.sqlite") as cache_:
+        yield cache_
+
+
+def count_files(cache) -> int:
+    with sqlite3.connect(str(cache.cache_path)) as connection:
+        return connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+def test_checksum_of_unchanged_file(cache, tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"data")
+    cache.set_checksum(path, "abc")
+    assert cache.get_checksum(path) == "abc"
+
+
+def test_changed_file_is_not_found(cache, tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"data")
+    cache.set_checksum(path, "abc")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.get_checksum(path) is None
+    # Storing the new contents replaces the old entry.
+    cache.set_checksum(path, "def")
+    assert cache.get_checksum(path) == "def"
+    assert count_files(cache) == 1
+
+
+def test_file_changed_while_hashing_is_not_stored(cache, tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"data")
+    stat = path.stat()
+    path.write_bytes(b"new data")
+    cache.set_checksum(path, "abc", stat)
+    assert cache.get_checksum(path) is None
+
+
+def test_compact_removes_least_recently_used(tmp_path):
+    paths = []
+    for index in range(5):
+        paths.append(tmp_path / f"file{index}")
+        paths[-1].write_bytes(b"x")
+    with upload_cache.UploadCache(tmp_path / "cache.sqlite", max_entries=3) as cache:
+        for path in paths:
+            cache.set_checksum(path, path.name)
+            time.sleep(0.01)
+        cache.get_checksum(paths[0])
+        cache.compact()
+        assert count_files(cache) == 3
+        assert [cache.get_checksum(path) for path in paths] == [
+            "file0", None, None, "file3", "file4"]
+
+
+def test_compact_removes_old_files(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"data")
+    with upload_cache.UploadCache(tmp_path / "cache.sqlite", max_age_days=0) as cache:
+        cache.set_checksum(path, "abc")
+        cache.compact()
+        assert cache.get_checksum(path) is None
+
+
+def test_compact_within_limits_does_not_rewrite(cache, tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"data")
+    cache.set_checksum(path, "abc")
+    modified = cache.cache_path.stat().st_mtime_ns
+    time.sleep(0.01)
+    cache.compact()
+    assert cache.cache_path.stat().st_mtime_ns == modified
+
+
+def test_resume_does_not_hash_cached_files(zenodo_server, client, metadata, tmp_path,
+                                           monkeypatch):
+    paths = []
+    for index in range(3):
+        paths.append(tmp_path / f"file{index}.bin")
+        paths[-1].write_bytes(os.urandom(1000))
+    cache = upload_cache.open_upload_cache()
+    status = zenodo.deposit_record(list(paths), metadata, zenodo_server.deposition_url, client,
+                                   False, None, cache=cache)
+    assert status.code == 200
+
+    hashed = []
+    original_get_md5 = common.get_md5
+    monkeypatch.setattr(common, "get_md5", lambda path: hashed.append(path) or
+                        original_get_md5(path))
+    zenodo_server.requests.clear()
+    status = zenodo.deposit_record(list(paths), metadata, zenodo_server.deposition_url, client,
+                                   False, status.deposition_id, cache=cache)
+    assert status.code == 200
+    assert hashed == []
+    assert zenodo_server.requests_matching("PUT", "/bucket/") == []
+    upload_cache.close_upload_cache(cache)
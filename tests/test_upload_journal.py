@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from datalight import upload_journal, zenodo
+from datalight.upload_source import FileSource
+
+
+@pytest.fixture
+def journal(tmp_path):
+    with upload_journal.UploadJournal(tmp_path / "journal.sqlite") as upload_journal_:
+        yield upload_journal_
+
+
+def upload(zenodo_server, client, metadata, files, journal, deposition_id=None):
+    return zenodo.deposit_record(list(files), metadata, zenodo_server.deposition_url, client,
+                                 False, deposition_id, journal=journal)
+
+
+def test_resume_failed_upload(zenodo_server, client, metadata, files, journal):
+    zenodo_server.failures["/bucket/.*/file0.bin"] = [400]
+    status = upload(zenodo_server, client, metadata, files, journal)
+    assert status.code == 400
+    # The deposition is kept so the upload can be resumed.
+    deposition = zenodo_server.depositions[status.deposition_id]
+    assert sorted(deposition.files) == ["file1.bin", "file2.bin"]
+    entries = journal.get_files(status.deposition_id)
+    assert {entry.name: entry.state for entry in entries.values()} == {
+        "file0.bin": upload_journal.FILE_FAILED, "file1.bin": upload_journal.FILE_UPLOADED,
+        "file2.bin": upload_journal.FILE_UPLOADED}
+
+    zenodo_server.requests.clear()
+    status = upload(zenodo_server, client, metadata, files, journal, status.deposition_id)
+    assert status.code == 200
+    assert zenodo_server.requests_matching("PUT", "/bucket/") == [
+        f"/bucket/{deposition.id}/file0.bin"]
+    assert {name: len(data) for name, data in deposition.files.items()} == {
+        path.name: path.stat().st_size for path in files}
+    # A finished upload is removed from the journal.
+    assert journal.get_files(deposition.id) == {}
+
+
+def test_file_changed_during_upload_is_not_trusted(zenodo_server, client, metadata, files,
+                                                   journal, monkeypatch):
+    original_open = FileSource.open
+
+    def open_and_modify(source):
+        stream = original_open(source)
+        if source.name == "file1.bin":
+            stat = source.path.stat()
+            os.utime(source.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        return stream
+
+    monkeypatch.setattr(FileSource, "open", open_and_modify)
+    zenodo_server.failures["/bucket/.*/file0.bin"] = [400]
+    status = upload(zenodo_server, client, metadata, files, journal)
+    monkeypatch.undo()
+
+    entries = {entry.name: entry for entry in journal.get_files(status.deposition_id).values()}
+    assert entries["file1.bin"].state == upload_journal.FILE_UPLOADED
+    assert not entries["file1.bin"].matches(files[1])
+    assert entries["file2.bin"].matches(files[2])
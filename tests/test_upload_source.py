@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from datalight.common import DatalightException
+from datalight.upload_source import (BytesSource, FileSource, PackedSource, PackingPolicy,
+                                     UploadSource, get_upload_sources)
+
+
+def make_files(folder, files: dict):
+    paths = []
+    for name, data in files.items():
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+def test_duplicate_names_are_rejected(tmp_path):
+    paths = make_files(tmp_path, {"run1/frame001.tif": b"1", "run2/frame001.tif": b"2",
+                                  "run2/frame002.tif": b"3"})
+    with pytest.raises(DatalightException, match="frame001.tif"):
+        get_upload_sources(paths)
+
+
+def test_duplicate_names_are_rejected_before_packing(tmp_path):
+    paths = make_files(tmp_path, {f"run{run}/frame00{frame}.tif": b"x"
+                                  for run in (1, 2) for frame in (1, 2)})
+    with pytest.raises(DatalightException, match="frame001.tif"):
+        get_upload_sources(paths, packing_policy=PackingPolicy(min_files=1))
+
+
+def test_folders_with_the_same_file_names(tmp_path):
+    make_files(tmp_path, {"run1/frame001.tif": b"1", "run2/frame001.tif": b"2"})
+    sources = get_upload_sources([tmp_path / "run1", tmp_path / "run2"])
+    assert sorted(source.name for source in sources) == ["run1.tar", "run2.tar"]
+
+
+def test_source_must_implement_open(tmp_path):
+    class IncompleteSource(UploadSource):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteSource("file.bin", tmp_path / "file.bin", 0)
+
+
+def test_small_files_are_packed(tmp_path):
+    paths = make_files(tmp_path, {"small1.txt": b"1" * 10, "small2.txt": b"2" * 20,
+                                  "small3.txt": b"3" * 30, "large.bin": b"4" * 100})
+    sources = get_upload_sources(paths, packing_policy=PackingPolicy(size_threshold=100))
+    assert [source.name for source in sources] == [
+        "large.bin", "packed_files_1.tar", "packed_files_index.json"]
+    assert isinstance(sources[0], FileSource)
+    assert [member.arcname for member in sources[1].members] == [
+        "small1.txt", "small2.txt", "small3.txt"]
+
+
+def test_too_few_small_files_are_not_packed(tmp_path):
+    paths = make_files(tmp_path, {"small1.txt": b"1", "small2.txt": b"2", "large.bin": b"3" * 100})
+    sources = get_upload_sources(paths, packing_policy=PackingPolicy(size_threshold=100))
+    assert [source.name for source in sources] == ["small1.txt", "small2.txt", "large.bin"]
+
+
+def test_archives_are_split_at_max_size(tmp_path):
+    paths = make_files(tmp_path, {f"file{index}.txt": bytes(40) for index in range(5)})
+    policy = PackingPolicy(size_threshold=100, max_archive_size=100)
+    sources = get_upload_sources(paths, packing_policy=policy)
+    archives = [source for source in sources if isinstance(source, PackedSource)]
+    assert [len(packed.members) for packed in archives] == [2, 2, 1]
+    assert [packed.name for packed in archives] == [
+        "packed_files_1.tar", "packed_files_2.tar", "packed_files_3.tar"]
+
+
+def test_packing_index_locates_files(tmp_path):
+    files = {"a.txt": b"first file", "sub/b.txt": b"second" * 100,
+             f"{'long_name' * 20}.txt": b"third"}
+    paths = make_files(tmp_path, files)
+    policy = PackingPolicy(size_threshold=1000, max_archive_size=610)
+    sources = get_upload_sources(paths, packing_policy=policy)
+    index = sources[-1]
+    assert isinstance(index, BytesSource)
+    archive_data = {source.name: source.open().read() for source in sources[:-1]}
+    contents = {}
+    for entry in json.loads(index.data)["files"]:
+        data = archive_data[entry["archive"]]
+        contents[entry["name"]] = data[entry["offset"]:entry["offset"] + entry["size"]]
+    assert contents == {name.split("/")[-1]: data for name, data in files.items()}
+    assert len(archive_data) == 2
+
+
+def test_packed_name_already_used(tmp_path):
+    paths = make_files(tmp_path, {"small1.txt": b"1", "small2.txt": b"2", "small3.txt": b"3",
+                                  "packed_files_index.json": b"4" * 100})
+    with pytest.raises(DatalightException, match="packed_files_index.json"):
+        get_upload_sources(paths, packing_policy=PackingPolicy(size_threshold=100))
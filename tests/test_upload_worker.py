@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+from PyQt5 import QtCore
+
+from datalight import api
+from datalight.common import UploadStatus
+from datalight.ui import upload_worker
+from datalight.zenodo import STATUS_CANCELLED
+
+
+@pytest.fixture(scope="module", autouse=True)
+def application():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def start_uploads(monkeypatch, upload_record, count: int) -> upload_worker.UploadQueue:
+    monkeypatch.setattr(api, "upload_record", upload_record)
+    queue = upload_worker.UploadQueue(max_uploads=count)
+    for index in range(count):
+        queue.add_job(upload_worker.UploadJob(f"Record {index}", {}))
+    return queue
+
+
+def test_stop_cancels_uploads(monkeypatch):
+    def upload_record(progress_callback, cancel_event):
+        cancel_event.wait(60)
+        return UploadStatus(STATUS_CANCELLED, "Cancelled")
+
+    queue = start_uploads(monkeypatch, upload_record, 2)
+    start = time.monotonic()
+    assert queue.stop()
+    assert time.monotonic() - start < 10
+    QtCore.QCoreApplication.processEvents()
+    for job in queue.jobs:
+        assert job.state == upload_worker.JOB_CANCELLED
+        assert job.thread is None
+
+
+def test_stop_is_bounded(monkeypatch):
+    release = threading.Event()
+
+    def upload_record(progress_callback, cancel_event):
+        release.wait(60)
+        return UploadStatus(STATUS_CANCELLED, "Cancelled")
+
+    queue = start_uploads(monkeypatch, upload_record, 1)
+    start = time.monotonic()
+    assert not queue.stop(timeout=0.2)
+    assert time.monotonic() - start < 10
+    release.set()
+    assert queue.stop()
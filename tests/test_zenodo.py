@@ -0,0 +1,151 @@
+import os
+
+import pytest
+import requests
+
+from datalight import zenodo
+from datalight.upload_source import FileSource
+
+
+def test_duplicate_names_fail_before_creating_deposition(zenodo_server, client, metadata,
+                                                         tmp_path):
+    paths = []
+    for run in ("run1", "run2"):
+        (tmp_path / run).mkdir()
+        paths.append(tmp_path / run / "frame001.tif")
+        paths[-1].write_bytes(run.encode())
+    status = zenodo.deposit_record(paths, metadata, zenodo_server.deposition_url, client,
+                                   False, None)
+    assert status.code == zenodo.STATUS_INVALID_FILES
+    assert "frame001.tif" in status.message
+    assert zenodo_server.requests == []
+
+
+def make_files(folder, count: int = 4):
+    paths = []
+    for index in range(count):
+        path = folder / f"file{index}.bin"
+        path.write_bytes(os.urandom(1000))
+        paths.append(path)
+    return paths
+
+
+def test_unreadable_file_deletes_deposition(zenodo_server, client, metadata, tmp_path,
+                                            monkeypatch):
+    original_open = FileSource.open
+
+    def failing_open(source):
+        if source.name == "file2.bin":
+            raise PermissionError("Permission denied")
+        return original_open(source)
+
+    monkeypatch.setattr(FileSource, "open", failing_open)
+    status = zenodo.deposit_record(make_files(tmp_path), metadata,
+                                   zenodo_server.deposition_url, client, False, None, 2)
+    assert status.code == 500
+    assert "PermissionError" in status.message
+    assert zenodo_server.depositions == {}
+
+
+def test_connection_failure_deletes_deposition(zenodo_server, client, metadata, tmp_path,
+                                               monkeypatch):
+    original_request = client.request
+
+    def failing_request(method, url, **kwargs):
+        if method == "PUT" and url.endswith("file1.bin"):
+            raise requests.exceptions.ConnectionError("Connection refused")
+        return original_request(method, url, **kwargs)
+
+    monkeypatch.setattr(client, "request", failing_request)
+    status = zenodo.deposit_record(make_files(tmp_path), metadata,
+                                   zenodo_server.deposition_url, client, False, None)
+    assert status.code == 500
+    assert "ConnectionError" in status.message
+    assert zenodo_server.depositions == {}
+
+
+def test_resume_skips_files_with_prefixed_checksums(zenodo_server, client, metadata,
+                                                    tmp_path):
+    files = make_files(tmp_path)
+    status = zenodo.deposit_record(files, metadata, zenodo_server.deposition_url, client,
+                                   False, None)
+    assert status.code == 200
+    zenodo_server.checksum_prefix = "md5:"
+    files[0].write_bytes(os.urandom(1000))
+    zenodo_server.requests.clear()
+    status = zenodo.deposit_record(files, metadata, zenodo_server.deposition_url, client,
+                                   False, status.deposition_id)
+    assert status.code == 200
+    assert zenodo_server.requests_matching("PUT", "/bucket/") == [
+        f"/bucket/{status.deposition_id}/file0.bin"]
+
+
+def test_checksum_mismatch_deletes_deposition(zenodo_server, client, metadata, tmp_path):
+    zenodo_server.corrupt_uploads.add("file1.bin")
+    status = zenodo.deposit_record(make_files(tmp_path), metadata,
+                                   zenodo_server.deposition_url, client, False, None)
+    assert status.code == zenodo.STATUS_CHECKSUM_MISMATCH
+    assert status.error_field == "file1.bin"
+    assert zenodo_server.depositions == {}
+
+
+@pytest.fixture
+def published_record(zenodo_server):
+    record = zenodo_server.add_deposition({"unchanged.bin": b"same" * 100,
+                                           "changed.bin": b"old" * 100,
+                                           "removed.bin": b"gone"}, state="done")
+    record.metadata = {"title": "First version"}
+    return record
+
+
+def write_new_version(folder):
+    files = {"unchanged.bin": b"same" * 100, "changed.bin": b"new" * 100, "added.bin": b"added"}
+    paths = []
+    for name, data in files.items():
+        paths.append(folder / name)
+        paths[-1].write_bytes(data)
+    return paths
+
+
+def test_new_version_uploads_differences(zenodo_server, client, metadata, tmp_path,
+                                         published_record):
+    status = zenodo.deposit_new_version(write_new_version(tmp_path),
+                                        zenodo_server.deposition_url, client,
+                                        published_record.id, metadata)
+    assert status.code == 200
+    draft = zenodo_server.depositions[status.deposition_id]
+    assert draft.id != published_record.id
+    assert draft.state == "done"
+    assert draft.metadata["title"] == metadata["title"]
+    assert draft.files == {path.name: path.read_bytes() for path in tmp_path.iterdir()}
+    # Changed files are deleted before they are replaced, and unchanged files are not sent.
+    files_path = f"/api/deposit/depositions/{draft.id}/files"
+    assert sorted(zenodo_server.requests_matching("DELETE", files_path)) == [
+        f"{files_path}/changed.bin", f"{files_path}/removed.bin"]
+    assert sorted(zenodo_server.requests_matching("PUT", "/bucket/")) == [
+        f"/bucket/{draft.id}/added.bin", f"/bucket/{draft.id}/changed.bin"]
+    # The previous version is left as it was.
+    assert sorted(published_record.files) == ["changed.bin", "removed.bin", "unchanged.bin"]
+    assert published_record.metadata == {"title": "First version"}
+
+
+def test_new_version_keeps_metadata(zenodo_server, client, tmp_path, published_record):
+    status = zenodo.deposit_new_version(write_new_version(tmp_path),
+                                        zenodo_server.deposition_url, client,
+                                        published_record.id, raw_metadata=None)
+    assert status.code == 200
+    assert zenodo_server.depositions[status.deposition_id].metadata == {
+        "title": "First version"}
+    assert zenodo_server.requests_matching("PUT", r"/api/deposit/depositions/\d+$") == []
+
+
+def test_failed_new_version_deletes_draft(zenodo_server, client, metadata, tmp_path,
+                                          published_record):
+    zenodo_server.failures["/bucket/.*/added.bin"] = [400]
+    status = zenodo.deposit_new_version(write_new_version(tmp_path),
+                                        zenodo_server.deposition_url, client,
+                                        published_record.id, metadata)
+    assert status.code == 400
+    assert list(zenodo_server.depositions) == [published_record.id]
+    assert published_record.state == "done"
+    assert zenodo_server.requests_matching("POST", "/actions/publish") == []
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from datalight import upload_journal
+from datalight.retry import RetryPolicy
+from datalight.upload_source import FileSource
+from datalight.zenodo import STATUS_CANCELLED
+
+aiohttp = pytest.importorskip("aiohttp")
+from datalight import zenodo_async  # noqa: E402
+
+
+def upload(zenodo_server, metadata, files, token="token", **kwargs):
+    async def run():
+        async with zenodo_async.AsyncZenodoClient(
+                token, retry_policy=RetryPolicy(max_retries=3, backoff_factor=0),
+                requests_per_minute=60000) as client:
+            return await zenodo_async.deposit_record(list(files), metadata,
+                                                     zenodo_server.deposition_url, client,
+                                                     **kwargs)
+    return asyncio.run(run())
+
+
+def test_deposit_record(zenodo_server, metadata, files):
+    status = upload(zenodo_server, metadata, files, publish=True, upload_workers=2)
+    assert status.code == 200
+    deposition = zenodo_server.depositions[status.deposition_id]
+    assert deposition.state == "done"
+    assert deposition.files == {path.name: path.read_bytes() for path in files}
+
+
+def test_no_authorization_without_token():
+    async def get_headers(token):
+        async with zenodo_async.AsyncZenodoClient(token) as client:
+            return client.session.headers
+
+    assert "Authorization" not in asyncio.run(get_headers(""))
+    assert asyncio.run(get_headers("token"))["Authorization"] == "Bearer token"
+
+
+def test_cancelled_upload_deletes_deposition(zenodo_server, metadata, files):
+    cancel_event = threading.Event()
+    cancel_event.set()
+    status = upload(zenodo_server, metadata, files, publish=True, cancel_event=cancel_event)
+    assert status.code == STATUS_CANCELLED
+    assert zenodo_server.depositions == {}
+    assert zenodo_server.requests_matching("PUT", "/bucket/") == []
+
+
+def test_resume_failed_upload(zenodo_server, metadata, files, tmp_path):
+    zenodo_server.failures["/bucket/.*/file0.bin"] = [400]
+    with upload_journal.UploadJournal(tmp_path / "journal.sqlite") as journal:
+        status = upload(zenodo_server, metadata, files, publish=False, journal=journal)
+        assert status.code == 400
+        deposition = zenodo_server.depositions[status.deposition_id]
+        assert sorted(deposition.files) == ["file1.bin", "file2.bin"]
+
+        zenodo_server.requests.clear()
+        status = upload(zenodo_server, metadata, files, publish=False,
+                        deposition_ID=deposition.id, journal=journal)
+        assert status.code == 200
+        assert zenodo_server.requests_matching("PUT", "/bucket/") == [
+            f"/bucket/{deposition.id}/file0.bin"]
+        assert journal.get_files(deposition.id) == {}
+
+
+def test_cancel_during_transfer(zenodo_server, metadata, tmp_path):
+    path = tmp_path / "large.bin"
+    path.write_bytes(os.urandom(4 * zenodo_async.CHUNK_SIZE))
+    cancel_event = threading.Event()
+
+    def cancel_after_first_chunk(upload_progress):
+        if upload_progress.bytes_sent:
+            cancel_event.set()
+
+    status = upload(zenodo_server, metadata, [path], publish=True, cancel_event=cancel_event,
+                    progress_callback=cancel_after_first_chunk)
+    assert status.code == STATUS_CANCELLED
+    assert zenodo_server.depositions == {}
+
+
+def test_cancel_stops_retry_wait(zenodo_server, monkeypatch):
+    zenodo_server.failures["/api/deposit/depositions"] = [503] * 5
+    cancel_event = threading.Event()
+    retry_policy = RetryPolicy(max_retries=5)
+    monkeypatch.setattr(retry_policy, "get_delay", lambda attempt, headers=None: 60)
+
+    async def run():
+        async with zenodo_async.AsyncZenodoClient("token", retry_policy=retry_policy,
+                                                  cancel_event=cancel_event) as client:
+            asyncio.get_running_loop().call_later(0.2, cancel_event.set)
+            return await client.request("GET", zenodo_server.deposition_url)
+
+    assert asyncio.run(asyncio.wait_for(run(), 10)).status_code == 503
+    assert len(zenodo_server.requests) == 1
+
+
+def test_unreadable_file_deletes_deposition(zenodo_server, metadata, files, monkeypatch):
+    original_open = FileSource.open
+
+    def failing_open(source):
+        if source.name == "file1.bin":
+            raise PermissionError("Permission denied")
+        return original_open(source)
+
+    monkeypatch.setattr(FileSource, "open", failing_open)
+    status = upload(zenodo_server, metadata, files, publish=True, upload_workers=2)
+    assert status.code == 500
+    assert "PermissionError" in status.message
+    assert zenodo_server.depositions == {}
+
+
+def test_connection_failure_deletes_deposition(zenodo_server, metadata, files, monkeypatch):
+    original_request = zenodo_async.AsyncZenodoClient.request
+
+    async def failing_request(client, method, url, **kwargs):
+        if method == "PUT" and url.endswith("file0.bin"):
+            raise aiohttp.ClientConnectionError("Connection refused")
+        return await original_request(client, method, url, **kwargs)
+
+    monkeypatch.setattr(zenodo_async.AsyncZenodoClient, "request", failing_request)
+    status = upload(zenodo_server, metadata, files, publish=True)
+    assert status.code == 500
+    assert "ClientConnectionError" in status.message
+    assert zenodo_server.depositions == {}
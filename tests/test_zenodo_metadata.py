@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import shutil
+import urllib.request
+
+import pytest
+
+from datalight import zenodo, zenodo_metadata
+from datalight.zenodo_metadata import _OpenLicenseIndex
+
+LICENSES = {"CC-BY-4.0": {"id": "CC-BY-4.0"}, "MIT": {"id": "MIT"}}
+
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    """Record calls to start a refresh rather than downloading the license list."""
+    calls = []
+    monkeypatch.setattr(_OpenLicenseIndex, "start_refresh", lambda index: calls.append(index))
+    return calls
+
+
+def serve_licenses(monkeypatch, data: bytes):
+    monkeypatch.setattr(urllib.request, "urlopen",
+                        lambda url, timeout: io.BytesIO(data))
+
+
+def test_cached_licenses_are_used(tmp_path, refreshes):
+    cache_path = tmp_path / "licenses.json"
+    cache_path.write_text(json.dumps(LICENSES))
+    index = _OpenLicenseIndex(cache_path)
+    assert index.license_ids == ["CC-BY-4.0", "MIT"]
+    assert index.find("CC-BY") == "CC-BY-4.0"
+    assert refreshes == []
+
+
+@pytest.mark.parametrize("contents", ['{"CC-BY-4.0": {"id"', "[]", '{"MIT": 1}', ""])
+def test_unreadable_cache_falls_back_to_bundled_list(tmp_path, refreshes, contents):
+    cache_path = tmp_path / "licenses.json"
+    cache_path.write_text(contents)
+    index = _OpenLicenseIndex(cache_path)
+    assert "CC-BY-4.0" in index.license_ids
+    assert len(index.license_ids) > 2
+    assert refreshes == [index]
+
+
+def test_refresh_writes_valid_list(tmp_path, refreshes, monkeypatch):
+    index = _OpenLicenseIndex(tmp_path / "licenses.json")
+    serve_licenses(monkeypatch, json.dumps(LICENSES).encode())
+    index._refresh()
+    assert index.license_ids == ["CC-BY-4.0", "MIT"]
+    assert json.loads(index.cache_path.read_text()) == LICENSES
+    assert list(tmp_path.iterdir()) == [index.cache_path]
+
+
+@pytest.mark.parametrize("data", [b"<html>Service unavailable</html>", b'{"error": "busy"}'])
+def test_refresh_ignores_invalid_list(tmp_path, refreshes, monkeypatch, data):
+    index = _OpenLicenseIndex(tmp_path / "licenses.json")
+    license_ids = index.license_ids
+    serve_licenses(monkeypatch, data)
+    index._refresh()
+    assert index.license_ids == license_ids
+    assert not index.cache_path.exists()
+
+
+def test_missing_bundled_list_is_an_error(tmp_path, refreshes, monkeypatch):
+    monkeypatch.setattr(zenodo_metadata, "LOCAL_LICENSE_FILE", tmp_path / "missing.json")
+    with pytest.raises(zenodo_metadata.ZenodoMetadataException):
+        _OpenLicenseIndex(tmp_path / "licenses.json")
+
+
+@pytest.fixture
+def schema_file(tmp_path, monkeypatch):
+    """Validate against a copy of the Zenodo schema, with an empty validator cache, and count
+    how many times the schema is read."""
+    schema_path = tmp_path / "schema.json5"
+    shutil.copy(zenodo_metadata.SCHEMA_FILE, schema_path)
+    monkeypatch.setattr(zenodo_metadata, "SCHEMA_FILE", schema_path)
+    monkeypatch.setattr(zenodo_metadata, "_validator_cache", {"mtime": None, "validator": None})
+    reads = []
+    read_schema = zenodo_metadata.read_schema_from_file
+    monkeypatch.setattr(zenodo_metadata, "read_schema_from_file",
+                        lambda: reads.append(schema_path) or read_schema())
+    return schema_path, reads
+
+
+def test_validator_is_cached(schema_file, refreshes, metadata):
+    schema_path, reads = schema_file
+    validator = zenodo_metadata.get_validator()
+    zenodo_metadata.validate_metadata(metadata)
+    assert zenodo_metadata.get_validator() is validator
+    assert len(reads) == 1
+
+
+def test_validator_is_rebuilt_when_schema_changes(schema_file, refreshes, metadata):
+    schema_path, reads = schema_file
+    zenodo_metadata.validate_metadata(metadata)
+
+    schema = json.loads(schema_path.read_text())
+    schema["required"].append("keywords")
+    schema_path.write_text(json.dumps(schema))
+    # Make sure the modification time changes even on file systems with coarse timestamps.
+    modified_time = schema_path.stat().st_mtime + 10
+    os.utime(schema_path, (modified_time, modified_time))
+
+    with pytest.raises(zenodo_metadata.ZenodoMetadataException, match="keywords"):
+        zenodo_metadata.validate_metadata(metadata)
+    assert len(reads) == 2
+
+
+def test_validate_many(schema_file, refreshes, metadata):
+    schema_path, reads = schema_file
+    closed_metadata = dict(metadata, access_right="closed", license="proprietary")
+    untitled_metadata = {key: value for key, value in metadata.items() if key != "title"}
+    results = zenodo.validate_many([metadata, untitled_metadata, closed_metadata])
+    assert [status.code for status, _ in results] == [200, 401, 200]
+    assert "title" in results[1][0].message
+    assert results[1][1] == {}
+    assert results[0][1]["metadata"]["title"] == metadata["title"]
+    assert results[2][1]["metadata"]["access_right"] == "closed"
+    assert len(reads) == 1